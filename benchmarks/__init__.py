@@ -0,0 +1,6 @@
+# Offline benchmarks for the fbcrawl spiders.
+#
+# Saved mbasic pages live in benchmarks/fixtures and are replayed through the
+# spider callbacks as HtmlResponse objects, no network or login involved:
+#
+#     python -m benchmarks.bench_parse
@@ -0,0 +1,130 @@
+'''
+Memory benchmark for the state carried in request meta between callbacks.
+
+The listing page of the fb spider yields one request per post, and every
+post page may yield a reactions request; until they are downloaded these
+requests sit in the scheduler with their meta. The benchmark replays N
+listing pages (and their post pages), drops the responses like scrapy does
+once a callback is over, and measures how much memory the pending requests
+keep alive: the Python heap with tracemalloc and the growth of the RSS,
+which also counts the libxml2 trees that tracemalloc cannot see. Every
+strategy runs in its own process:
+
+    values  -- plain extracted values, what the spider carries now
+    loaders -- an ItemLoader per post, as the spider used to do: the loader
+               references its selector and so the DOM of the whole page
+
+    python -m benchmarks.bench_memory            # 50 listing pages
+    python -m benchmarks.bench_memory -n 200
+'''
+import gc
+import sys
+import json
+import argparse
+import subprocess
+import tracemalloc
+
+from scrapy import Request
+
+from fbcrawl.items import FbcrawlItem
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+from fbcrawl.xpaths import XPATHS, XPathItemLoader as ItemLoader
+from fbcrawl.extensions import get_rss
+from benchmarks.replay import make_spider, make_response, replay, BASE_URL
+from benchmarks.bench_parse import POST_URL
+
+# =============================================================================
+# what a callback leaves in the scheduler, one function per stage and strategy
+# =============================================================================
+def listing_values(spider, response):
+    #the "more" page request is the same for both strategies, only posts count
+    return [r for r in replay(spider.parse_page, response)[1] if 'item' in r.meta]
+
+def listing_loaders(spider, response):
+    requests = []
+    for post in XPATHS['page.posts'].select(response):
+        new = ItemLoader(item=FbcrawlItem(), selector=post)
+        new.add_xpath('comments', 'page.post_comments')
+        new.add_xpath('url', 'page.post_link')
+        url = response.urljoin(XPATHS['page.post_link'].extract(post)[0])
+        requests.append(Request(url, meta={'item': new}))
+    return requests
+
+def post_values(spider, response):
+    return replay(spider.parse_post, response)[1]
+
+def post_loaders(spider, response):
+    new = ItemLoader(item=FbcrawlItem(), response=response, parent=response.meta['item'])
+    for field in ('source', 'shared_from', 'date', 'text', 'reactions'):
+        new.add_xpath(field, 'post.' + field)
+    url = response.urljoin(XPATHS['post.reactions_link'].extract(response)[0])
+    return [Request(url, meta={'item': new})]
+
+STRATEGIES = {
+    'values': (listing_values, post_values),
+    'loaders': (listing_loaders, post_loaders),
+}
+
+def measure(strategy, pages):
+    '''
+    Bytes kept alive by the pending requests after `pages` listing pages
+    (listing stage) and after all their post pages (post stage), as
+    (python heap, rss growth, requests)
+    '''
+    listing, post = STRATEGIES[strategy]
+    spider = make_spider(FacebookSpider)
+    #warm-up: imports, compiled xpaths and caches are not part of the figures
+    post(spider, make_response('fb_post.html', POST_URL, listing(spider, make_response('fb_page.html'))[0].meta))
+    results = {}
+    gc.collect()
+    rss = get_rss()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    pending = []
+    for i in range(pages):
+        response = make_response('fb_page.html', '{}/testpage?p={}'.format(BASE_URL, i), {'flag': spider.k})
+        pending.extend(listing(spider, response))
+        del response
+    gc.collect()
+    results['listing'] = (tracemalloc.get_traced_memory()[0] - base, get_rss() - rss, len(pending))
+
+    reactions = []
+    for request in pending:
+        response = make_response('fb_post.html', POST_URL, request.meta)
+        reactions.extend(post(spider, response))
+        del response
+    del pending, request
+    gc.collect()
+    results['post'] = (tracemalloc.get_traced_memory()[0] - base, get_rss() - rss, len(reactions))
+
+    tracemalloc.stop()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memory kept alive by the requests waiting in the scheduler')
+    parser.add_argument('-n', '--pages', type=int, default=50, help='listing pages to replay')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.strategy:
+        #child process, one strategy
+        print(json.dumps(measure(args.strategy, args.pages)))
+        return 0
+
+    results = {}
+    for name in STRATEGIES:
+        out = subprocess.check_output([sys.executable, '-W', 'ignore', '-m', 'benchmarks.bench_memory',
+                                       '-n', str(args.pages), '--strategy', name])
+        results[name] = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    print('{:<10}{:>10}{:>14}{:>14}{:>14}{:>14}'.format(
+        'stage', 'requests', 'values heap', 'loaders heap', 'values RSS', 'loaders RSS'))
+    for stage in ('listing', 'post'):
+        v_heap, v_rss, n = results['values'][stage]
+        l_heap, l_rss, _ = results['loaders'][stage]
+        print('{:<10}{:>10}{:>11.1f} KB{:>11.1f} KB{:>11.1f} MB{:>11.1f} MB'.format(
+            stage, n, v_heap / 1024.0, l_heap / 1024.0, v_rss / 1048576.0, l_rss / 1048576.0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
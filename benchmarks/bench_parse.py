@@ -0,0 +1,196 @@
+'''
+Parse-throughput benchmark for the spider callbacks.
+
+Every scenario replays a saved page through one callback and reports
+items/sec, requests/sec and latency percentiles. Results can be stored as
+baselines and compared on the next run to catch slowdowns when the selectors
+change. The output of every scenario (items and requests) is also checked
+against the golden output stored in golden.json, so that a faster callback
+that extracts something different is caught too:
+
+    python -m benchmarks.bench_parse                  # compare with baselines
+    python -m benchmarks.bench_parse --save           # store new baselines
+    python -m benchmarks.bench_parse --save-golden    # store the current output
+    python -m benchmarks.bench_parse -k comments -n 50
+'''
+import os
+import sys
+import json
+import time
+import argparse
+
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+from fbcrawl.spiders.comments import CommentsSpider
+from fbcrawl.spiders.events import EventsSpider
+from benchmarks.replay import make_spider, make_response, replay, snapshot, BASE_URL
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden.json')
+
+POST_URL = BASE_URL + '/story.php?story_fbid=1000000&id=123456'
+REACTIONS_URL = BASE_URL + '/ufi/reaction/profile/browser/?ft_ent_identifier=1000000'
+REPLIES_URL = BASE_URL + '/comment/replies/?ctoken=1000000_2100000'
+EVENT_URL = BASE_URL + '/events/4000000'
+
+# =============================================================================
+# meta builders, the meta a callback receives is what the previous one yields
+# =============================================================================
+def page_meta(spider):
+    return {'flag': spider.k}
+
+def first_page_meta(spider):
+    return {}
+
+def post_meta(spider):
+    response = make_response('fb_page.html', BASE_URL + '/testpage', page_meta(spider))
+    return replay(spider.parse_page, response)[1][0].meta
+
+def reactions_meta(spider):
+    response = make_response('fb_post.html', POST_URL, post_meta(spider))
+    return replay(spider.parse_post, response)[1][0].meta
+
+def comments_meta(spider):
+    return {'page': 0}
+
+def reply_meta(spider):
+    return {'page': 0, 'thread': 3, 'reply_page': 0, 'flag': 'init', 'reply_to': ['Anna Rossi'],
+            'comment_id': ['2100000']}
+
+def events_page_meta(spider):
+    return {'index': 1}
+
+def event_meta(spider):
+    response = make_response('events_page.html', BASE_URL + '/testpage?v=events', {'index': 1})
+    return replay(spider.parse_page, response)[1][0].meta
+
+#name: (spider class, spider kwargs, callback, fixture, url, meta builder)
+SCENARIOS = [
+    ('fb.parse_page', FacebookSpider, {}, 'parse_page', 'fb_page.html', BASE_URL + '/testpage', page_meta),
+    ('fb.parse_page_years', FacebookSpider, {'year': '2010'}, 'parse_page', 'fb_page_years.html', BASE_URL + '/testpage', page_meta),
+    ('fb.parse_page_parallel', FacebookSpider, {'year': '2010', 'parallel_years': 'true'}, 'parse_page', 'fb_page_years.html', BASE_URL + '/testpage', first_page_meta),
+    ('fb.parse_post', FacebookSpider, {}, 'parse_post', 'fb_post.html', POST_URL, post_meta),
+    ('fb.parse_reactions', FacebookSpider, {}, 'parse_reactions', 'fb_reactions.html', REACTIONS_URL, reactions_meta),
+    ('comments.parse_page', CommentsSpider, {}, 'parse_page', 'comments_page.html', POST_URL, comments_meta),
+    ('comments.parse_reply', CommentsSpider, {}, 'parse_reply', 'comments_reply.html', REPLIES_URL, reply_meta),
+    ('events.parse_page', EventsSpider, {}, 'parse_page', 'events_page.html', BASE_URL + '/testpage?v=events', events_page_meta),
+    ('events.parse_post', EventsSpider, {}, 'parse_post', 'events_post.html', EVENT_URL, event_meta),
+]
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def scenario_output(spidercls, kwargs, callback, fixture, url, build_meta):
+    '''
+    Snapshot of what one replay of the fixture produces, on a fresh spider
+    '''
+    spider = make_spider(spidercls, **kwargs)
+    response = make_response(fixture, url, build_meta(spider))
+    return snapshot(*replay(getattr(spider, callback), response))
+
+def run_scenario(spidercls, kwargs, callback, fixture, url, build_meta, iterations):
+    '''
+    Replay the fixture `iterations` times, returning the measured figures.
+    Spiders keep crawl progress in their attributes, so every run gets a fresh
+    spider; only the callback itself is timed.
+    '''
+    def setup():
+        spider = make_spider(spidercls, **kwargs)
+        response = make_response(fixture, url, build_meta(spider))
+        return getattr(spider, callback), response
+
+    #warm-up run, also checks that the callback still produces something
+    items, requests = replay(*setup())
+    if not items and not requests:
+        raise RuntimeError('callback produced no output, selectors broken?')
+
+    latencies = []
+    n_items = n_requests = 0
+    for _ in range(iterations):
+        cb, response = setup()
+        start = time.perf_counter()
+        items, requests = replay(cb, response)
+        latencies.append(time.perf_counter() - start)
+        n_items += len(items)
+        n_requests += len(requests)
+    total = sum(latencies)
+    return {
+        'items_per_sec': round(n_items / total, 1),
+        'requests_per_sec': round(n_requests / total, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_json(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay saved pages through the spider callbacks')
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('-k', '--filter', default='', help='run only scenarios containing this string')
+    parser.add_argument('--save', action='store_true', help='store results as the new baselines')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown over the baseline (default 0.25 = 25%%)')
+    parser.add_argument('--baselines', default=BASELINES)
+    parser.add_argument('--save-golden', action='store_true', help='store the outputs as the new golden ones')
+    parser.add_argument('--golden', default=GOLDEN)
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines(args.baselines)
+    golden = load_baselines(args.golden)
+    results = {}
+    outputs = {}
+    regressions = []
+    changed = []
+    print('{:<24}{:>10}{:>10}{:>10}{:>10}{:>10}  {}'.format(
+        'scenario', 'items/s', 'reqs/s', 'p50 ms', 'p90 ms', 'p99 ms', 'vs baseline'))
+    for name, spidercls, kwargs, callback, fixture, url, build_meta in SCENARIOS:
+        if args.filter not in name:
+            continue
+        outputs[name] = scenario_output(spidercls, kwargs, callback, fixture, url, build_meta)
+        if name in golden and outputs[name] != golden[name]:
+            changed.append(name)
+        res = run_scenario(spidercls, kwargs, callback, fixture, url, build_meta, args.iterations)
+        results[name] = res
+        delta = ''
+        if name in baselines:
+            ratio = res['p50_ms'] / baselines[name]['p50_ms']
+            delta = '{:+.1f}%'.format((ratio - 1) * 100)
+            if ratio > 1 + args.tolerance:
+                regressions.append(name)
+                delta += ' SLOWER'
+        print('{:<24}{:>10}{:>10}{:>10}{:>10}{:>10}  {}'.format(
+            name, res['items_per_sec'], res['requests_per_sec'],
+            res['p50_ms'], res['p90_ms'], res['p99_ms'], delta))
+
+    status = 0
+    if args.save_golden:
+        golden.update(outputs)
+        save_json(golden, args.golden)
+        print('Golden outputs saved to {}'.format(args.golden))
+    elif changed:
+        print('Output differs from the golden one: {}'.format(', '.join(changed)))
+        status = 1
+    if args.save:
+        baselines.update(results)
+        save_json(baselines, args.baselines)
+        print('Baselines saved to {}'.format(args.baselines))
+    elif regressions:
+        print('Regressions over {:.0f}%: {}'.format(args.tolerance * 100, ', '.join(regressions)))
+        status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
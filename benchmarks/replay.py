@@ -0,0 +1,82 @@
+import os
+import logging
+from datetime import date
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASE_URL = 'https://mbasic.facebook.com'
+
+#spiders need credentials and a target to be instantiated, nothing is sent
+SPIDER_KWARGS = {'email': 'bench@example.com', 'password': 'bench',
+                 'page': 'testpage', 'lang': 'en'}
+
+_cache = {}
+
+def load_fixture(name):
+    '''
+    Return the raw bytes of a saved page, read from disk only once
+    '''
+    if name not in _cache:
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            _cache[name] = f.read()
+    return _cache[name]
+
+def make_spider(spidercls, **kwargs):
+    '''
+    Instantiate a spider with dummy credentials, keeping the logs quiet
+    '''
+    logging.getLogger('scrapy').setLevel(logging.WARNING)
+    args = dict(SPIDER_KWARGS)
+    args.update(kwargs)
+    spider = spidercls(**args)
+    spider.logger.logger.setLevel(logging.WARNING)
+    return spider
+
+def make_response(fixture, url=BASE_URL, meta=None):
+    '''
+    Build the HtmlResponse the downloader would have handed to the callback
+    '''
+    request = Request(url, meta=meta or {})
+    return HtmlResponse(url=url, body=load_fixture(fixture),
+                        encoding='utf-8', request=request)
+
+def replay(callback, response):
+    '''
+    Run a callback over a response and split its output in items and requests
+    '''
+    items, requests = [], []
+    for out in callback(response) or []:
+        if isinstance(out, Request):
+            requests.append(out)
+        else:
+            items.append(out)
+    return items, requests
+
+def plain(value):
+    '''
+    JSON-able copy of an item field or of request meta, dates as ISO strings
+    '''
+    if isinstance(value, dict):
+        return {str(k): plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, date):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return type(value).__name__
+
+def snapshot(items, requests):
+    '''
+    What a callback produced, in the form stored as golden output: the fields
+    of the items and the url, callback, priority and meta of the requests
+    '''
+    return {
+        'items': [plain(dict(item)) for item in items],
+        'requests': [{'url': request.url,
+                      'callback': getattr(request.callback, '__name__', None),
+                      'priority': request.priority,
+                      'meta': plain(request.meta)} for request in requests],
+    }
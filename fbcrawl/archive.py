@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+# Raw page archive, to extract the items again without crawling.
+#
+# PageArchive records every response handed to a spider callback into
+# segment files under ARCHIVE_DIR. A record is a gzip member of its own: a
+# JSON header line (urls, status, headers, callback, the meta of the request
+# and the interface lang) followed by the body, so a segment can be read
+# with zcat and any record can be decompressed alone from its offset. A
+# SQLite index (ARCHIVE_DIR/index.db) maps every record to its run, spider,
+# canonical url, callback, segment and offset. Segments are rotated every
+# ARCHIVE_SEGMENT_BYTES compressed bytes.
+#
+# The login flow is never archived and Set-Cookie headers are dropped.
+# fbcrawl/reextract.py runs the callbacks of a spider over an archived run.
+
+import os
+import json
+import gzip
+import sqlite3
+import logging
+from time import time, strftime
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+from fbcrawl.httpcache import canonical_url, page_kind
+
+logger = logging.getLogger(__name__)
+
+#meta keys set by scrapy and its middlewares, not by the spiders
+SCRAPY_META = {'depth', 'proxy', 'cookiejar', 'bindaddress', 'max_retry_times',
+               'referrer_policy', 'is_start_request', 'throttle_retries'}
+SCRAPY_META_PREFIXES = ('_', 'download_', 'redirect_', 'retry_', 'dont_', 'handle_httpstatus', 'ftp_')
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS runs ('
+          'run TEXT PRIMARY KEY, spider TEXT, targets TEXT, started REAL, finished REAL, pages INTEGER)',
+          'CREATE TABLE IF NOT EXISTS pages ('
+          'id INTEGER PRIMARY KEY AUTOINCREMENT, run TEXT, key TEXT, url TEXT, status INTEGER, '
+          'callback TEXT, segment TEXT, offset INTEGER, length INTEGER, stored REAL)',
+          'CREATE INDEX IF NOT EXISTS pages_key ON pages (run, key)')
+
+
+def spider_meta(meta):
+    '''
+    The part of the request meta written by the spider, as long as it is
+    JSON-serializable (the spiders carry plain extracted values)
+    '''
+    kept = {}
+    for key, value in meta.items():
+        if key in SCRAPY_META or key.startswith(SCRAPY_META_PREFIXES):
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        kept[key] = value
+    return kept
+
+def callback_name(request):
+    callback = request.callback
+    return getattr(callback, '__name__', callback) or 'parse'
+
+
+class ArchiveWriter(object):
+    '''
+    Append-only writer of one run, see the module docstring
+    '''
+    def __init__(self, path, spider, targets=(), segment_bytes=256*1024*1024, level=6, commit_every=100):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.level = level
+        self.commit_every = commit_every
+        self.run = '{}-{}'.format(spider, strftime('%Y%m%dT%H%M%S'))
+        self.pages = 0
+        self.uncommitted = 0
+        self.segment = None
+        self.file = None
+        self.number = 0
+        os.makedirs(path, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(path, 'index.db'))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.execute('INSERT OR REPLACE INTO runs (run, spider, targets, started, pages) '
+                        'VALUES (?, ?, ?, ?, 0)', (self.run, spider, json.dumps(list(targets)), time()))
+        self.db.commit()
+
+    def open_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.segment = '{}-{:05d}.pages.gz'.format(self.run, self.number)
+        self.number += 1
+        self.file = open(os.path.join(self.path, self.segment), 'ab')
+
+    def write(self, response, request, lang):
+        if self.file is None or self.file.tell() >= self.segment_bytes:
+            self.open_segment()
+        header = {'url': response.url,
+                  'status': response.status,
+                  'headers': [(k.decode('latin1'), [v.decode('latin1') for v in vs])
+                              for k, vs in response.headers.items() if k.lower() != b'set-cookie'],
+                  'request_url': request.url,
+                  'method': request.method,
+                  'callback': callback_name(request),
+                  'meta': spider_meta(request.meta),
+                  'lang': lang,
+                  'time': time()}
+        record = gzip.compress(json.dumps(header).encode('utf-8') + b'\n' + response.body, self.level)
+        offset = self.file.tell()
+        self.file.write(record)
+        self.db.execute('INSERT INTO pages (run, key, url, status, callback, segment, offset, length, stored) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (self.run, canonical_url(request.url), response.url, response.status,
+                         header['callback'], self.segment, offset, len(record), header['time']))
+        self.pages += 1
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        #segment data first, an index row never points past the end of a file
+        if self.file is not None:
+            self.file.flush()
+        self.db.execute('UPDATE runs SET pages = ? WHERE run = ?', (self.pages, self.run))
+        self.db.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        if self.file is not None:
+            self.file.close()
+        self.db.execute('UPDATE runs SET finished = ? WHERE run = ?', (time(), self.run))
+        self.db.commit()
+        self.db.close()
+
+
+class ArchiveReader(object):
+    '''
+    Random access to the records of an archive directory
+    '''
+    def __init__(self, path):
+        self.path = path
+        index = os.path.join(path, 'index.db')
+        if not os.path.exists(index):
+            raise IOError('No archive index in "{}"'.format(path))
+        self.db = sqlite3.connect('file:{}?mode=ro'.format(index), uri=True)
+        self.files = {}
+
+    def runs(self, spider=None):
+        '''
+        (run, spider, pages) of the archived runs, the oldest first
+        '''
+        query = 'SELECT run, spider, pages FROM runs'
+        if spider is not None:
+            return self.db.execute(query + ' WHERE spider = ? ORDER BY started', (spider,)).fetchall()
+        return self.db.execute(query + ' ORDER BY started').fetchall()
+
+    def spider(self, run):
+        '''
+        (spider, targets) of a run, None if there is no such run
+        '''
+        row = self.db.execute('SELECT spider, targets FROM runs WHERE run = ?', (run,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def records(self, run, callback):
+        '''
+        Ids of the records of a run answered by callback, in download order
+        '''
+        return [row[0] for row in self.db.execute('SELECT id FROM pages WHERE run = ? AND callback = ? '
+                                                  'ORDER BY id', (run, callback))]
+
+    def lookup(self, run, url):
+        '''
+        Id of the last record of the run for url, None if it was not downloaded
+        '''
+        row = self.db.execute('SELECT id FROM pages WHERE run = ? AND key = ? ORDER BY id DESC LIMIT 1',
+                              (run, canonical_url(url))).fetchone()
+        return row[0] if row else None
+
+    def read(self, record):
+        '''
+        (header, body) of a record
+        '''
+        segment, offset, length = self.db.execute('SELECT segment, offset, length FROM pages WHERE id = ?',
+                                                  (record,)).fetchone()
+        if segment not in self.files:
+            self.files[segment] = open(os.path.join(self.path, segment), 'rb')
+        f = self.files[segment]
+        f.seek(offset)
+        #the index is committed after the segment is flushed, but not synced:
+        #after a system crash the last records may be cut short
+        try:
+            header, body = gzip.decompress(f.read(length)).split(b'\n', 1)
+        except (EOFError, gzip.BadGzipFile):
+            raise IOError('Record {} truncated in {}'.format(record, segment))
+        return json.loads(header.decode('utf-8')), body
+
+    def response(self, header, body, request):
+        '''
+        The response the downloader handed to the callback, for request
+        '''
+        headers = Headers({k: v for k, v in header['headers']}, encoding='latin1')
+        respcls = responsetypes.from_args(headers=headers, url=header['url'], body=body)
+        return respcls(url=header['url'], status=header['status'], headers=headers,
+                       body=body, request=request)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.db.close()
+
+
+class PageArchive(object):
+    '''
+    Scrapy extension, enabled by ARCHIVE_DIR
+    '''
+    def __init__(self, stats, path, segment_bytes, level):
+        self.stats = stats
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.level = level
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.get('ARCHIVE_DIR'):
+            raise NotConfigured
+        ext = cls(crawler.stats, settings['ARCHIVE_DIR'],
+                  settings.getint('ARCHIVE_SEGMENT_BYTES', 256*1024*1024),
+                  settings.getint('ARCHIVE_LEVEL', 6))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        self.writer = ArchiveWriter(self.path, spider.name, getattr(spider, 'pages', ()),
+                                    self.segment_bytes, self.level)
+        logger.info('Archiving the downloaded pages in "{}" as run {}'.format(self.path, self.writer.run))
+
+    def spider_closed(self, spider, reason):
+        logger.info('Archived {} pages of run {}'.format(self.writer.pages, self.writer.run))
+        self.stats.set_value('archive/pages', self.writer.pages, spider=spider)
+        self.writer.close()
+
+    def response_received(self, response, request, spider):
+        if request.method != 'GET' or page_kind(canonical_url(request.url)) == 'login':
+            return
+        self.writer.write(response, request, getattr(spider, 'lang', None))
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# Counters shown by mbasic.facebook.com (reactions, comments, shares).
+#
+# Every language writes numbers its own way: "19,298,873" and "1.2K" in
+# English, "19.298.873" and "1,2 mila" in Italian, "19 298 873" and "1,2 k"
+# in French. Reactions of posts liked by friends are shown as names plus
+# the others ("Mark and 254 others", "Pamela, Luigi e altri 4"), they count
+# the names too, and a list of names only ("Mark and Bob", "Pamela, Luigi")
+# is the number of names. The patterns of every language are compiled once
+# at import and parsing is memoized on (raw string, lang). Anything else (a
+# "Like" or "Comment" label, a single word, a decimal without a suffix) is
+# not a count: None.
+#
+#     parse_count('Pamela, Luigi e altri 1,2 mila', 'it')      -> 1202
+#     parse_count('Mark and Bob', 'en')                         -> 2
+#     parse_counts(df['reactions'], 'en')                       -> [int or None, ...]
+
+import re
+from functools import lru_cache
+
+LOCALES = {
+    'it': {
+        'thousands': '.',
+        'decimal': ',',
+        'suffixes': {'k': 10**3, 'mila': 10**3, 'mln': 10**6, 'mi': 10**6, 'mld': 10**9},
+        'others': r'\s+e\s+altr[ei]\s+{num}(?:\s+persone)?',
+        'and': ['e'],
+    },
+    'en': {
+        'thousands': ',',
+        'decimal': '.',
+        'suffixes': {'k': 10**3, 'm': 10**6, 'b': 10**9},
+        'others': r'\s+and\s+{num}\s+others?',
+        'and': ['and'],
+    },
+    'es': {
+        'thousands': '. ',
+        'decimal': ',',
+        'suffixes': {'k': 10**3, 'mil': 10**3, 'm': 10**6, 'mill': 10**6},
+        'others': r'\s+y\s+{num}\s+(?:personas\s+)?más',
+        'and': ['y'],
+    },
+    'fr': {
+        'thousands': ' \u00a0\u202f.',
+        'decimal': ',',
+        'suffixes': {'k': 10**3, 'm': 10**6, 'md': 10**9},
+        'others': r'\s+et\s+{num}\s+autres?(?:\s+personnes?)?',
+        'and': ['et'],
+    },
+    'pt': {
+        'thousands': '. ',
+        'decimal': ',',
+        'suffixes': {'k': 10**3, 'mil': 10**3, 'mi': 10**6, 'bi': 10**9},
+        'others': r'\s+e\s+(?:outras\s+)?{num}(?:\s+pessoas)?',
+        'and': ['e'],
+    },
+}
+
+#no lang: plain integers, whatever the separators (19.298.873, 19,298,873)
+_PLAIN = re.compile(r'^\s*\d[\d.,\s]*$')
+_DIGITS = re.compile(r'\D')
+_DIGIT = re.compile(r'\d')
+
+
+class CountGrammar(object):
+    '''
+    Compiled patterns of one language, built once from LOCALES
+    '''
+    def __init__(self, table):
+        sep = re.escape(table['thousands'])
+        suffixes = sorted(table['suffixes'], key=len, reverse=True)
+        num = (r'(?P<int>\d{{1,3}}(?:[{sep}]\d{{3}})+|\d+)'
+               r'(?:{dec}(?P<frac>\d+))?'
+               r'(?:\s*(?P<suffix>{suffixes})(?![^\W\d_]))?').format(
+                   sep=sep, dec=re.escape(table['decimal']), suffixes='|'.join(map(re.escape, suffixes)))
+        self.suffixes = table['suffixes']
+        self.number = re.compile(r'^\s*' + num + r'\s*$', re.IGNORECASE)
+        self.first = re.compile(r'(?<![\d.,])' + num, re.IGNORECASE)
+        self.others = re.compile(r'^\s*(?P<names>.+?)' + table['others'].format(num=num) + r'\s*$',
+                                 re.IGNORECASE)
+        self.names = re.compile(r'\s*,\s*|\s+(?:{})\s+'.format('|'.join(table['and'])), re.IGNORECASE)
+        self.separators = re.compile('[{}]'.format(sep))
+
+    def value(self, match):
+        number = int(self.separators.sub('', match.group('int')))
+        frac = match.group('frac') or ''
+        suffix = match.group('suffix')
+        if suffix is None:
+            #counts are integers, "1.5" alone is not one
+            return None if frac else number
+        scale = self.suffixes[suffix.lower()]
+        return (number * 10**len(frac) + int(frac or 0)) * scale // 10**len(frac)
+
+    def parse(self, raw):
+        '''
+        Count in raw, a number alone, names with "and N others" or names only
+        '''
+        match = self.number.match(raw)
+        if match:
+            return self.value(match)
+        match = self.others.match(raw)
+        if match:
+            names = [name for name in self.names.split(match.group('names')) if name]
+            return self.value(match) + len(names)
+        if not _DIGIT.search(raw):
+            #a list needs "and" or a comma, a lone word is a label ("Like")
+            names = [name for name in self.names.split(raw.strip()) if name]
+            return len(names) if len(names) > 1 else None
+        return None
+
+    def search(self, raw):
+        '''
+        First count in raw, for labels like "1,481 Comments"
+        '''
+        match = self.first.search(raw)
+        return self.value(match) if match else None
+
+
+GRAMMARS = {lang: CountGrammar(table) for lang, table in LOCALES.items()}
+
+
+@lru_cache(maxsize=4096)
+def _parse(raw, lang, search):
+    grammar = GRAMMARS.get(lang)
+    if grammar is None:
+        return int(_DIGITS.sub('', raw)) if _PLAIN.match(raw) else None
+    return grammar.search(raw) if search else grammar.parse(raw)
+
+def parse_count(raw, lang=None, search=False):
+    '''
+    Count as int, None if raw is not a count. Without lang (or for an
+    unsupported one) only plain integers are recognized. With search the
+    first number in raw is taken, whatever is around it
+    '''
+    if isinstance(raw, (list, tuple)):
+        raw = raw[0] if raw else None
+    if isinstance(raw, bool) or raw is None:
+        return None
+    if isinstance(raw, int):
+        return raw
+    if not isinstance(raw, str):
+        return None
+    return _parse(raw, lang, search)
+
+def parse_counts(values, lang=None, search=False):
+    '''
+    Bulk parse_count, for a column of scraped values (a list, a pandas
+    Series...): the same strings repeat a lot, each one is parsed once
+    '''
+    cache = {}
+    out = []
+    for raw in values:
+        key = raw if isinstance(raw, str) else None
+        if key is not None and key in cache:
+            out.append(cache[key])
+            continue
+        count = parse_count(raw, lang, search)
+        if key is not None:
+            cache[key] = count
+        out.append(count)
+    return out
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+# Date grammar for the timestamps shown by mbasic.facebook.com.
+#
+# The per-language tables are compiled once at import. Parsing is memoized on
+# (raw string, lang, anchor), where the anchor is the crawl time truncated to
+# the minute: relative dates ("4 hrs", "ieri alle 20:45") depend on it.
+
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+LOCALES = {
+# =============================================================================
+# Italian
+# =============================================================================
+    'it': {
+        'months': ['gennaio', 'febbraio', 'marzo', 'aprile', 'maggio', 'giugno', 'luglio',
+                   'agosto', 'settembre', 'ottobre', 'novembre', 'dicembre'],
+        'months_abbr': ['gen', 'feb', 'mar', 'apr', 'mag', 'giu', 'lug', 'ago', 'set', 'ott', 'nov', 'dic'],
+        'weekdays': ['lunedì', 'martedì', 'mercoledì', 'giovedì', 'venerdì', 'sabato', 'domenica'],
+        'now': ['adesso'],
+        'today': ['oggi'],
+        'yesterday': ['ieri'],
+        'minutes': ['min', 'minuto', 'minuti'],
+        'hours': ['h', 'ora', 'ore'],
+        'days': ['g', 'giorno', 'giorni'],
+        'filler': ['alle', 'fa', 'di', 'il'],
+    },
+# =============================================================================
+# English
+# =============================================================================
+    'en': {
+        'months': ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+                   'august', 'september', 'october', 'november', 'december'],
+        'months_abbr': ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'],
+        'weekdays': ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'],
+        'now': ['now'],
+        'today': ['today'],
+        'yesterday': ['yesterday'],
+        'minutes': ['min', 'mins', 'minute', 'minutes'],
+        'hours': ['h', 'hr', 'hrs', 'hour', 'hours'],
+        'days': ['d', 'day', 'days'],
+        'filler': ['at', 'ago', 'on', 'am', 'pm', 'just'],
+    },
+# =============================================================================
+# Spanish
+# =============================================================================
+    'es': {
+        'months': ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio',
+                   'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre'],
+        'months_abbr': ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sept', 'oct', 'nov', 'dic'],
+        'weekdays': ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo'],
+        'now': ['ahora'],
+        'today': ['hoy'],
+        'yesterday': ['ayer'],
+        'minutes': ['min', 'minuto', 'minutos'],
+        'hours': ['h', 'hora', 'horas'],
+        'days': ['d', 'día', 'días'],
+        'filler': ['a', 'las', 'la', 'de', 'del', 'hace', 'el'],
+    },
+# =============================================================================
+# French
+# =============================================================================
+    'fr': {
+        'months': ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet',
+                   'août', 'septembre', 'octobre', 'novembre', 'décembre'],
+        'months_abbr': ['janv', 'févr', 'mars', 'avr', 'mai', 'juin', 'juil', 'août', 'sept', 'oct', 'nov', 'déc'],
+        'weekdays': ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche'],
+        'now': ['maintenant', "l'instant"],
+        'today': ["aujourd'hui"],
+        'yesterday': ['hier'],
+        'minutes': ['min', 'minute', 'minutes'],
+        'hours': ['h', 'heure', 'heures'],
+        'days': ['j', 'jour', 'jours'],
+        'filler': ['à', 'il', 'y', 'a', 'le', 'de'],
+    },
+# =============================================================================
+# Portuguese
+# =============================================================================
+    'pt': {
+        'months': ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho', 'julho',
+                   'agosto', 'setembro', 'outubro', 'novembro', 'dezembro'],
+        'months_abbr': ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez'],
+        'weekdays': ['segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira', 'sexta-feira', 'sábado', 'domingo'],
+        'now': ['agora'],
+        'today': ['hoje'],
+        'yesterday': ['ontem'],
+        'minutes': ['min', 'minuto', 'minutos'],
+        'hours': ['h', 'hora', 'horas'],
+        'days': ['d', 'dia', 'dias'],
+        'filler': ['às', 'as', 'de', 'há', 'a', 'em'],
+    },
+}
+
+_TIME = re.compile(r'\b\d{1,2}[:.]\d{2}\b')            #21:49, 7.00
+_SPLIT_UNIT = re.compile(r'(\d)([^\W\d_])')            #4h -> 4 h, 50min -> 50 min
+_PUNCT = re.compile(r"[,.·]")
+_APOSTROPHE = re.compile(u'[’`]')
+_ACCENTS = {ord(a): b for a, b in zip(u'àáâãäçèéêëìíîïòóôõöùúûü', 'aaaaaceeeeiiiiooooouuuu')}
+
+def _strip_accents(word):
+    return word.translate(_ACCENTS)
+
+
+class DateGrammar(object):
+    '''
+    Lookup tables of one language, built once from LOCALES
+    '''
+    def __init__(self, table):
+        self.months = {}
+        for i, name in enumerate(table['months']):
+            self.months[name] = i + 1
+        for i, name in enumerate(table['months_abbr']):
+            self.months.setdefault(name, i + 1)
+        self.weekdays = {}
+        for i, name in enumerate(table['weekdays']):
+            self.weekdays[name] = i
+            self.weekdays.setdefault(name.split('-')[0], i)   #segunda-feira -> segunda
+            self.weekdays.setdefault(_strip_accents(name), i) #lunedì -> lunedi
+        self.words = {}
+        for word in table['now'] + table['today']:
+            self.words[word] = 0
+        for word in table['yesterday']:
+            self.words[word] = 1
+        self.units = {}
+        for key, delta in (('minutes', timedelta(minutes=1)),
+                           ('hours', timedelta(hours=1)),
+                           ('days', timedelta(days=1))):
+            for word in table[key]:
+                self.units[word] = delta
+        self.filler = set(table['filler'])
+
+    def tokenize(self, raw):
+        raw = _APOSTROPHE.sub("'", raw.lower())
+        raw = _TIME.sub(' ', raw)
+        raw = _SPLIT_UNIT.sub(r'\1 \2', raw)
+        return _PUNCT.sub(' ', raw).split()
+
+    def parse(self, raw, anchor):
+        '''
+        Return a datetime.date, or None if the string is not understood
+        '''
+        tokens = self.tokenize(raw)
+        today = anchor.date()
+
+        #relative: 4 h, 50 min, 9 ore fa, hace 5 min, il y a 3 heures
+        for i in range(len(tokens) - 1):
+            if tokens[i].isdigit() and tokens[i+1] in self.units:
+                return (anchor - int(tokens[i]) * self.units[tokens[i+1]]).date()
+
+        tokens = [t for t in tokens if t not in self.filler and t not in self.units]
+        if not tokens:
+            return None
+
+        #adesso, yesterday, ieri alle 20:45, domenica alle ore 19:29
+        if len(tokens) == 1:
+            word = tokens[0]
+            if word in self.words:
+                return today - timedelta(self.words[word])
+            if word in self.weekdays:
+                return today - timedelta((today.weekday() - self.weekdays[word]) % 7)
+            return None
+
+        #2 gennaio, 21 giu 2017, Aug 25 2016, 25 de junio de 2016
+        month = day = year = None
+        for token in tokens:
+            if token in self.months and month is None:
+                month = self.months[token]
+            elif token.isdigit() and len(token) <= 2 and day is None:
+                day = int(token)
+            elif token.isdigit() and len(token) == 4 and year is None:
+                year = int(token)
+            elif token not in self.weekdays:
+                return None
+        if month is None or day is None:
+            return None
+        try:
+            if year is not None:
+                return datetime(year, month, day).date()
+            #the year is omitted for dates of the current year
+            date = datetime(today.year, month, day).date()
+            if date > today:
+                date = datetime(today.year - 1, month, day).date()
+            return date
+        except ValueError:
+            return None
+
+GRAMMARS = {lang: DateGrammar(table) for lang, table in LOCALES.items()}
+
+
+def crawl_anchor(now=None):
+    '''
+    Reference time for relative dates, truncated to the minute so that the
+    memo below is shared by all the items parsed in the same minute
+    '''
+    now = now or datetime.now()
+    return now.replace(second=0, microsecond=0)
+
+@lru_cache(maxsize=8192)
+def _parse_cached(raw, lang, anchor):
+    return GRAMMARS[lang].parse(raw, anchor)
+
+def parse_date(raw, lang, anchor=None):
+    '''
+    Parse one timestamp string, None if lang or format are not supported
+    '''
+    if lang not in GRAMMARS or not raw:
+        return None
+    return _parse_cached(raw, lang, crawl_anchor(anchor))
+
+def parse_dates(raws, lang, anchor=None):
+    '''
+    Bulk version of parse_date, the anchor is computed once for the whole list
+    '''
+    if lang not in GRAMMARS:
+        return [None] * len(raws)
+    anchor = crawl_anchor(anchor)
+    return [_parse_cached(raw, lang, anchor) if raw else None for raw in raws]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Duplicate filter with bounded memory.
+#
+# RFPDupeFilter keeps the fingerprint of every request in a set (and in
+# JOBDIR/requests.seen), which grows with the crawl. BloomDupeFilter keeps
+# them in a Bloom filter sized once for DUPEFILTER_CAPACITY requests with a
+# DUPEFILTER_ERROR_RATE probability of false positives: about 3.6MB for a
+# million requests at one in a million. A false positive drops a page that
+# was never crawled, so the rate is kept low; past the capacity it rises
+# and a warning is logged once.
+#
+# A request with meta['revisit'] set is never filtered (its fingerprint is
+# still recorded), for the pages a spider wants to see again on purpose
+# (FacebookSpider sets it on the first page of the targets in incremental
+# mode); unlike dont_filter it is honoured by the frontier too. With JOBDIR the
+# filter is saved to JOBDIR/requests.bloom when the spider is closed.
+
+import os
+import json
+import math
+import logging
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter(object):
+    '''
+    Bloom filter over request fingerprints (sha1 digests): the bit
+    positions are derived from the digest by double hashing
+    '''
+    def __init__(self, capacity=1000000, error_rate=1e-6):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, fp):
+        h1 = int.from_bytes(fp[:8], 'little')
+        h2 = int.from_bytes(fp[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, fp):
+        '''
+        Add a fingerprint, returns True if it was (probably) there already
+        '''
+        present = True
+        for pos in self.positions(fp):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & mask:
+                present = False
+                self.bits[byte] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, fp):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(fp))
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path):
+        header = {'capacity': self.capacity, 'error_rate': self.error_rate, 'count': self.count}
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, capacity, error_rate):
+        '''
+        Filter saved in path, None if it was sized differently
+        '''
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            if (header['capacity'], header['error_rate']) != (capacity, error_rate):
+                return None
+            bloom = cls(capacity, error_rate)
+            bits = f.read()
+        if len(bits) != len(bloom.bits):
+            return None
+        bloom.bits = bytearray(bits)
+        bloom.count = header['count']
+        return bloom
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    '''
+    DUPEFILTER_CLASS, see the module docstring
+    '''
+    def __init__(self, path=None, debug=False, *, fingerprinter=None,
+                 capacity=1000000, error_rate=1e-6):
+        #the set and requests.seen of RFPDupeFilter are not used
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.path = os.path.join(path, 'requests.bloom') if path else None
+        self.bloom = None
+        if self.path and os.path.exists(self.path):
+            self.bloom = BloomFilter.load(self.path, capacity, error_rate)
+            if self.bloom is None:
+                logger.warning('DUPEFILTER_CAPACITY or DUPEFILTER_ERROR_RATE changed, '
+                               'the requests seen by the job so far are forgotten')
+        if self.bloom is None:
+            self.bloom = BloomFilter(capacity, error_rate)
+        self.overflow_logged = False
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None):
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'), fingerprinter=fingerprinter,
+                   capacity=settings.getint('DUPEFILTER_CAPACITY', 1000000),
+                   error_rate=settings.getfloat('DUPEFILTER_ERROR_RATE', 1e-6))
+
+    def request_seen(self, request):
+        fp = self.fingerprinter.fingerprint(request)
+        seen = self.bloom.add(fp)
+        if not self.overflow_logged and len(self.bloom) > self.bloom.capacity:
+            logger.warning('More than {} requests seen, raise DUPEFILTER_CAPACITY: '
+                           'new pages may be taken for duplicates'.format(self.bloom.capacity))
+            self.overflow_logged = True
+        return seen and not request.meta.get('revisit')
+
+    def close(self, reason):
+        if self.path:
+            self.bloom.save(self.path)
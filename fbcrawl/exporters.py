@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Feed exporters.
+#
+# ParquetItemExporter streams the items into a Parquet file with typed
+# columns: counters are integers, dates are dates and the repetitive names
+# (source, reply_to, shared_from) are dictionary-encoded. Rows are buffered
+# column by column and written out as a row group every row_group_size items,
+# so memory stays flat however long the crawl is.
+#
+# Enable it with -o DUMPFILE.parquet (the format is registered in settings.py
+# as FEED_EXPORTERS), pyarrow is needed: pip install pyarrow
+
+from datetime import date, datetime
+
+from scrapy.exporters import BaseItemExporter
+from scrapy.utils.python import to_unicode
+
+from fbcrawl.counts import parse_count
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+INT_FIELDS = ('reactions', 'likes', 'ahah', 'love', 'wow', 'sigh', 'grrr', 'comments', 'share')
+DATE_FIELDS = ('date',)
+DICT_FIELDS = ('source', 'reply_to', 'shared_from')
+
+
+def _first(value):
+    if isinstance(value, (list, tuple)):
+        return value[0] if len(value) == 1 else (None if not value else value)
+    return value
+
+def to_int(value):
+    '''
+    Counter as int, None if the value is not a count: the items carry ints
+    already (see counts.py), raw strings of older items must be plain numbers
+    '''
+    return parse_count(_first(value))
+
+def to_date(value):
+    '''
+    Date of the item, None for the unparsed ones (raw strings, tokens)
+    '''
+    value = _first(value)
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+def to_str(value):
+    '''
+    Text of the field, multiple values joined with ',' like the CSV exporter
+    '''
+    value = _first(value)
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return ','.join(to_unicode(str(v)) for v in value)
+    return to_unicode(str(value))
+
+
+class ParquetItemExporter(BaseItemExporter):
+    '''
+    Streaming Parquet exporter, one row group every row_group_size items.
+    The schema is fixed by the first item (or by FEED_EXPORT_FIELDS).
+    '''
+    def __init__(self, file, row_group_size=10000, compression='snappy', **kwargs):
+        if pa is None:
+            raise ImportError('ParquetItemExporter requires pyarrow: pip install pyarrow')
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.row_group_size = int(row_group_size)
+        self.compression = compression
+        self.writer = None
+        self.schema = None
+        self.columns = None
+        self.buffered = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, file, *args, **kwargs):
+        settings = crawler.settings
+        kwargs.setdefault('row_group_size', settings.getint('FEED_PARQUET_ROW_GROUP_SIZE', 10000))
+        kwargs.setdefault('compression', settings.get('FEED_PARQUET_COMPRESSION', 'snappy'))
+        return cls(file, *args, **kwargs)
+
+    def _build_schema(self, item):
+        fields = []
+        for name, _ in self._get_serialized_fields(item, default_value=None, include_empty=True):
+            if name in INT_FIELDS:
+                fields.append(pa.field(name, pa.int64()))
+            elif name in DATE_FIELDS:
+                fields.append(pa.field(name, pa.date32()))
+            elif name in DICT_FIELDS:
+                fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(name, pa.string()))
+        return pa.schema(fields)
+
+    def serialize_field(self, field, name, value):
+        serializer = field.get('serializer')
+        if serializer is not None:
+            return serializer(value)
+        if name in INT_FIELDS:
+            return to_int(value)
+        if name in DATE_FIELDS:
+            return to_date(value)
+        return to_str(value)
+
+    def export_item(self, item):
+        if self.schema is None:
+            self.schema = self._build_schema(item)
+            self.columns = {name: [] for name in self.schema.names}
+            self.writer = pq.ParquetWriter(self.file, self.schema, compression=self.compression)
+        row = dict(self._get_serialized_fields(item, default_value=None, include_empty=True))
+        for name, column in self.columns.items():
+            column.append(row.get(name))
+        self.buffered += 1
+        if self.buffered >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffered:
+            return
+        arrays = [pa.array(self.columns[f.name], type=f.type) for f in self.schema]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema),
+                                row_group_size=self.row_group_size)
+        for column in self.columns.values():
+            del column[:]
+        self.buffered = 0
+
+    def finish_exporting(self):
+        if self.writer is None:
+            return
+        self._flush()
+        self.writer.close()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# Live metrics of a crawl.
+#
+# CrawlMetrics collects per-callback counts and latency histograms (from the
+# callback_timed signal of middlewares.FbcrawlSpiderMiddleware), the depth of
+# the scheduler queue, items/sec, downloaded bytes and the memory of the
+# process. They are served as JSON on http://127.0.0.1:METRICS_PORT/ (if a
+# port is given) and appended every METRICS_INTERVAL seconds to METRICS_FILE
+# (JSON lines).
+#
+# StateSnapshot saves the state of the spider in JOBDIR every
+# STATE_SNAPSHOT_INTERVAL seconds, so that a job killed without a clean
+# shutdown resumes from its last snapshot instead of from the beginning.
+# Only when the requests survive a crash too (a frontier, FRONTIER_JOBDIR):
+# the disk queues of scrapy are written out when the spider is closed, a
+# state newer than the queues would skip the targets whose requests were
+# lost (see FacebookSpider.started).
+
+import os
+import json
+import time
+import pickle
+import logging
+from bisect import bisect_left
+
+try:
+    import resource as rusage
+except ImportError:     #windows
+    rusage = None
+
+from twisted.internet import task
+from twisted.internet.error import CannotListenError
+from twisted.web import server, resource
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.job import job_dir
+
+from fbcrawl.frontier import frontier_uri
+from fbcrawl.signals import callback_timed
+
+logger = logging.getLogger(__name__)
+
+#upper bounds of the latency buckets, in milliseconds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def get_rss():
+    '''
+    Resident memory of the process in bytes, the peak if the current
+    value is not available (non-Linux)
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    if rusage is None:
+        return None
+    return rusage.getrusage(rusage.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Histogram(object):
+    '''
+    Latency histogram of one callback, with fixed buckets
+    '''
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.calls = 0
+        self.failed = 0
+        self.items = 0
+        self.requests = 0
+        self.seconds = 0.0
+        self.max = 0.0
+
+    def add(self, seconds, items, requests, failed):
+        self.counts[bisect_left(BUCKETS, seconds * 1000)] += 1
+        self.calls += 1
+        self.failed += int(failed)
+        self.items += items
+        self.requests += requests
+        self.seconds += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        '''
+        Upper bound of the bucket holding the p-th percentile, in ms
+        '''
+        rank = self.calls * p / 100.0
+        seen = 0
+        for bound, count in zip(BUCKETS + (None,), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound if bound is not None else round(self.max * 1000, 3)
+        return None
+
+    def snapshot(self):
+        return {'calls': self.calls,
+                'failed': self.failed,
+                'items': self.items,
+                'requests': self.requests,
+                'mean_ms': round(self.seconds / self.calls * 1000, 3) if self.calls else None,
+                'max_ms': round(self.max * 1000, 3),
+                'p50_ms': self.percentile(50),
+                'p90_ms': self.percentile(90),
+                'p99_ms': self.percentile(99),
+                'buckets': {('le_{}'.format(b) if b is not None else 'inf'): c
+                            for b, c in zip(BUCKETS + (None,), self.counts)}}
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        resource.Resource.__init__(self)
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'application/json')
+        return json.dumps(self.metrics.snapshot(), indent=2).encode('utf-8')
+
+
+class CrawlMetrics(object):
+    '''
+    Scrapy extension, enabled by METRICS_ENABLED
+    '''
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.port = settings.getint('METRICS_PORT', 0)
+        self.host = settings.get('METRICS_HOST', '127.0.0.1')
+        self.path = settings.get('METRICS_FILE')
+        self.interval = settings.getfloat('METRICS_INTERVAL', 10)
+        self.callbacks = {}
+        self.items = 0
+        self.started = None
+        self.last = None
+        self.listener = None
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.callback_timed, signal=callback_timed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+        self.last = (self.started, 0)
+        if self.port:
+            from twisted.internet import reactor
+            try:
+                self.listener = reactor.listenTCP(self.port, server.Site(MetricsResource(self)),
+                                                  interface=self.host)
+                logger.info('Metrics available on http://{}:{}/'.format(self.host, self.port))
+            except CannotListenError as e:
+                logger.warning('Metrics endpoint not started: {}'.format(e))
+        if self.path:
+            self.loop = task.LoopingCall(self.write_snapshot)
+            self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        if self.path:
+            self.write_snapshot()
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+    def item_scraped(self, item, spider):
+        self.items += 1
+
+    def callback_timed(self, callback, seconds, items, requests, failed, spider):
+        if callback not in self.callbacks:
+            self.callbacks[callback] = Histogram()
+        self.callbacks[callback].add(seconds, items, requests, failed)
+
+    def queues(self):
+        engine = self.crawler.engine
+        slot = getattr(engine, 'slot', None)
+        if slot is None:
+            return {}
+        return {'scheduled': len(slot.scheduler),
+                'in_progress': len(slot.inprogress),
+                'downloading': len(engine.downloader.active),
+                'scraping': len(engine.scraper.slot.active) if engine.scraper.slot else 0}
+
+    def snapshot(self):
+        now = time.time()
+        elapsed = now - self.started if self.started else 0
+        last_time, last_items = self.last or (now, self.items)
+        stats = self.crawler.stats
+        return {'time': now,
+                'elapsed': round(elapsed, 3),
+                'items': self.items,
+                'items_per_sec': round(self.items / elapsed, 3) if elapsed else None,
+                'items_per_sec_recent': round((self.items - last_items) / (now - last_time), 3)
+                                        if now > last_time else None,
+                'responses': stats.get_value('response_received_count', 0),
+                'bytes_downloaded': stats.get_value('downloader/response_bytes', 0),
+                'rss_bytes': get_rss(),
+                'queues': self.queues(),
+                'callbacks': {name: h.snapshot() for name, h in self.callbacks.items()}}
+
+    def write_snapshot(self):
+        snapshot = self.snapshot()
+        self.last = (snapshot['time'], snapshot['items'])
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(snapshot) + '\n')
+
+
+class StateSnapshot(object):
+    '''
+    Scrapy extension, enabled by JOBDIR with a frontier: writes spider.state
+    to JOBDIR/spider.state while the spider runs, scrapy's SpiderState writes
+    it only when the spider is closed and reads it when the job is resumed
+    '''
+    def __init__(self, jobdir, interval):
+        self.path = os.path.join(jobdir, 'spider.state')
+        self.interval = interval
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        interval = crawler.settings.getfloat('STATE_SNAPSHOT_INTERVAL', 60)
+        if not jobdir or interval <= 0 or not frontier_uri(crawler.settings):
+            raise NotConfigured
+        ext = cls(jobdir, interval)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.loop = task.LoopingCall(self.write, spider)
+        self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+
+    def write(self, spider):
+        state = getattr(spider, 'state', None)
+        if state is None:
+            return
+        #never leave a truncated file behind, it is all a resume has
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=4)
+        os.replace(tmp, self.path)
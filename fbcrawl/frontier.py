@@ -0,0 +1,688 @@
+# -*- coding: utf-8 -*-
+
+# Shared crawl frontier, to spread one crawl over several workers.
+#
+# With FRONTIER set, FrontierScheduler keeps the requests of the spider in a
+# shared store instead of the memory of the process: every worker (same
+# spider, any machine) pushes the requests it discovers and leases the next
+# ones from the same queue, and the duplicate filter is the set of the
+# fingerprints ever pushed, so a page is crawled by one worker only.
+#
+# A leased request belongs to its worker for FRONTIER_LEASE_TTL seconds,
+# renewed while the request is in progress, and is acknowledged (removed)
+# once its callback or errback is over. If the worker crashes the lease
+# expires and another worker picks the request up again; a worker that is
+# closed releases its leases right away. Workers stay open while there are
+# requests queued or leased by anyone, they may still produce new requests.
+# A request that ends without reaching the callback or errback through the
+# middlewares (an IgnoreRequest from process_response, like the checkpoint
+# of FbcrawlDownloaderMiddleware) is acknowledged once it is no longer in
+# progress in the engine.
+#
+# The store is only called from a thread of the scheduler, the reactor never
+# waits for it: requests are pushed and acknowledged in batches (every
+# FRONTIER_BATCH_SIZE requests or FRONTIER_FLUSH_INTERVAL seconds) and leased
+# ahead of time. The fingerprints are kept as 64 bits integers, only the
+# last FRONTIER_SEEN_MAX ones (0: all of them).
+#
+# The login flow (and anything that can't be serialized to JSON) stays in
+# the local queue: every worker logs in with its own session.
+#
+# With FRONTIER_JOBDIR a job with JOBDIR and no FRONTIER gets a frontier of
+# its own in JOBDIR/frontier.db: unlike the disk queues of scrapy, written
+# out when the spider is closed, it survives a crash, at the cost of a
+# store call for every request (off by default). With JOBDIR the name of
+# the worker is bound to the job, a resumed job takes back its own leases at
+# once instead of waiting for them to expire.
+#
+# Stores:
+#     FRONTIER = 'frontier.db'              SQLite file, workers on this machine
+#     FRONTIER = 'http://127.0.0.1:6082'    network store, for example the
+#                                           stand-in server of this module:
+#     python -m fbcrawl.frontier serve frontier.db --port 6082
+
+import os
+import sys
+import json
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+from time import time
+from hashlib import sha1
+from collections import deque
+from urllib.request import urlopen, Request as HTTPRequest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from twisted.internet import reactor, task, threads
+from twisted.python.threadpool import ThreadPool
+from scrapy import signals
+from scrapy.core.scheduler import Scheduler
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import request_from_dict
+
+logger = logging.getLogger(__name__)
+
+#callbacks of the login flow, every worker runs them with its own session
+LOCAL_CALLBACKS = ('parse', 'parse_home', 'parse_session')
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS queue ('
+          'id INTEGER PRIMARY KEY AUTOINCREMENT, spider TEXT, priority INTEGER, data TEXT, '
+          'worker TEXT, expires REAL)',
+          'CREATE INDEX IF NOT EXISTS queue_next ON queue (spider, priority, id)',
+          'CREATE TABLE IF NOT EXISTS fingerprints ('
+          'id INTEGER PRIMARY KEY, spider TEXT, fp INTEGER, UNIQUE (spider, fp))')
+
+
+def request_to_json(request, spider):
+    '''
+    JSON form of a request, ValueError/TypeError if it can't be serialized
+    '''
+    d = request.to_dict(spider=spider)
+    d['headers'] = {k.decode('latin1'): [v.decode('latin1') for v in vs] for k, vs in d['headers'].items()}
+    d['body'] = d['body'].decode('latin1')
+    return json.dumps(d)
+
+def request_from_json(data, spider):
+    d = json.loads(data)
+    d['headers'] = {k.encode('latin1'): [v.encode('latin1') for v in vs] for k, vs in d['headers'].items()}
+    d['body'] = d['body'].encode('latin1')
+    return request_from_dict(d, spider=spider)
+
+def frontier_uri(settings):
+    '''
+    FRONTIER, or the frontier of the job if JOBDIR and FRONTIER_JOBDIR are
+    set; None if the requests stay in the queues of scrapy
+    '''
+    if settings.get('FRONTIER'):
+        return settings['FRONTIER']
+    jobdir = job_dir(settings)
+    if jobdir and settings.getbool('FRONTIER_JOBDIR', False):
+        return 'sqlite://' + os.path.join(jobdir, 'frontier.db')
+    return None
+
+def worker_name(settings):
+    '''
+    FRONTIER_WORKER, or a name bound to the job if JOBDIR is set, to the
+    process otherwise
+    '''
+    if settings.get('FRONTIER_WORKER'):
+        return settings['FRONTIER_WORKER']
+    jobdir = job_dir(settings)
+    if jobdir:
+        return '{}:{}'.format(socket.gethostname(), os.path.abspath(jobdir))
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+def open_store(uri, seen_max=0):
+    '''
+    Store for a FRONTIER setting: http(s) url, sqlite:// url or file path
+    '''
+    if uri.startswith(('http://', 'https://')):
+        return HTTPFrontierStore(uri)
+    if uri.startswith('sqlite://'):
+        uri = uri[len('sqlite://'):]
+    return SQLiteFrontierStore(uri, seen_max=seen_max)
+
+def fingerprint_key(fp):
+    '''
+    64 bits signed integer of a fingerprint (hex digest, or any string),
+    the form it is kept in by SQLite
+    '''
+    try:
+        value = int(fp[:16], 16)
+    except ValueError:
+        value = int(sha1(fp.encode('utf-8')).hexdigest()[:16], 16)
+    return value - (1 << 63)
+
+
+class SQLiteFrontierStore(object):
+    '''
+    Frontier in a SQLite file, shared by the processes of a machine through
+    the locks of SQLite (every change is an IMMEDIATE transaction). With
+    seen_max the oldest fingerprints past that number are forgotten
+    '''
+    def __init__(self, path, timeout=30, seen_max=0):
+        self.path = path
+        self.seen_max = seen_max
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        #with WAL a commit is still atomic, it may be lost only if the machine crashes
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+    def transaction(self, run):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                result = run(self.db)
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+            return result
+
+    def push(self, spider, requests):
+        '''
+        Queue the requests given as (fingerprint, priority, data), the ones
+        whose fingerprint was already pushed are dropped. A None fingerprint
+        is never filtered. Returns a list of booleans, True if queued
+        '''
+        def run(db):
+            added = []
+            for fp, priority, data in requests:
+                if fp is not None:
+                    if not db.execute('INSERT OR IGNORE INTO fingerprints (spider, fp) VALUES (?, ?)',
+                                      (spider, fingerprint_key(fp))).rowcount:
+                        added.append(False)
+                        continue
+                db.execute('INSERT INTO queue (spider, priority, data) VALUES (?, ?, ?)',
+                           (spider, priority, data))
+                added.append(True)
+            if self.seen_max:
+                self.prune(db)
+            return added
+        return self.transaction(run)
+
+    def prune(self, db):
+        '''
+        Forget the oldest fingerprints past seen_max, once there are 1% more
+        '''
+        low, high = db.execute('SELECT MIN(id), MAX(id) FROM fingerprints').fetchone()
+        if high is not None and high - low + 1 > self.seen_max + self.seen_max // 100:
+            db.execute('DELETE FROM fingerprints WHERE id <= ?', (high - self.seen_max,))
+
+    def lease(self, spider, worker, count, ttl):
+        '''
+        Up to count requests for the worker, highest priority and newest
+        first as scrapy does, as (id, data, recovered): recovered requests
+        were leased by another worker that did not acknowledge them in time
+        '''
+        def run(db):
+            now = time()
+            rows = db.execute('SELECT id, data, worker FROM queue WHERE spider = ? '
+                              'AND (worker IS NULL OR expires < ?) ORDER BY priority DESC, id DESC LIMIT ?',
+                              (spider, now, count)).fetchall()
+            db.executemany('UPDATE queue SET worker = ?, expires = ? WHERE id = ?',
+                           [(worker, now + ttl, row[0]) for row in rows])
+            return [(id_, data, owner is not None) for id_, data, owner in rows]
+        return self.transaction(run)
+
+    def renew(self, worker, ids, ttl):
+        expires = time() + ttl
+        self.transaction(lambda db: db.executemany('UPDATE queue SET expires = ? WHERE id = ? AND worker = ?',
+                                                   [(expires, id_, worker) for id_ in ids]))
+
+    def ack(self, worker, ids):
+        self.transaction(lambda db: db.executemany('DELETE FROM queue WHERE id = ? AND worker = ?',
+                                                   [(id_, worker) for id_ in ids]))
+
+    def release(self, worker, ids):
+        self.transaction(lambda db: db.executemany('UPDATE queue SET worker = NULL, expires = NULL '
+                                                   'WHERE id = ? AND worker = ?',
+                                                   [(id_, worker) for id_ in ids]))
+
+    def release_worker(self, spider, worker):
+        '''
+        Release every lease of the worker, returns how many there were
+        '''
+        return self.transaction(lambda db: db.execute('UPDATE queue SET worker = NULL, expires = NULL '
+                                                      'WHERE spider = ? AND worker = ?',
+                                                      (spider, worker)).rowcount)
+
+    def stats(self, spider):
+        '''
+        Requests queued and leased for the spider, and fingerprints kept
+        (of all the spiders)
+        '''
+        with self.lock:
+            queued, leased = self.db.execute('SELECT COUNT(*) - COUNT(worker), COUNT(worker) FROM queue '
+                                             'WHERE spider = ?', (spider,)).fetchone()
+            low, high = self.db.execute('SELECT MIN(id), MAX(id) FROM fingerprints').fetchone()
+        return {'queued': queued, 'leased': leased, 'seen': high - low + 1 if high is not None else 0}
+
+    def close(self):
+        self.db.close()
+
+
+class HTTPFrontierStore(object):
+    '''
+    Client of a frontier served over HTTP: every method is a POST of its
+    arguments as JSON to url/method, the answer is the JSON result. The
+    calls block, FrontierScheduler makes them in a thread of its own
+    '''
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def call(self, method, **kwargs):
+        request = HTTPRequest('{}/{}'.format(self.url, method), data=json.dumps(kwargs).encode('utf-8'),
+                              headers={'Content-Type': 'application/json'})
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def push(self, spider, requests):
+        return self.call('push', spider=spider, requests=requests)
+
+    def lease(self, spider, worker, count, ttl):
+        return [tuple(row) for row in self.call('lease', spider=spider, worker=worker, count=count, ttl=ttl)]
+
+    def renew(self, worker, ids, ttl):
+        self.call('renew', worker=worker, ids=ids, ttl=ttl)
+
+    def ack(self, worker, ids):
+        self.call('ack', worker=worker, ids=ids)
+
+    def release(self, worker, ids):
+        self.call('release', worker=worker, ids=ids)
+
+    def release_worker(self, spider, worker):
+        return self.call('release_worker', spider=spider, worker=worker)
+
+    def stats(self, spider):
+        return self.call('stats', spider=spider)
+
+    def close(self):
+        pass
+
+
+class FrontierScheduler(Scheduler):
+    '''
+    Scrapy scheduler on a shared frontier when FRONTIER (or JOBDIR) is set,
+    the default scheduler of scrapy otherwise. Local requests use the local queues and
+    DUPEFILTER_CLASS, the others the store, called in a thread of its own:
+    one thread, so the calls reach the store in the order they are made
+    (the requests found in a page are pushed before the page is acknowledged)
+    '''
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super().from_crawler(crawler)
+        settings = crawler.settings
+        scheduler.uri = frontier_uri(settings)
+        scheduler.store = (open_store(scheduler.uri, settings.getint('FRONTIER_SEEN_MAX', 0))
+                           if scheduler.uri else None)
+        scheduler.worker = worker_name(settings)
+        scheduler.lease_size = settings.getint('FRONTIER_LEASE_SIZE', 4)
+        scheduler.lease_ttl = settings.getfloat('FRONTIER_LEASE_TTL', 300)
+        scheduler.poll_interval = settings.getfloat('FRONTIER_POLL_INTERVAL', 1.0)
+        scheduler.batch_size = settings.getint('FRONTIER_BATCH_SIZE', 100)
+        scheduler.flush_interval = settings.getfloat('FRONTIER_FLUSH_INTERVAL', 0.5)
+        scheduler.leased = deque()      #leased, not yet handed to the engine
+        scheduler.inflight = set()      #handed to the engine, not yet acknowledged
+        scheduler.requeued = {}         #id -> retries/redirects of the request in the local queues
+        scheduler.pushes = []           #(request, (fp, priority, data)) not yet pushed
+        scheduler.acks = []
+        scheduler.calls = 0             #store calls not yet answered
+        scheduler.leasing = False
+        scheduler.checking = False
+        scheduler.next_poll = 0         #next lease attempt when the frontier was empty
+        scheduler.next_check = 0        #next look at the whole frontier
+        scheduler.remote_pending = False
+        scheduler.pool = None
+        scheduler.loops = []
+        if scheduler.store is not None:
+            crawler.signals.connect(scheduler.spider_error, signal=signals.spider_error)
+        return scheduler
+
+    def open(self, spider):
+        result = super().open(spider)
+        if self.store is not None:
+            logger.info('Shared frontier {} for spider {}, worker {}'.format(
+                self.uri, spider.name, self.worker))
+            self.pool = ThreadPool(1, 1, name='frontier')
+            self.pool.start()
+            self.shutdown = reactor.addSystemEventTrigger('during', 'shutdown', self.pool.stop)
+            if job_dir(self.crawler.settings):
+                #leases of an earlier run of this job, which did not close
+                self.call('release_worker', spider.name, self.worker).addCallbacks(
+                    self.took_back, self.failed, errbackArgs=('release_worker',))
+            self.loops = [task.LoopingCall(self.flush), task.LoopingCall(self.renew)]
+            self.loops[0].start(self.flush_interval, now=False)
+            self.loops[1].start(max(1.0, self.lease_ttl / 3), now=False)
+        return result
+
+    def close(self, reason):
+        if self.store is None:
+            return super().close(reason)
+        for loop in self.loops:
+            if loop.running:
+                loop.stop()
+        #the answers of the calls made so far come first
+        dfd = threads.deferToThreadPool(reactor, self.pool, lambda: None)
+        dfd.addCallback(lambda _: self.finish())
+        dfd.addErrback(self.failed, 'close')
+        dfd.addBoth(lambda _: self.stop_pool())
+        dfd.addBoth(lambda _: super(FrontierScheduler, self).close(reason))
+        return dfd
+
+    def finish(self):
+        self.flush()
+        unfinished = [entry[0] for entry in self.leased] + list(self.inflight)
+        if unfinished:
+            logger.info('Releasing {} leased requests'.format(len(unfinished)))
+            self.call('release', self.worker, unfinished).addErrback(self.failed, 'release')
+        return self.call('close')
+
+    def stop_pool(self):
+        #already stopped if the reactor was stopped first
+        if not self.pool.joined:
+            reactor.removeSystemEventTrigger(self.shutdown)
+            self.pool.stop()
+
+    def call(self, method, *args):
+        '''
+        Deferred result of a method of the store, run in the frontier thread
+        '''
+        self.calls += 1
+        def done(result):
+            self.calls -= 1
+            return result
+        return threads.deferToThreadPool(reactor, self.pool, getattr(self.store, method), *args).addBoth(done)
+
+    def failed(self, failure, method):
+        logger.error('Frontier {} failed: {}'.format(method, failure.getErrorMessage()))
+        self.stats.inc_value('frontier/errors', spider=self.spider)
+
+    def wake(self, delay=0):
+        '''
+        Have the engine ask for the next requests, after delay seconds
+        '''
+        if delay:
+            reactor.callLater(delay, self.wake)
+            return
+        slot = getattr(self.crawler.engine, 'slot', None)
+        if slot is not None:
+            slot.nextcall.schedule()
+
+    def took_back(self, released):
+        if released:
+            logger.info('Took back {} requests leased by the previous run of the job'.format(released))
+
+    def local(self, request):
+        callback = getattr(request.callback, '__name__', request.callback)
+        return (self.store is None or '_frontier' in request.meta
+                or callback is None or callback in LOCAL_CALLBACKS)
+
+    def enqueue_request(self, request):
+        if self.local(request):
+            #login flow, or a retry or redirect of a request leased here
+            queued = super().enqueue_request(request)
+            id_ = request.meta.get('_frontier')
+            if queued and id_ is not None:
+                self.requeued[id_] = self.requeued.get(id_, 0) + 1
+            return queued
+        try:
+            data = request_to_json(request, self.spider)
+        except (ValueError, TypeError) as e:
+            logger.warning('Request {} kept in the local queue, it cannot be serialized: {}'.format(request, e))
+            self.stats.inc_value('frontier/unserializable', spider=self.spider)
+            return super().enqueue_request(request)
+        #revisits are queued again, like dont_filter (see dupefilters.py)
+        if request.dont_filter or request.meta.get('revisit'):
+            fp = None
+        else:
+            fp = self.crawler.request_fingerprinter.fingerprint(request).hex()
+        #a duplicate is known once the batch is pushed, it is dropped then
+        self.pushes.append((request, (fp, request.priority, data)))
+        self.remote_pending = True
+        if len(self.pushes) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        '''
+        Push and acknowledge what was buffered so far
+        '''
+        self.reconcile()
+        if self.pushes:
+            pushes, self.pushes = self.pushes, []
+            self.call('push', self.spider.name, [entry for _, entry in pushes]).addCallbacks(
+                self.pushed, self.push_failed, callbackArgs=(pushes,), errbackArgs=(pushes,))
+        if self.acks:
+            acks, self.acks = self.acks, []
+            self.call('ack', self.worker, acks).addCallbacks(
+                self.acked, self.ack_failed, callbackArgs=(acks,), errbackArgs=(acks,))
+
+    def pushed(self, added, pushes):
+        if any(added):
+            #no need to wait for the next poll, there is something to lease
+            self.next_poll = 0
+        for (request, _), queued in zip(pushes, added):
+            if queued:
+                self.stats.inc_value('frontier/pushed', spider=self.spider)
+                continue
+            self.df.log(request, self.spider)
+            self.stats.inc_value('frontier/filtered', spider=self.spider)
+            self.crawler.signals.send_catch_log(signals.request_dropped, request=request, spider=self.spider)
+        self.wake()
+
+    def push_failed(self, failure, pushes):
+        #pushed again with the next batch
+        self.failed(failure, 'push')
+        self.pushes[:0] = pushes
+
+    def acked(self, _, acks):
+        self.stats.inc_value('frontier/acked', len(acks), spider=self.spider)
+
+    def ack_failed(self, failure, acks):
+        self.failed(failure, 'ack')
+        self.acks[:0] = acks
+
+    def reconcile(self):
+        '''
+        Acknowledge the leased requests that are over without an ack: an
+        exception raised by a process_response goes to the errback straight
+        away, without the middlewares (IgnoreRequest of a checkpoint, too
+        many redirects...)
+        '''
+        slot = getattr(self.crawler.engine, 'slot', None)
+        if slot is None or not self.inflight:
+            return
+        running = {request.meta.get('_frontier') for request in slot.inprogress}
+        for id_ in list(self.inflight):
+            if id_ not in running and not self.requeued.get(id_):
+                self.inflight.discard(id_)
+                self.acks.append(id_)
+                self.stats.inc_value('frontier/reconciled', spider=self.spider)
+
+    def next_request(self):
+        request = super().next_request()
+        if request is not None:
+            id_ = request.meta.get('_frontier')
+            if id_ in self.requeued:
+                self.requeued[id_] -= 1
+                if not self.requeued[id_]:
+                    del self.requeued[id_]
+            return request
+        if self.store is None:
+            return None
+        if len(self.leased) <= self.lease_size // 2:
+            self.lease()
+        while self.leased:
+            id_, data, _ = self.leased.popleft()
+            try:
+                request = request_from_json(data, self.spider)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.error('Dropping frontier entry {}, it cannot be loaded: {}'.format(id_, e))
+                self.acks.append(id_)
+                continue
+            request.meta['_frontier'] = id_
+            self.inflight.add(id_)
+            self.stats.inc_value('frontier/leased', spider=self.spider)
+            return request
+        return None
+
+    def lease(self):
+        '''
+        Lease the next requests in the background, after the pushes so far
+        '''
+        if self.leasing or time() < self.next_poll:
+            return
+        self.leasing = True
+        self.flush()
+        self.call('lease', self.spider.name, self.worker, self.lease_size, self.lease_ttl).addCallbacks(
+            self.got_leases, self.lease_failed)
+
+    def got_leases(self, entries):
+        self.leasing = False
+        self.leased.extend(entries)
+        self.next_poll = 0 if entries else time() + self.poll_interval
+        recovered = sum(1 for entry in entries if entry[2])
+        if recovered:
+            logger.info('Picked up {} requests of an expired lease'.format(recovered))
+            self.stats.inc_value('frontier/recovered', recovered, spider=self.spider)
+        self.wake(0 if entries else self.poll_interval)
+
+    def lease_failed(self, failure):
+        self.leasing = False
+        self.next_poll = time() + self.poll_interval
+        self.failed(failure, 'lease')
+        self.wake(self.poll_interval)
+
+    def has_pending_requests(self):
+        if (super().has_pending_requests() or self.leased or self.pushes
+                or (self.store is not None and self.calls)):
+            return True
+        if self.store is None:
+            return False
+        #requests leased by other workers may still produce new ones
+        if not self.checking and time() >= self.next_check:
+            self.checking = True
+            self.flush()
+            self.call('stats', self.spider.name).addCallbacks(self.checked, self.check_failed)
+            return True
+        return self.remote_pending
+
+    def checked(self, stats):
+        self.checking = False
+        self.remote_pending = bool(stats['queued'] or stats['leased'])
+        self.next_check = time() + self.poll_interval
+        self.wake(self.poll_interval if self.remote_pending else 0)
+
+    def check_failed(self, failure):
+        self.checking = False
+        self.next_check = time() + self.poll_interval
+        self.failed(failure, 'stats')
+
+    def __len__(self):
+        return super().__len__() + len(getattr(self, 'leased', ())) + len(getattr(self, 'pushes', ()))
+
+    def ack(self, request):
+        '''
+        The request leased from the frontier is done, whatever the outcome
+        '''
+        id_ = request.meta.get('_frontier')
+        if id_ is None or id_ not in self.inflight:
+            return
+        self.inflight.discard(id_)
+        self.acks.append(id_)
+        if len(self.acks) >= self.batch_size:
+            self.flush()
+
+    def renew(self):
+        self.flush()
+        ids = [entry[0] for entry in self.leased] + list(self.inflight)
+        if ids:
+            self.call('renew', self.worker, ids, self.lease_ttl).addErrback(self.failed, 'renew')
+
+    def spider_error(self, failure, response, spider):
+        self.ack(response.request)
+
+
+class FrontierMiddleware(object):
+    '''
+    Acknowledges the leased requests, as spider middleware once the output
+    of the callback (or of the errback of an HTTP error) has been consumed,
+    and as downloader middleware when the download failed for good. Enabled
+    by FRONTIER (or JOBDIR), put it before HttpErrorMiddleware and
+    RetryMiddleware.
+    '''
+    def __init__(self, crawler):
+        if not frontier_uri(crawler.settings):
+            raise NotConfigured
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def ack(self, request):
+        scheduler = self.crawler.engine.slot.scheduler
+        if hasattr(scheduler, 'ack'):
+            scheduler.ack(request)
+
+    def process_spider_output(self, response, result, spider):
+        try:
+            for out in result:
+                yield out
+        finally:
+            self.ack(response.request)
+
+    def process_exception(self, request, exception, spider):
+        #after the retries, the errback (if any) is called next
+        self.ack(request)
+
+
+class FrontierHandler(BaseHTTPRequestHandler):
+    '''
+    Stand-in frontier server, the HTTP side of HTTPFrontierStore
+    '''
+    METHODS = ('push', 'lease', 'renew', 'ack', 'release', 'release_worker', 'stats')
+    store = None
+
+    def do_POST(self):
+        method = self.path.strip('/')
+        if method not in self.METHODS:
+            self.send_error(404)
+            return
+        try:
+            kwargs = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            body = json.dumps(getattr(self.store, method)(**kwargs)).encode('utf-8')
+        except (ValueError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shared crawl frontier')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='serve a SQLite frontier over HTTP')
+    serve.add_argument('path', help='SQLite file of the frontier')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=6082)
+    serve.add_argument('--seen-max', type=int, default=0,
+                       help='fingerprints kept, the oldest ones are forgotten (0: all of them)')
+    stats = commands.add_parser('stats', help='requests queued and leased of a spider')
+    stats.add_argument('frontier', help='SQLite file or url of the frontier')
+    stats.add_argument('spider')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.command == 'serve':
+        FrontierHandler.store = SQLiteFrontierStore(args.path, seen_max=args.seen_max)
+        server = ThreadingHTTPServer((args.host, args.port), FrontierHandler)
+        logger.info('Serving frontier {} on http://{}:{}/'.format(args.path, args.host, args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == 'stats':
+        print(json.dumps(open_store(args.frontier).stats(args.spider)))
+        return 0
+    parser.print_help()
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
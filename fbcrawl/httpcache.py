@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# HTTP cache storage for mbasic.facebook.com, to re-run crawls on the same
+# pages while tuning the selectors.
+#
+# Requests are keyed on their canonical url (tracking parameters such as
+# refid or __tn__ removed, query sorted), bodies are stored zlib-compressed
+# under their sha1, so the same page reached by different links is stored
+# once, and a SQLite index maps every key to its status, headers and body.
+# Every kind of page has its own expiration (HTTPCACHE_MBASIC_TTL): timeline
+# listings change quickly, old posts hardly ever. The login flow and POST
+# requests are never cached, and Set-Cookie headers are dropped: the cache
+# directory can be shared without leaking the session.
+
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+import logging
+import re
+from time import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+#query parameters that change at every visit without changing the page
+VOLATILE_PARAMS = {'refid', '__tn__', '_ft_', 'eav', 'paipv', 'fref', 'ref', 'rc',
+                   'hc_ref', 'gfid', '_rdr', '_rdc', 'ref_component', 'ref_page'}
+VOLATILE_PREFIXES = ('__xts__', '__cft__', '__eep__')
+
+#page kind -> pattern on the canonical url, the first match wins
+PAGE_KINDS = [
+    ('login', re.compile(r'^https?://[^/]+/?(\?.*)?$|/login|/checkpoint|/save-device|/logout|/home\.php')),
+    ('reactions', re.compile(r'/ufi/reaction')),
+    ('replies', re.compile(r'/comment/replies')),
+    ('post', re.compile(r'/story\.php|/permalink\.php|/posts/|/photo\.php|/photos/')),
+    ('event', re.compile(r'/events/\d+')),
+]
+
+DEFAULT_TTL = {
+    'listing': 3600,
+    'post': 30*24*3600,
+    'reactions': 24*3600,
+    'replies': 24*3600,
+    'event': 24*3600,
+}
+
+
+def canonical_url(url):
+    '''
+    Url without fragment and tracking parameters, with a sorted query
+    '''
+    scheme, netloc, path, query, _ = urlsplit(url)
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+              if k not in VOLATILE_PARAMS and not k.startswith(VOLATILE_PREFIXES)]
+    return urlunsplit((scheme.lower(), netloc.lower(), path or '/', urlencode(sorted(params)), ''))
+
+def page_kind(url):
+    for kind, pattern in PAGE_KINDS:
+        if pattern.search(url):
+            return kind
+    return 'listing'
+
+
+class MbasicCacheStorage(object):
+    '''
+    HTTPCACHE_STORAGE backend, see the module docstring
+    '''
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(settings.getdict('HTTPCACHE_MBASIC_TTL'))
+        self.default_ttl = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.level = settings.getint('HTTPCACHE_MBASIC_LEVEL', 6)
+        self.db = None
+
+    def open_spider(self, spider):
+        #index and blobs are shared by all the spiders, they crawl the same pages
+        os.makedirs(os.path.join(self.cachedir, 'blobs'), exist_ok=True)
+        path = os.path.join(self.cachedir, 'mbasic.db')
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                        'key TEXT PRIMARY KEY, url TEXT, kind TEXT, status INTEGER, '
+                        'headers TEXT, body TEXT, stored REAL)')
+        logger.debug('Using mbasic cache storage in {}'.format(path))
+
+    def close_spider(self, spider):
+        self.db.commit()
+        self.db.close()
+
+    def cacheable(self, request):
+        return request.method == 'GET' and page_kind(canonical_url(request.url)) != 'login'
+
+    def expiration(self, kind):
+        return self.ttl.get(kind, self.default_ttl)
+
+    def blob_path(self, digest):
+        return os.path.join(self.cachedir, 'blobs', digest[:2], digest + '.z')
+
+    def retrieve_response(self, spider, request):
+        if not self.cacheable(request):
+            return None
+        key = canonical_url(request.url)
+        row = self.db.execute('SELECT url, kind, status, headers, body, stored FROM responses '
+                              'WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        url, kind, status, headers, digest, stored = row
+        ttl = self.expiration(kind)
+        if 0 < ttl < time() - stored:
+            return None
+        try:
+            with open(self.blob_path(digest), 'rb') as f:
+                body = zlib.decompress(f.read())
+        except (IOError, OSError, zlib.error):
+            return None
+        #entries stored before Set-Cookie was dropped must not replay old cookies
+        headers = Headers({k: v for k, v in json.loads(headers) if k.lower() != 'set-cookie'},
+                          encoding='latin1')
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        if not self.cacheable(request):
+            return
+        key = canonical_url(request.url)
+        digest = hashlib.sha1(response.body).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(zlib.compress(response.body, self.level))
+            os.replace(tmp, path)
+        headers = json.dumps([(k.decode('latin1'), [v.decode('latin1') for v in vs])
+                              for k, vs in response.headers.items() if k.lower() != b'set-cookie'])
+        self.db.execute('INSERT OR REPLACE INTO responses (key, url, kind, status, headers, body, stored) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (key, response.url, page_kind(key), response.status, headers, digest, time()))
+        self.db.commit()
@@ -5,99 +5,252 @@
 # See documentation in:
 # https://doc.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+import re
+from time import perf_counter, time
+
+from scrapy import Request
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.resolver import dnscache
+from scrapy.utils.httpobj import urlparse_cached
+
+from fbcrawl.signals import callback_timed
 
 
 class FbcrawlSpiderMiddleware(object):
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+    '''
+    Time the spider callbacks and send the callback_timed signal.
+    Callbacks are generators: the time spent producing their output is
+    measured, so the middleware must be the closest to the spider (highest
+    order in SPIDER_MIDDLEWARES).
+    '''
+    def __init__(self, crawler):
+        self.crawler = crawler
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
-
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
-
-        # Should return None or raise an exception.
-        return None
+        return cls(crawler)
 
     def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
-
-        # Must return an iterable of Request, dict or Item objects.
-        for i in result:
-            yield i
+        callback = getattr(response.request, 'callback', None) or spider.parse
+        name = getattr(callback, '__name__', 'parse')
+        seconds = 0.0
+        items = requests = 0
+        failed = True
+        result = iter(result)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    output = next(result)
+                except StopIteration:
+                    failed = False
+                    break
+                finally:
+                    seconds += perf_counter() - start
+                if isinstance(output, Request):
+                    requests += 1
+                else:
+                    items += 1
+                yield output
+        finally:
+            self.crawler.signals.send_catch_log(signal=callback_timed, callback=name,
+                                                seconds=seconds, items=items,
+                                                requests=requests, failed=failed,
+                                                spider=spider)
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
 
-        # Should return either None or an iterable of Response, dict
-        # or Item objects.
-        pass
-
-    def process_start_requests(self, start_requests, spider):
-        # Called with the start requests of the spider, and works
-        # similarly to the process_spider_output() method, except
-        # that it doesn’t have a response associated.
-
-        # Must return only requests (not items).
-        for r in start_requests:
-            yield r
-
-    def spider_opened(self, spider):
-        spider.logger.info('Spider opened: %s' % spider.name)
+class FbcrawlDownloaderMiddleware(object):
+    '''
+    Adaptive throttling of the downloader slots (AIMD).
 
+    Every good response adds about one request to the slot concurrency per
+    round trip and shortens the delay (x THROTTLE_DELAY_DECAY); slow
+    responses, errors and 429/503 halve the concurrency, once per round trip
+    (the average latency of the slot) however many of them come back
+    together; a "temporarily blocked" page drops the slot to one request
+    every THROTTLE_BAN_DELAY seconds (doubling on every new block) and
+    retries the request. A checkpoint page means the account needs a manual
+    check, the crawl is closed (THROTTLE_CLOSE_ON_CHECKPOINT).
+    Slots start at THROTTLE_START_CONCURRENCY from their first request.
+    The current decisions are published in the stats under throttle/.
+    '''
+    #"You're Temporarily Blocked" in the supported languages, looked for in
+    #the <title> of the interstitial only: posts and comments quoting the
+    #phrase are in the body of normal pages, whose title is the page name or
+    #the beginning of the post
+    BLOCKED_MARKERS = (b'temporarily blocked', b'temporaneamente bloccat',
+                       b'bloqueado temporalmente', b'temporairement bloqu',
+                       b'temporariamente bloquead')
+    TITLE = re.compile(rb'<title[^>]*>(.{0,200}?)</title>', re.IGNORECASE | re.DOTALL)
+    #the interstitial title is the message alone
+    MAX_BLOCKED_TITLE = 60
 
-class FbcrawlDownloaderMiddleware(object):
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('THROTTLE_ENABLED', True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start_concurrency = settings.getint('THROTTLE_START_CONCURRENCY', 2)
+        self.min_concurrency = settings.getint('THROTTLE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('THROTTLE_MAX_CONCURRENCY',
+                                               settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+        self.increase = settings.getfloat('THROTTLE_INCREASE', 1.0)
+        self.decrease = settings.getfloat('THROTTLE_DECREASE', 0.5)
+        self.target_latency = settings.getfloat('THROTTLE_TARGET_LATENCY', 2.0)
+        self.min_delay = settings.getfloat('DOWNLOAD_DELAY', 0)
+        self.delay_decay = settings.getfloat('THROTTLE_DELAY_DECAY', 0.9)
+        self.ban_delay = settings.getfloat('THROTTLE_BAN_DELAY', 60)
+        self.max_delay = settings.getfloat('THROTTLE_MAX_DELAY', 900)
+        self.max_retries = settings.getint('THROTTLE_MAX_RETRIES', 3)
+        self.close_on_checkpoint = settings.getbool('THROTTLE_CLOSE_ON_CHECKPOINT', True)
+        self.randomize_delay = settings.getbool('RANDOMIZE_DOWNLOAD_DELAY')
+        #slot key -> [concurrency, delay, time of the last decrease, latency]
+        self.slots = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
+        return cls(crawler)
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
+    def page_state(self, response):
+        '''
+        ok, checkpoint, blocked or throttled
+        '''
+        if '/checkpoint' in response.url:
+            return 'checkpoint'
+        if response.status in (429, 503):
+            return 'throttled'
+        match = self.TITLE.search(response.body)
+        title = match.group(1).strip().lower() if match else b''
+        if len(title) <= self.MAX_BLOCKED_TITLE:
+            for marker in self.BLOCKED_MARKERS:
+                if marker in title:
+                    return 'blocked'
+        return 'ok'
 
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+    def process_request(self, request, spider):
+        #the downloader would create the slot at CONCURRENT_REQUESTS_PER_DOMAIN
+        #after this middleware: a new one (or one dropped after being idle)
+        #is created here, under the same key, with the controller state
+        downloader = self.crawler.engine.downloader
+        key = request.meta.get('download_slot')
+        if key is None:
+            key = urlparse_cached(request).hostname or ''
+            if downloader.ip_concurrency:
+                key = dnscache.get(key, key)
+        slot = downloader.slots.get(key)
+        if slot is None:
+            delay = getattr(spider, 'download_delay', self.min_delay)
+            slot = downloader.slots[key] = Slot(self.start_concurrency, delay, self.randomize_delay)
+        state = self.state(key, slot)
+        if slot.concurrency != max(1, int(state[0])) or slot.delay != state[1]:
+            self.apply(key, slot, state)
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        state = self.page_state(response)
+        latency = request.meta.get('download_latency', 0)
+        self.measure(request, latency)
+        if state == 'ok' and response.status < 500 and latency <= 2 * self.target_latency:
+            self.additive_increase(request, latency)
+        elif state == 'ok':
+            self.multiplicative_decrease(request, 'slow' if response.status < 500 else 'errors')
+        elif state == 'throttled':
+            #RetryMiddleware retries them, the slot just slows down
+            self.multiplicative_decrease(request, 'throttled')
+        elif state == 'blocked':
+            self.back_off(request)
+            retries = request.meta.get('throttle_retries', 0)
+            if retries < self.max_retries:
+                self.stats.inc_value('throttle/retries')
+                spider.logger.warning('Temporarily blocked on {}, retrying'.format(request.url))
+                retry = request.replace(dont_filter=True)
+                retry.meta['throttle_retries'] = retries + 1
+                return retry
+            spider.logger.error('Still blocked on {} after {} retries'.format(request.url, retries))
+        else:
+            self.stats.inc_value('throttle/checkpoint')
+            spider.logger.error('Checkpoint page reached ({}), the account needs to be '
+                                'checked in a browser'.format(response.url))
+            if self.close_on_checkpoint:
+                self.crawler.engine.close_spider(spider, 'checkpoint')
+                raise IgnoreRequest('checkpoint')
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+        #timeouts, refused connections: RetryMiddleware retries them
+        self.multiplicative_decrease(request, 'errors')
+
+    def slot(self, request):
+        '''
+        The downloader slot of the request and its controller state
+        '''
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return key, None, None
+        return key, slot, self.state(key, slot)
+
+    def state(self, key, slot):
+        if key not in self.slots:
+            self.slots[key] = [float(self.start_concurrency), slot.delay, 0.0, None]
+        return self.slots[key]
+
+    def measure(self, request, latency):
+        '''
+        Average latency of the slot, the round trip the decreases wait for
+        '''
+        key, slot, state = self.slot(request)
+        if slot is None or not latency:
+            return
+        state[3] = latency if state[3] is None else 0.8 * state[3] + 0.2 * latency
+
+    def once_per_round_trip(self, state):
+        '''
+        True if the slot was not slowed down within the last round trip: the
+        bad responses of one round trip were all sent at the old rate
+        '''
+        now = time()
+        if now - state[2] < (state[3] or self.target_latency):
+            return False
+        state[2] = now
+        return True
+
+    def additive_increase(self, request, latency):
+        key, slot, state = self.slot(request)
+        if slot is None:
+            return
+        #+increase per round trip, i.e. per `concurrency` responses
+        state[0] = min(self.max_concurrency, state[0] + self.increase / state[0])
+        #the delay of a past block fades out in a few dozen responses
+        state[1] = state[1] * self.delay_decay
+        if state[1] < self.min_delay + 0.1:
+            state[1] = self.min_delay
+        self.stats.inc_value('throttle/increase')
+        self.apply(key, slot, state)
+
+    def multiplicative_decrease(self, request, reason):
+        key, slot, state = self.slot(request)
+        self.stats.inc_value('throttle/{}'.format(reason))
+        if slot is None or not self.once_per_round_trip(state):
+            return
+        state[0] = max(self.min_concurrency, state[0] * self.decrease)
+        self.stats.inc_value('throttle/decrease')
+        self.apply(key, slot, state)
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def back_off(self, request):
+        key, slot, state = self.slot(request)
+        self.stats.inc_value('throttle/blocked')
+        if slot is None:
+            return
+        state[0] = self.min_concurrency
+        #the pages blocked together are one block
+        if self.once_per_round_trip(state):
+            state[1] = min(self.max_delay, max(self.ban_delay, state[1] * 2))
+        self.apply(key, slot, state)
 
-    def spider_opened(self, spider):
-        spider.logger.info('Spider opened: %s' % spider.name)
+    def apply(self, key, slot, state):
+        slot.concurrency = max(1, int(state[0]))
+        slot.delay = state[1]
+        self.stats.set_value('throttle/{}/concurrency'.format(key), slot.concurrency)
+        self.stats.set_value('throttle/{}/delay'.format(key), round(slot.delay, 2))
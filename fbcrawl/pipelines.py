@@ -5,9 +5,29 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
-from scrapy.exceptions import DropItem
+import os
+import gzip
+import json
+import time
+import sqlite3
+
+from scrapy.exceptions import DropItem, NotConfigured
 from datetime import datetime
 
+from itemadapter import ItemAdapter
+from twisted.internet import defer, task, reactor
+from scrapy import signals
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from fbcrawl.items import FbcrawlItem, CommentsItem, EventItem
+from fbcrawl.exporters import INT_FIELDS, to_int, to_date, to_str
+from fbcrawl.signals import post_dropped
+
 class FbcrawlPipeline(object):
     def process_item(self, item, spider):
         if item['date'] < datetime(2017,1,1).date():
@@ -16,3 +36,311 @@ class FbcrawlPipeline(object):
             raise DropItem("Dropping element because it's newer than 04/03/2018")
         else:
             return item
+
+
+class SQLitePipeline(object):
+    '''
+    Store the items in a SQLite database, one table per item type.
+    Posts are upserted on their url as normalized by items.url_strip,
+    events on /events/<id> and comments on their commentID (their position
+    and the url of their page change from one crawl to the next), so a new
+    crawl of the same page refreshes the metrics in place. Writes are
+    batched, the WAL journal lets other processes query the database while
+    the crawl is running.
+    Enabled by the SQLITE_PATH setting, e.g. -s SQLITE_PATH=fbcrawl.db
+    '''
+    TABLES = {
+        FbcrawlItem: ('posts', ['source','shared_from','date','text','reactions','likes',
+                                'ahah','love','wow','sigh','grrr','comments','url'], ['url']),
+        CommentsItem: ('comments', ['source','reply_to','date','text','reactions','url',
+                                    'order','commentID'], ['commentID']),
+        EventItem: ('events', ['eventID','name','location','realDate','link','details',
+                               'image','url'], ['url']),
+    }
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.db = None
+        self.pending = {}
+        self.statements = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('SQLITE_PATH')
+        if not path:
+            raise NotConfigured('SQLITE_PATH is not set')
+        return cls(path, crawler.settings.getint('SQLITE_BATCH_SIZE', 500))
+
+    def open_spider(self, spider):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        for table, columns, key in self.TABLES.values():
+            self.db.execute('CREATE TABLE IF NOT EXISTS {} ({}, first_seen REAL, last_seen REAL, '
+                            'PRIMARY KEY ({}))'.format(table, ', '.join('"{}"'.format(c) for c in columns),
+                                                       ', '.join('"{}"'.format(c) for c in key)))
+            self.statements[table] = self.upsert(table, columns, key)
+            self.pending[table] = []
+        self.db.commit()
+
+    @staticmethod
+    def upsert(table, columns, key):
+        names = ', '.join('"{}"'.format(c) for c in columns + ['first_seen', 'last_seen'])
+        values = ', '.join('?' * (len(columns) + 2))
+        update = ', '.join('"{0}"=excluded."{0}"'.format(c) for c in columns + ['last_seen'] if c not in key)
+        return 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT({}) DO UPDATE SET {}'.format(
+            table, names, values, ', '.join('"{}"'.format(c) for c in key), update)
+
+    def row(self, item, columns):
+        values = []
+        for c in columns:
+            value = item.get(c)
+            if c in INT_FIELDS:
+                number = to_int(value)
+                value = number if number is not None else to_str(value)
+            elif c == 'date':
+                day = to_date(value)
+                value = day.isoformat() if day is not None else to_str(value)
+            else:
+                value = to_str(value)
+            values.append(value)
+        now = time.time()
+        return values + [now, now]
+
+    def process_item(self, item, spider):
+        for cls, (table, columns, key) in self.TABLES.items():
+            if isinstance(item, cls):
+                self.pending[table].append(self.row(item, columns))
+                if len(self.pending[table]) >= self.batch_size:
+                    self.flush()
+                break
+        return item
+
+    def flush(self):
+        with self.db:
+            for table, rows in self.pending.items():
+                if rows:
+                    self.db.executemany(self.statements[table], rows)
+                    del rows[:]
+
+    def close_spider(self, spider):
+        self.flush()
+        self.db.close()
+
+
+class JsonLinesSinkPipeline(object):
+    '''
+    Write the items as compressed JSON lines in rotating segments.
+    A segment is written as NAME.part and renamed when it is closed, after
+    SINK_ROTATE_BYTES bytes of JSON (before compression) or
+    SINK_ROTATE_SECONDS seconds, then it is appended to manifest.jsonl:
+    consumers can process the segments listed there while the crawl goes on.
+    Enabled by the SINK_DIR setting, e.g. -s SINK_DIR=output
+    '''
+    def __init__(self, directory, compression='auto', rotate_bytes=1024*1024*1024,
+                 rotate_seconds=3600):
+        if compression == 'auto':
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression not in ('zstd', 'gzip'):
+            raise NotConfigured('SINK_COMPRESSION must be auto, zstd or gzip')
+        if compression == 'zstd' and zstandard is None:
+            raise NotConfigured('SINK_COMPRESSION=zstd requires zstandard: pip install zstandard')
+        self.directory = directory
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.encoder = ScrapyJSONEncoder(ensure_ascii=False)
+        self.segment = None
+        self.count = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get('SINK_DIR')
+        if not directory:
+            raise NotConfigured('SINK_DIR is not set')
+        return cls(directory,
+                   compression=settings.get('SINK_COMPRESSION', 'auto'),
+                   rotate_bytes=settings.getint('SINK_ROTATE_BYTES', 1024*1024*1024),
+                   rotate_seconds=settings.getint('SINK_ROTATE_SECONDS', 3600))
+
+    def open_spider(self, spider):
+        os.makedirs(self.directory, exist_ok=True)
+        self.prefix = '{}-{}'.format(spider.name, time.strftime('%Y%m%dT%H%M%S'))
+
+    def open_segment(self):
+        extension = '.jsonl.zst' if self.compression == 'zstd' else '.jsonl.gz'
+        name = '{}-{:05d}{}'.format(self.prefix, self.count, extension)
+        raw = open(os.path.join(self.directory, name + '.part'), 'wb')
+        if self.compression == 'zstd':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            stream = gzip.GzipFile(fileobj=raw, mode='wb')
+        self.segment = {'name': name, 'raw': raw, 'stream': stream,
+                        'opened': time.time(), 'items': 0, 'size': 0}
+        self.count += 1
+
+    def close_segment(self):
+        segment, self.segment = self.segment, None
+        segment['stream'].close()
+        segment['raw'].close()
+        path = os.path.join(self.directory, segment['name'])
+        os.replace(path + '.part', path)
+        entry = {'file': segment['name'], 'items': segment['items'],
+                 'bytes': os.path.getsize(path), 'uncompressed': segment['size'], 'compression': self.compression,
+                 'opened': segment['opened'], 'closed': time.time()}
+        with open(os.path.join(self.directory, 'manifest.jsonl'), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def process_item(self, item, spider):
+        if self.segment is None:
+            self.open_segment()
+        line = (self.encoder.encode(ItemAdapter(item).asdict()) + '\n').encode('utf-8')
+        self.segment['stream'].write(line)
+        self.segment['items'] += 1
+        #the compressors buffer their output, count the bytes fed to them
+        self.segment['size'] += len(line)
+        if self.segment['size'] >= self.rotate_bytes or \
+           time.time() - self.segment['opened'] >= self.rotate_seconds:
+            self.close_segment()
+        return item
+
+    def close_spider(self, spider):
+        if self.segment is not None:
+            self.close_segment()
+
+
+class ReorderPipeline(object):
+    '''
+    Release the items in the order their posts were discovered (the seq
+    field), while the requests are downloaded in whatever order is fastest.
+    An item that arrives early waits, as a pending Deferred, for the ones
+    before it; items without seq (comments) go straight through.
+
+    The number of waiting items is bounded: scrapy keeps the response of
+    every waiting item in memory and stops downloading when they are too
+    many (SCRAPER_SLOT_MAX_ACTIVE_SIZE), so the missing post could never be
+    fetched. When REORDER_MAX_PENDING items are waiting, when the oldest
+    waited REORDER_TIMEOUT seconds or when scrapy is backing out or closing
+    the spider, the gap is skipped; if the missing item shows up later it is
+    released right away.
+
+    A resumed job (JOBDIR) starts from the seq saved with the spider state:
+    the posts queued by the previous run come through as late items.
+    '''
+    def __init__(self, crawler, max_pending=500, timeout=60):
+        self.crawler = crawler
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.next = 0
+        self.waiting = {}
+        self.skipped = set()
+        self.loop = None
+        self.release_call = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        #with a shared frontier the posts of a worker are not a sequence
+        if settings.get('FRONTIER'):
+            raise NotConfigured
+        pipeline = cls(crawler,
+                       max_pending=settings.getint('REORDER_MAX_PENDING', 500),
+                       timeout=settings.getfloat('REORDER_TIMEOUT', 60))
+        crawler.signals.connect(pipeline.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(pipeline.spider_error, signal=signals.spider_error)
+        crawler.signals.connect(pipeline.post_dropped, signal=post_dropped)
+        crawler.signals.connect(pipeline.spider_opened, signal=signals.spider_opened)
+        return pipeline
+
+    def spider_opened(self, spider):
+        #after scrapy has restored the state of a resumed job
+        self.next = getattr(spider, 'seq', 0)
+
+    def open_spider(self, spider):
+        self.loop = task.LoopingCall(self.check)
+        self.loop.start(1, now=False)
+
+    def close_spider(self, spider):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        while self.waiting:
+            self.skip_gap()
+            self.release()
+
+    def process_item(self, item, spider):
+        seq = item.get('seq')
+        if seq is None:
+            return item
+        if seq < self.next:
+            self.inc_stats('reorder/late')
+            return item
+        if seq in self.waiting:
+            #a resumed job may number a post again, do not hold it twice
+            self.inc_stats('reorder/duplicate')
+            return item
+        dfd = defer.Deferred()
+        self.waiting[seq] = (dfd, item, time.time())
+        if len(self.waiting) > self.max_pending:
+            self.skip_gap()
+        self.schedule_release()
+        return dfd
+
+    def schedule_release(self):
+        '''
+        Release on the next reactor turn: a Deferred fired inside
+        process_item would let the following items reach the feed before
+        the current one
+        '''
+        if self.release_call is None or not self.release_call.active():
+            self.release_call = reactor.callLater(0, self.release)
+
+    def release(self):
+        while True:
+            if self.next in self.skipped:
+                self.skipped.discard(self.next)
+            elif self.next in self.waiting:
+                dfd, item, _ = self.waiting.pop(self.next)
+                dfd.callback(item)
+            else:
+                break
+            self.next += 1
+
+    def skip_gap(self):
+        '''
+        Give up on the missing items before the first waiting one
+        '''
+        first = min(self.waiting)
+        self.inc_stats('reorder/skipped', first - self.next)
+        self.skipped = set(s for s in self.skipped if s > first)
+        self.next = first
+
+    def check(self):
+        if not self.waiting:
+            return
+        oldest = min(arrived for _, _, arrived in self.waiting.values())
+        slot = getattr(getattr(self.crawler.engine, 'scraper', None), 'slot', None)
+        #the spider is closing (paused job, closespider): nothing more will come
+        closing = getattr(getattr(self.crawler.engine, 'slot', None), 'closing', None) is not None
+        if time.time() - oldest > self.timeout or closing or (slot is not None and slot.needs_backout()):
+            self.skip_gap()
+            self.release()
+
+    def drop(self, seq):
+        if seq is not None and seq >= self.next:
+            self.skipped.add(seq)
+            self.schedule_release()
+
+    def request_dropped(self, request, spider):
+        self.drop(request.meta.get('seq'))
+
+    def spider_error(self, failure, response, spider):
+        self.drop(response.meta.get('seq'))
+
+    def post_dropped(self, seq, spider):
+        self.drop(seq)
+
+    def inc_stats(self, key, count=1):
+        if count:
+            self.crawler.stats.inc_value(key, count)
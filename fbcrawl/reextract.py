@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Offline re-extraction of an archived crawl (see fbcrawl/archive.py).
+#
+# The callbacks of the spider run again, with the current selectors, over
+# the pages archived by a live run: every listing page (the records answered
+# by parse_page) is a task, and inside a task the requests yielded by the
+# callbacks are answered from the archive instead of the network, down to
+# the posts, reactions and replies of that page. Requests for other listing
+# pages are tasks of their own and the login flow is never replayed. Tasks
+# run on a pool of processes, the items are written in task order.
+#
+#     python -m fbcrawl.reextract ARCHIVE_DIR -o DUMPFILE.csv
+#     python -m fbcrawl.reextract ARCHIVE_DIR -o DUMPFILE.parquet --run fb-20190401T120000 -j 8
+#
+# The format is taken from the extension of the output, as for scrapy -o.
+
+import os
+import sys
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from twisted.python.failure import Failure
+from itemadapter import ItemAdapter
+
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.misc import load_object, arg_to_iter
+from scrapy.utils.project import get_project_settings
+
+from fbcrawl.archive import ArchiveReader
+
+logger = logging.getLogger('fbcrawl.reextract')
+
+#callbacks whose pages start a task
+ROOT_CALLBACKS = ('parse_page',)
+#callbacks of the login flow, never replayed
+LOGIN_CALLBACKS = ('parse', 'parse_home', 'parse_session')
+
+#spiders need credentials and a target to be instantiated, nothing is sent
+SPIDER_KWARGS = {'email': 'archive', 'password': 'archive', 'page': 'archive'}
+
+_reader = None
+_spider = None
+_run = None
+
+
+def load_spider(name, args):
+    settings = get_project_settings()
+    spidercls = SpiderLoader.from_settings(settings).load(name)
+    kwargs = dict(SPIDER_KWARGS)
+    kwargs.update(args)
+    return spidercls(**kwargs)
+
+def init_worker(path, run, spider, args, level):
+    global _reader, _spider, _run
+    logging.basicConfig(level=level, format='%(message)s')
+    logging.getLogger('scrapy').setLevel(logging.WARNING)
+    logging.getLogger(spider).setLevel(level)
+    _reader = ArchiveReader(path)
+    _run = run
+    _spider = load_spider(spider, args)
+
+def fail(request, reason):
+    '''
+    Errback output for a request the live run did not answer
+    '''
+    if request.errback is None:
+        return []
+    failure = Failure(IgnoreRequest(reason))
+    failure.request = request
+    return request.errback(failure)
+
+def answer(request, stats):
+    '''
+    Callback output for a request, answered from the archive
+    '''
+    record = _reader.lookup(_run, request.url)
+    if record is None:
+        stats['missing'] += 1
+        return fail(request, 'Not archived: {}'.format(request.url))
+    try:
+        header, body = _reader.read(record)
+    except IOError as e:
+        stats['missing'] += 1
+        return fail(request, str(e))
+    if not 200 <= header['status'] < 300:
+        stats['failed'] += 1
+        return fail(request, 'Archived with status {}: {}'.format(header['status'], request.url))
+    #keep the discovery order of the live run, the items line up with its output
+    if 'seq' in header['meta'] and 'seq' in request.meta:
+        request.meta['seq'] = header['meta']['seq']
+        if isinstance(request.meta.get('item'), dict):
+            request.meta['item']['seq'] = header['meta']['seq']
+    stats['pages'] += 1
+    callback = request.callback or _spider.parse
+    return callback(_reader.response(header, body, request))
+
+def extract(record):
+    '''
+    Items of a task, the listing page record and everything it leads to, as
+    (chain, item): chain is the url of the request of the listing page the
+    item comes from, None for the items of the listing page itself
+    '''
+    stats = {'pages': 1, 'missing': 0, 'failed': 0, 'duplicates': 0, 'errors': 0}
+    try:
+        header, body = _reader.read(record)
+    except IOError as e:
+        logger.warning(str(e))
+        stats.update(pages=0, missing=1)
+        return [], stats
+    if header['lang']:
+        _spider.lang = header['lang']
+    request = Request(header['request_url'], callback=getattr(_spider, header['callback']),
+                      meta=header['meta'], dont_filter=True)
+    items = []
+    seen = set()
+    #depth first, a post is done with its reactions before the next one
+    stack = [(None, iter(arg_to_iter(request.callback(_reader.response(header, body, request)))))]
+    while stack:
+        chain, outputs = stack[-1]
+        try:
+            out = next(outputs, None)
+        except Exception:
+            #a spider_error of the live run, the rest of the callback is lost
+            logger.exception('Error extracting {}'.format(header['url']))
+            stats['errors'] += 1
+            out = None
+        if out is None:
+            stack.pop()
+        elif not isinstance(out, Request):
+            items.append((chain, ItemAdapter(out).asdict()))
+        elif getattr(out.callback, '__name__', 'parse') not in ROOT_CALLBACKS + LOGIN_CALLBACKS:
+            #the duplicate filter of the live run
+            if not out.dont_filter and not out.meta.get('revisit'):
+                if out.url in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(out.url)
+            stack.append((chain or out.url, iter(arg_to_iter(answer(out, stats)))))
+    return items, stats
+
+def exporter_for(output, settings, spidercls):
+    fmt = os.path.splitext(output)[1].lstrip('.')
+    exporters = settings.getwithbase('FEED_EXPORTERS')
+    if fmt not in exporters:
+        raise ValueError('Unknown output format "{}", choose one of {}'.format(fmt, ', '.join(sorted(exporters))))
+    fields = (getattr(spidercls, 'custom_settings', None) or {}).get('FEED_EXPORT_FIELDS') \
+             or settings.getlist('FEED_EXPORT_FIELDS') or None
+    return load_object(exporters[fmt]), {'fields_to_export': fields,
+                                         'encoding': settings.get('FEED_EXPORT_ENCODING')}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract the items again from an archived crawl')
+    parser.add_argument('archive', help='ARCHIVE_DIR of the live run')
+    parser.add_argument('-o', '--output', required=True, help='output file, the extension sets the format')
+    parser.add_argument('--run', help='archived run to extract, the last one by default')
+    parser.add_argument('-s', '--spider', help='spider of the run, to pick its last run')
+    parser.add_argument('-a', dest='args', action='append', default=[], metavar='NAME=VALUE',
+                        help='spider argument, as for scrapy crawl')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes, 1 runs in this process')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the logs of the callbacks')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'fbcrawl.settings')
+    level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    reader = ArchiveReader(args.archive)
+    runs = reader.runs(args.spider)
+    if not runs:
+        logger.error('No archived runs in "{}"'.format(args.archive))
+        return 1
+    run = args.run or runs[-1][0]
+    found = reader.spider(run)
+    if found is None:
+        logger.error('Run "{}" not found, archived runs: {}'.format(run, ', '.join(r[0] for r in runs)))
+        return 1
+    spider, targets = found
+    roots = []
+    for callback in ROOT_CALLBACKS:
+        roots += reader.records(run, callback)
+    roots.sort()
+    reader.close()
+    #the targets of the live run, the spider keeps per target counters
+    spider_args = {'page': ','.join(targets)} if targets else {}
+    spider_args.update(arg.split('=', 1) for arg in args.args)
+
+    settings = get_project_settings()
+    spidercls = SpiderLoader.from_settings(settings).load(spider)
+    exportercls, kwargs = exporter_for(args.output, settings, spidercls)
+    logger.info('Extracting {} listing pages of run {} ({}) on {} processes'.format(
+        len(roots), run, spider, args.jobs))
+
+    totals = {'items': 0, 'pages': 0, 'missing': 0, 'failed': 0, 'duplicates': 0, 'errors': 0}
+    #chains already extracted by an earlier task, filtered as in the live run
+    chains = set()
+    initargs = (args.archive, run, spider, spider_args, level)
+    with open(args.output, 'wb') as f:
+        exporter = exportercls(f, **kwargs)
+        exporter.start_exporting()
+        if args.jobs > 1:
+            pool = ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=initargs)
+            results = pool.map(extract, roots, chunksize=max(1, len(roots) // (args.jobs * 8)))
+        else:
+            init_worker(*initargs)
+            pool, results = None, map(extract, roots)
+        for items, stats in results:
+            new = set()
+            for chain, item in items:
+                if chain in chains:
+                    totals['duplicates'] += 1
+                    continue
+                new.add(chain)
+                exporter.export_item(item)
+                totals['items'] += 1
+            chains |= new - {None}
+            for key in stats:
+                totals[key] += stats[key]
+        if pool is not None:
+            pool.shutdown()
+        exporter.finish_exporting()
+
+    logger.info('{items} items from {pages} archived pages, {duplicates} duplicates filtered, '
+                '{missing} requests not archived, {failed} archived with an error status, '
+                '{errors} callback errors'.format(**totals))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Persistent index of the posts already crawled, used by the incremental mode.
+#
+# Posts are keyed by their url normalized with items.url_strip, the same value
+# exported in the url column, together with the last seen metrics: all of
+# them when the post is crawled, the comments only when it is met again on a
+# listing page.
+
+import time
+import sqlite3
+
+from fbcrawl.items import url_strip
+
+
+def post_key(href):
+    '''
+    Index key of a post link, as found in the listing pages
+    '''
+    return url_strip([href])
+
+
+class SeenIndex(object):
+    '''
+    SQLite table of the known posts, keys are also cached in memory
+    '''
+    def __init__(self, path, commit_every=100):
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS posts ('
+                        'key TEXT PRIMARY KEY, first_seen REAL, last_seen REAL, '
+                        'reactions TEXT, comments TEXT)')
+        self.keys = set(row[0] for row in self.db.execute('SELECT key FROM posts'))
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, reactions=None, comments=None):
+        '''
+        Insert a post or refresh its metrics
+        '''
+        now = time.time()
+        self.db.execute('INSERT INTO posts (key, first_seen, last_seen, reactions, comments) '
+                        'VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+                        'last_seen=excluded.last_seen, reactions=excluded.reactions, '
+                        'comments=excluded.comments',
+                        (key, now, now, _text(reactions), _text(comments)))
+        self.keys.add(key)
+        self.written()
+
+    def touch(self, key, comments=None):
+        '''
+        Refresh the last seen time of a known post and, if given, its comments
+        '''
+        self.db.execute('UPDATE posts SET last_seen = ?, comments = COALESCE(?, comments) WHERE key = ?',
+                        (time.time(), _text(comments), key))
+        self.written()
+
+    def written(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    return None if value is None else str(value)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# On-disk store for the authenticated session.
+#
+# After a successful login the cookie jar and the detected interface language
+# are saved as JSON, the next run sends them with its first request and, if
+# facebook still considers them valid, goes straight to the target pages.
+
+import os
+import json
+import time
+
+from scrapy.downloadermiddlewares.cookies import CookiesMiddleware
+
+
+class SessionStore(object):
+    '''
+    Cookies and lang of one account, saved in a JSON file
+    '''
+    def __init__(self, path, max_age=7*24*3600):
+        self.path = path
+        self.max_age = max_age
+
+    def load(self, email):
+        '''
+        Return the saved session of the account, None if missing or too old
+        '''
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                session = json.load(f)
+        except ValueError:
+            return None
+        if session.get('email') != email or not session.get('cookies'):
+            return None
+        if time.time() - session.get('saved', 0) > self.max_age:
+            return None
+        return session
+
+    def save(self, email, lang, cookies):
+        session = {'email': email, 'lang': lang, 'cookies': cookies, 'saved': time.time()}
+        tmp = self.path + '.tmp'
+        #the cookies log into the account: readable by the owner only
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(session, f)
+        #atomic replace, a crash never leaves a truncated session behind
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def crawler_cookiejar(crawler, key=None):
+    '''
+    The cookie jar used by scrapy's CookiesMiddleware for the given
+    'cookiejar' meta key, None if the middleware is disabled
+    '''
+    for mw in crawler.engine.downloader.middleware.middlewares:
+        if isinstance(mw, CookiesMiddleware):
+            return mw.jars[key]
+    return None
+
+def jar_to_list(jar):
+    '''
+    Cookies of a scrapy CookieJar as a list of dicts, the format accepted by
+    the cookies argument of scrapy.Request
+    '''
+    return [{'name': c.name, 'value': c.value, 'domain': c.domain,
+             'path': c.path, 'secure': c.secure, 'expires': c.expires}
+            for c in jar.jar]
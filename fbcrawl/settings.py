@@ -28,7 +28,8 @@ CONCURRENT_REQUESTS = 16
 # See also autothrottle settings and docs
 #DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
+# (the default per-domain limit is 8, everything is on mbasic.facebook.com)
+CONCURRENT_REQUESTS_PER_DOMAIN = 16
 #CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -45,27 +46,95 @@ CONCURRENT_REQUESTS = 16
 
 # Enable or disable spider middlewares
 # See https://doc.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    'fbcrawl.middlewares.FbcrawlSpiderMiddleware': 543,
-#}
+# Times the callbacks for the metrics extension, it must stay the closest
+# to the spider (highest number)
+SPIDER_MIDDLEWARES = {
+    'fbcrawl.middlewares.FbcrawlSpiderMiddleware': 950,
+    'fbcrawl.frontier.FrontierMiddleware': 25,
+}
 
 # Enable or disable downloader middlewares
 # See https://doc.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    'fbcrawl.middlewares.FbcrawlDownloaderMiddleware': 543,
-#}
+# The throttling controller sits between RetryMiddleware (550) and
+# RedirectMiddleware (600): it sees the final page of redirects and the
+# 429/503 responses before they are retried
+DOWNLOADER_MIDDLEWARES = {
+    'fbcrawl.middlewares.FbcrawlDownloaderMiddleware': 585,
+    'fbcrawl.frontier.FrontierMiddleware': 50,
+}
+
+# Shared frontier (fbcrawl/frontier.py): the requests are queued in a store
+# shared by many workers, a SQLite file or a frontier served over HTTP
+# (python -m fbcrawl.frontier serve frontier.db), disabled until it is set.
+# The frontier middlewares acknowledge the requests once done, their numbers
+# are below HttpErrorMiddleware (50) and RetryMiddleware (550) so that they
+# see the final outcome
+SCHEDULER = 'fbcrawl.frontier.FrontierScheduler'
+#FRONTIER = 'frontier.db'
+#FRONTIER = 'http://127.0.0.1:6082'
+FRONTIER_LEASE_SIZE = 4
+FRONTIER_LEASE_TTL = 300
+FRONTIER_POLL_INTERVAL = 1.0
+FRONTIER_BATCH_SIZE = 100
+FRONTIER_FLUSH_INTERVAL = 0.5
+FRONTIER_SEEN_MAX = 5000000
+
+# Resumable jobs: with -s JOBDIR=crawls/NAME the progress of the spider, the
+# login session and the requests are kept in the job directory, stop with a
+# single Ctrl-C and run the same command to resume. With FRONTIER_JOBDIR the
+# requests go in a frontier of the job (JOBDIR/frontier.db) that survives a
+# crash too, slower than the disk queues of scrapy, and the progress of the
+# spider is saved every STATE_SNAPSHOT_INTERVAL seconds along with them
+FRONTIER_JOBDIR = False
+STATE_SNAPSHOT_INTERVAL = 60
 
 # Enable or disable extensions
 # See https://doc.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+    'fbcrawl.extensions.CrawlMetrics': 500,
+    'fbcrawl.archive.PageArchive': 600,
+    'fbcrawl.extensions.StateSnapshot': 700,
+}
+
+# Archive of the downloaded pages, disabled until a directory is given
+# (-s ARCHIVE_DIR=archive), re-extract with python -m fbcrawl.reextract
+#ARCHIVE_DIR = 'archive'
+ARCHIVE_SEGMENT_BYTES = 256*1024*1024    # compressed
+ARCHIVE_LEVEL = 6
+
+# Live metrics, collected on every crawl and published only on request: JSON on
+# http://127.0.0.1:METRICS_PORT/ if a port is given (-s METRICS_PORT=6081)
+# and, if METRICS_FILE is set, a snapshot every METRICS_INTERVAL seconds
+METRICS_ENABLED = True
+#METRICS_PORT = 6081
+#METRICS_FILE = 'metrics.jsonl'
+METRICS_INTERVAL = 10
 
 # Configure item pipelines
 # See https://doc.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
+ITEM_PIPELINES = {
+    'fbcrawl.pipelines.ReorderPipeline': 100,
 #    'fbcrawl.pipelines.FbcrawlPipeline': 300,
-#}
+    'fbcrawl.pipelines.SQLitePipeline': 800,
+    'fbcrawl.pipelines.JsonLinesSinkPipeline': 900,
+}
+
+# Items are written in discovery order, an item waits at most
+# REORDER_TIMEOUT seconds for the ones before it
+REORDER_MAX_PENDING = 500
+REORDER_TIMEOUT = 60
+
+# SQLite storage, disabled until a path is given (-s SQLITE_PATH=fbcrawl.db)
+#SQLITE_PATH = 'fbcrawl.db'
+SQLITE_BATCH_SIZE = 500
+
+# Compressed JSON lines segments, disabled until a directory is given
+# (-s SINK_DIR=output), zstd is used if the zstandard package is installed
+#SINK_DIR = 'output'
+SINK_COMPRESSION = 'auto'
+SINK_ROTATE_BYTES = 1024*1024*1024    # uncompressed
+SINK_ROTATE_SECONDS = 3600
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://doc.scrapy.org/en/latest/topics/autothrottle.html
@@ -80,6 +149,27 @@ CONCURRENT_REQUESTS = 16
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
+# Adaptive throttling (fbcrawl.middlewares.FbcrawlDownloaderMiddleware), use
+# it instead of AUTOTHROTTLE: the concurrency starts at 2, grows by about one
+# request per round trip while latency stays under THROTTLE_TARGET_LATENCY
+# seconds and is halved on errors; a "temporarily blocked" page waits
+# THROTTLE_BAN_DELAY seconds (doubled on every new block, up to
+# THROTTLE_MAX_DELAY)
+THROTTLE_ENABLED = True
+THROTTLE_START_CONCURRENCY = 2
+THROTTLE_MAX_CONCURRENCY = 16
+THROTTLE_TARGET_LATENCY = 2.0
+THROTTLE_BAN_DELAY = 60
+THROTTLE_MAX_DELAY = 900
+THROTTLE_CLOSE_ON_CHECKPOINT = True
+
+# Parse the pages bigger than PARSE_OFFLOAD_BYTES in a pool of workers
+# ('thread' or 'process') instead of the reactor thread, so that downloads
+# go on meanwhile; PARSE_WORKERS defaults to the number of cores
+#PARSE_POOL = 'thread'
+#PARSE_WORKERS = 4
+PARSE_OFFLOAD_BYTES = 256*1024
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://doc.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 #HTTPCACHE_ENABLED = True
@@ -87,8 +177,32 @@ CONCURRENT_REQUESTS = 16
 #HTTPCACHE_DIR = 'httpcache'
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# Cache tuned for mbasic (fbcrawl/httpcache.py), turn it on with
+# -s HTTPCACHE_ENABLED=1; expiration in seconds for every kind of page,
+# 0 never expires, login pages and POST requests are never cached
+HTTPCACHE_STORAGE = 'fbcrawl.httpcache.MbasicCacheStorage'
+HTTPCACHE_MBASIC_TTL = {
+    'listing': 3600,
+    'post': 30*24*3600,
+    'reactions': 24*3600,
+    'replies': 24*3600,
+    'event': 24*3600,
+}
 #FEED_EXPORT_FIELDS = ["source", "date", "text", "reactions","likes","ahah","love","wow","sigh","grrr","comments","url"] # specifies the order of the column to export as CSV
 FEED_EXPORT_ENCODING = 'utf-8'
-DUPEFILTER_DEBUG = True
+
+# Duplicate filter in a Bloom filter (fbcrawl/dupefilters.py): bounded
+# memory, about 3.6MB for DUPEFILTER_CAPACITY = 1000000 requests at one
+# false positive in a million. Requests with meta['revisit'] go through
+DUPEFILTER_CLASS = 'fbcrawl.dupefilters.BloomDupeFilter'
+DUPEFILTER_CAPACITY = 1000000
+DUPEFILTER_ERROR_RATE = 1e-6
+DUPEFILTER_DEBUG = False
 LOG_LEVEL = 'INFO'
 #LOG_LEVEL = 'DEBUG'
+
+# Parquet feeds (-o DUMPFILE.parquet), needs pyarrow
+FEED_EXPORTERS = {
+    'parquet': 'fbcrawl.exporters.ParquetItemExporter',
+}
+FEED_PARQUET_ROW_GROUP_SIZE = 10000
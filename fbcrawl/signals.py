@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+# Custom signals sent by the spiders, connect to them with
+# crawler.signals.connect(handler, signal=fbcrawl.signals.post_dropped)
+
+#a post request failed and its item will never be scraped, args: seq, spider
+post_dropped = object()
+
+#a callback has been run, args: callback (name), seconds, items, requests,
+#failed, spider -- sent by middlewares.FbcrawlSpiderMiddleware
+callback_timed = object()
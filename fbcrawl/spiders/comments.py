@@ -1,141 +1,145 @@
 import scrapy
 
-from scrapy.loader import ItemLoader
 from fbcrawl.spiders.fbcrawl import FacebookSpider
 from fbcrawl.items import CommentsItem
+from fbcrawl.xpaths import XPATHS
 
 
 class CommentsSpider(FacebookSpider):
     """
     Parse FB comments, given a post (needs credentials)
-    """    
+    """
     name = "comments"
     custom_settings = {
         'FEED_EXPORT_FIELDS': ['source','reply_to','date','reactions','text', \
-                               'url'],
-        'DUPEFILTER_CLASS' : 'scrapy.dupefilters.BaseDupeFilter',
-        'CONCURRENT_REQUESTS':1, 
+                               'url','order','commentID'],
     }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args,**kwargs)
 
+    @staticmethod
+    def order_key(page, thread, reply_page=0, position=0):
+        '''
+        Sortable position of a comment in the post:
+            page -> comments page, 0 is the first one, then the see_next pages
+            thread -> position of the comment in its page
+            reply_page -> replies page of the thread, then the "back" pages
+            position -> position of the reply in its page, 0 is the root
+        '''
+        return '{:04d}.{:04d}.{:04d}.{:04d}'.format(page, thread, reply_page, position)
+
     def parse_page(self, response):
         '''
-        parse page does multiple things:
-            1) loads replied-to-comments page one-by-one (for DFS)
+        parse page does multiple things in a single pass over the comments:
+            1) requests all the replied-to-comments pages at once
             2) retrieves not-replied-to comments
+            3) requests the previous comments page
+        every page is downloaded once and the requests are independent,
+        they can be crawled concurrently with the duplicate filter on
         '''
-        #loads replied-to comments pages
-        path = './/div[string-length(@class) = 2 and count(@id)=1 and contains("0123456789", substring(@id,1,1)) and .//div[contains(@id,"comment_replies")]]'  + '['+ str(response.meta['index']) + ']'
-        for reply in response.xpath(path):
-            source = reply.xpath('.//h3/a/text()').extract()
-            answer = reply.xpath('.//a[contains(@href,"repl")]/@href').extract()
-            ans = response.urljoin(answer[::-1][0])
-            self.logger.info('{} nested comment @ page {}'.format(str(response.meta['index']),ans))
-            yield scrapy.Request(ans,
-                                 callback=self.parse_reply,
-                                 meta={'reply_to':source,
-                                       'url':response.url,
-                                       'index':response.meta['index'],
-                                       'flag':'init'})
-        #loads regular comments     
-        if not response.xpath(path):
-            path2 = './/div[string-length(@class) = 2 and count(@id)=1 and contains("0123456789", substring(@id,1,1)) and not(.//div[contains(@id,"comment_replies")])]'
-            for i,reply in enumerate(response.xpath(path2)):
-                self.logger.info('{} regular comment @ page {}'.format(i,response.url))
-                new = ItemLoader(item=CommentsItem(),selector=reply)
-                new.context['lang'] = self.lang           
-                new.add_xpath('source','.//h3/a/text()')  
-                new.add_xpath('text','.//div[h3]/div[1]//text()')
-                new.add_xpath('date','.//abbr/text()')
-                new.add_xpath('reactions','.//a[contains(@href,"reaction/profile")]//text()')
-                new.add_value('url',response.url)
-                yield new.load_item()
-            
+        return self.extract(self.comments_records, response, self.parse_comments)
+
+    @staticmethod
+    def comment_values(node, text='comment.text'):
+        return {'commentID': XPATHS['comment.id'].extract(node),
+                'source': XPATHS['comment.source'].extract(node),
+                'text': XPATHS[text].extract(node),
+                'date': XPATHS['comment.date'].extract(node),
+                'reactions': XPATHS['comment.reactions'].extract(node)}
+
+    @staticmethod
+    def comments_records(response):
+        '''
+        Plain records of a comments page: the comments (or the link to
+        their replies) and the links to the previous comments. Pure
+        function, it may run in a worker
+        '''
+        comments = []
+        for reply in XPATHS['comments.all'].select(response):
+            if XPATHS['comments.has_replies'](reply)[0]:
+                comments.append({'commentID': XPATHS['comment.id'].extract(reply),
+                                 'source': XPATHS['comment.source'].extract(reply),
+                                 'replies': XPATHS['comments.reply_link'].extract(reply)})
+            else:
+                comments.append(CommentsSpider.comment_values(reply))
+        return {'comments': comments,
+                'see_next': [XPATHS['comments.see_next_link'].extract(next_page)
+                             for next_page in XPATHS['comments.see_next'].select(response)]}
+
+    def parse_comments(self, response, records):
+        page = response.meta.get('page', 0)
+        for thread,values in enumerate(records['comments']):
+            #loads replied-to comments pages
+            if 'replies' in values:
+                ans = response.urljoin(values['replies'][::-1][0])
+                self.logger.info('{} nested comment @ page {}'.format(thread,ans))
+                yield scrapy.Request(ans,
+                                     callback=self.parse_reply,
+                                     meta={'reply_to':values['source'],
+                                           'comment_id':values['commentID'],
+                                           'page':page,
+                                           'thread':thread,
+                                           'reply_page':0,
+                                           'flag':'init'})
+                continue
+            #loads regular comments
+            self.logger.info('{} regular comment @ page {}'.format(thread,response.url))
+            values.update(url=response.url, order=self.order_key(page,thread))
+            yield self.item_loader(values, CommentsItem).load_item()
+
         #previous comments
-        if not response.xpath(path):
-            for next_page in response.xpath('.//div[contains(@id,"see_next")]'):
-                new_page = next_page.xpath('.//@href').extract()
-                new_page = response.urljoin(new_page[0])
-                self.logger.info('New page to be crawled {}'.format(new_page))
-                yield scrapy.Request(new_page,
-                                     callback=self.parse_page,
-                                     meta={'index':1})        
-        
+        for new_page in records['see_next']:
+            new_page = response.urljoin(new_page[0])
+            self.logger.info('New page to be crawled {}'.format(new_page))
+            yield scrapy.Request(new_page,
+                                 callback=self.parse_page,
+                                 meta={'page':page+1})
+
     def parse_reply(self,response):
         '''
         parse reply to comments, root comment is added if flag
         '''
-        if response.meta['flag'] == 'init':
-            #parse root comment
-            for root in response.xpath('//div[contains(@id,"root")]/div/div/div[count(@id)!=1 and contains("0123456789", substring(@id,1,1))]'): 
-                new = ItemLoader(item=CommentsItem(),selector=root)
-                new.context['lang'] = self.lang           
-                new.add_xpath('source', './/h3/a/text()')
-                new.add_value('reply_to','ROOT')
-                new.add_xpath('text','.//div[1]//text()')
-                new.add_xpath('date','.//abbr/text()')
-                new.add_xpath('reactions','.//a[contains(@href,"reaction/profile")]//text()')
-                new.add_value('url',response.url)
-                yield new.load_item()
-            #parse all replies in the page
-            for reply in response.xpath('//div[contains(@id,"root")]/div/div/div[count(@id)=1 and contains("0123456789", substring(@id,1,1))]'): 
-                new = ItemLoader(item=CommentsItem(),selector=reply)
-                new.context['lang'] = self.lang           
-                new.add_xpath('source', './/h3/a/text()')
-                new.add_value('reply_to',response.meta['reply_to'])
-                new.add_xpath('text','.//div[h3]/div[1]//text()')
-                new.add_xpath('date','.//abbr/text()')
-                new.add_xpath('reactions','.//a[contains(@href,"reaction/profile")]//text()')
-                new.add_value('url',response.url)   
-                yield new.load_item()
-                
-            back = response.xpath('//div[contains(@id,"comment_replies_more_1")]/a/@href').extract()
-            if back:
-                self.logger.info('Back found, more nested comments')
-                back_page = response.urljoin(back[0])
-                yield scrapy.Request(back_page, 
-                                     callback=self.parse_reply,
-                                     priority=100,
-                                     meta={'reply_to':response.meta['reply_to'],
-                                           'flag':'back',
-                                           'url':response.meta['url'],
-                                           'index':response.meta['index']})
-            else:
-                next_reply = response.meta['url']
-                self.logger.info('Nested comments crawl finished, heading to proper page: {}'.format(response.meta['url']))
-                yield scrapy.Request(next_reply,
-                                     callback=self.parse_page,
-                                     meta={'index':response.meta['index']+1})
-                
-        elif response.meta['flag'] == 'back':
-            #parse all comments
-            for reply in response.xpath('//div[contains(@id,"root")]/div/div/div[count(@id)=1 and contains("0123456789", substring(@id,1,1))]'): 
-                new = ItemLoader(item=CommentsItem(),selector=reply)
-                new.context['lang'] = self.lang           
-                new.add_xpath('source', './/h3/a/text()')
-                new.add_value('reply_to',response.meta['reply_to'])
-                new.add_xpath('text','.//div[h3]/div[1]//text()')
-                new.add_xpath('date','.//abbr/text()')
-                new.add_xpath('reactions','.//a[contains(@href,"reaction/profile")]//text()')
-                new.add_value('url',response.url)   
-                yield new.load_item()
-            #keep going backwards
-            back = response.xpath('//div[contains(@id,"comment_replies_more_1")]/a/@href').extract()
+        return self.extract(self.replies_records, response, self.parse_replies,
+                            response.meta['flag'] == 'init')
+
+    @staticmethod
+    def replies_records(response, root=False):
+        '''
+        Plain records of a replies page: the root comment if root, the
+        replies and the "back" link. Pure function, it may run in a worker
+        '''
+        return {'root': [CommentsSpider.comment_values(node, 'comment.root_text')
+                         for node in XPATHS['reply.root'].select(response)] if root else [],
+                'replies': [CommentsSpider.comment_values(node)
+                            for node in XPATHS['reply.replies'].select(response)],
+                'back': XPATHS['reply.back'].extract(response)}
+
+    def parse_replies(self, response, records):
+        page = response.meta['page']
+        thread = response.meta['thread']
+        reply_page = response.meta['reply_page']
+        #parse root comment, its div has no id: the one of its thread
+        for values in records['root']:
+            values.update(reply_to='ROOT', url=response.url, order=self.order_key(page,thread),
+                          commentID=response.meta.get('comment_id'))
+            yield self.item_loader(values, CommentsItem).load_item()
+        #parse all replies in the page, the first one or a "back" one
+        for i,values in enumerate(records['replies']):
+            values.update(reply_to=response.meta['reply_to'], url=response.url,
+                          order=self.order_key(page,thread,reply_page,i+1))
+            yield self.item_loader(values, CommentsItem).load_item()
+        #keep going backwards
+        back = records['back']
+        if back:
             self.logger.info('Back found, more nested comments')
-            if back:
-                back_page = response.urljoin(back[0])
-                yield scrapy.Request(back_page, 
-                                     callback=self.parse_reply,
-                                     priority=100,
-                                     meta={'reply_to':response.meta['reply_to'],
-                                           'flag':'back',
-                                           'url':response.meta['url'],
-                                           'index':response.meta['index']})
-            else:
-                next_reply = response.meta['url']
-                self.logger.info('Nested comments crawl finished, heading to home page: {}'.format(response.meta['url']))
-                yield scrapy.Request(next_reply,
-                                     callback=self.parse_page,
-                                     meta={'index':response.meta['index']+1})
+            back_page = response.urljoin(back[0])
+            yield scrapy.Request(back_page,
+                                 callback=self.parse_reply,
+                                 meta={'reply_to':response.meta['reply_to'],
+                                       'flag':'back',
+                                       'page':page,
+                                       'thread':thread,
+                                       'reply_page':reply_page+1})
+        else:
+            self.logger.info('Nested comments crawl finished @ page {}'.format(response.url))
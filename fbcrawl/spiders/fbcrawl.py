@@ -1,15 +1,30 @@
+import os
 import scrapy
+import zlib
 import logging
 
-from scrapy.loader import ItemLoader
 from scrapy.http import FormRequest
+from scrapy.utils.job import job_dir
 from fbcrawl.items import FbcrawlItem
+from fbcrawl.seen import SeenIndex, post_key
+from fbcrawl.session import SessionStore, crawler_cookiejar, jar_to_list
+from fbcrawl.signals import post_dropped
+from fbcrawl.workers import ExtractionPool
+from fbcrawl.xpaths import XPATHS, XPathItemLoader as ItemLoader
 
 class FacebookSpider(scrapy.Spider):
     """
     Parse FB pages (needs credentials)
     """    
     name = "fb"
+    #search box placeholder of the home page, used to guess the interface language
+    placeholders = {
+        'Search Facebook': 'en',
+        'Buscar en Facebook': 'es',
+        'Rechercher sur Facebook': 'fr',
+        'Cerca su Facebook': 'it',
+        'Pesquisa no Facebook': 'pt',
+    }
     custom_settings = {
         'FEED_EXPORT_FIELDS': ['source','shared_from','date','text', \
                                'reactions','likes','ahah','love','wow', \
@@ -29,21 +44,27 @@ class FacebookSpider(scrapy.Spider):
         else:
             self.logger.info('Email and password provided, using these as credentials')
 
-        #page name parsing (added support for full urls)
-        if 'page' not in kwargs:
+        #page name parsing (added support for full urls and for many targets,
+        #comma separated or one per line in a file, all crawled with one login)
+        if 'page' not in kwargs and 'pages_file' not in kwargs:
             raise AttributeError('You need to provide a valid page name to crawl!'
                                  'scrapy fb -a page="PAGENAME"')
-        elif self.page.find('https://www.facebook.com/') != -1:
-            self.page = self.page[25:]
-            self.logger.info('Page attribute provided, scraping "{}"'.format(self.page))
-        elif self.page.find('https://mbasic.facebook.com/') != -1:
-            self.page = self.page[28:]
-            self.logger.info('Page attribute provided, scraping "{}"'.format(self.page))
-        elif self.page.find('https://m.facebook.com/') != -1:
-            self.page = self.page[23:]
-            self.logger.info('Page attribute provided, scraping "{}"'.format(self.page))
-        else:
-            self.logger.info('Page attribute provided, scraping "{}"'.format(self.page))
+        pages = []
+        if 'page' in kwargs:
+            pages += self.page.split(',')
+        if 'pages_file' in kwargs:
+            with open(self.pages_file) as f:
+                pages += [line for line in f if not line.startswith('#')]
+        self.pages = []
+        for page in pages:
+            page = self.page_name(page.strip())
+            if page and page not in self.pages:
+                self.pages.append(page)
+        if not self.pages:
+            raise AttributeError('You need to provide a valid page name to crawl!'
+                                 'scrapy fb -a page="PAGENAME"')
+        self.page = self.pages[0]
+        self.logger.info('Page attribute provided, scraping "{}"'.format('", "'.join(self.pages)))
         
         #parse year
         if 'year' not in kwargs:
@@ -69,20 +90,145 @@ class FacebookSpider(scrapy.Spider):
             self.logger.info('Change your interface lang from facebook and try again')
             raise AttributeError('Language provided not currently supported')
 
-        #current year, this variable is needed for parse_page recursion
+        #crawl every year of the timeline concurrently instead of one after the other
+        self.parallel_years = str(kwargs.get('parallel_years', '')).lower() in ('1', 'true', 'yes')
+        if self.parallel_years:
+            self.logger.info('Parallel years enabled, every year will be crawled as a separate chain')
+        self.scheduled_years = {page: set() for page in self.pages}
+
+        #current year, parse_page recursion starts from here
         self.k = 2019
-        #count number of posts, used to prioritized parsing and correctly insert in the csv
-        self.count = 0
+        #count number of posts of every target, the n-th post of every target
+        #gets the same priority, so that the targets are scheduled in turns
+        self.counts = {page: 0 for page in self.pages}
+        #targets whose first page has been requested, not again on a resume
+        self.started = set()
+        #discovery order of the posts, the ReorderPipeline uses it to write
+        #the items in order while the posts are fetched in any order
+        self.seq = 0
+
+        #reactions policy: fetch the breakdown of the reactions for every post (all),
+        #for no post (skip), for posts with at least N reactions (threshold) or
+        #for a fraction of the posts (sample)
+        self.reactions_policy = kwargs.get('reactions', 'all')
+        if self.reactions_policy not in ('all', 'skip', 'threshold', 'sample'):
+            raise AttributeError('Reactions policy must be one of "all", "skip", "threshold", "sample"')
+        self.reactions_threshold = int(kwargs.get('reactions_threshold', 100))
+        self.reactions_sample = float(kwargs.get('reactions_sample', 0.1))
+        if self.reactions_policy != 'all':
+            self.logger.info('Reactions policy set to "{}"'.format(self.reactions_policy))
+
+        #incremental mode: posts already in the index are not crawled again and
+        #pagination stops after a run of known_run known posts
+        if 'incremental' in kwargs:
+            self.seen = SeenIndex(self.incremental)
+            self.known_run = int(kwargs.get('known_run', 10))
+            self.logger.info('Incremental mode, {} posts already known in "{}"'.format(len(self.seen),self.incremental))
+        else:
+            self.seen = None
+
+        #reuse the cookies and lang of a previous run, skipping the login
+        self.session_max_age = float(kwargs.get('session_max_age', 7*24*3600))
+        if 'session' in kwargs:
+            self.session = SessionStore(self.session, max_age=self.session_max_age)
+            self.logger.info('Session file provided, login will be skipped if "{}" is still valid'.format(self.session.path))
+        else:
+            self.session = None
         
+        #workers for the extraction of big pages, set up in from_crawler
+        self.pool = None
+
         self.start_urls = ['https://mbasic.facebook.com']    
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.pool = ExtractionPool.from_settings(crawler.settings)
+        if spider.pool is not None:
+            spider.logger.info('Pages over {} bytes are parsed in a {} pool'.format(spider.pool.min_bytes,spider.pool.kind))
+        #a resumed job logs in again only if its session has expired
+        jobdir = job_dir(crawler.settings)
+        if jobdir and spider.session is None:
+            spider.session = SessionStore(os.path.join(jobdir, 'session.json'), max_age=spider.session_max_age)
+        return spider
+
+    #progress of the crawl, kept in JOBDIR/spider.state between runs
+    state_attributes = ('lang', 'started', 'seq', 'counts', 'scheduled_years')
+
+    @property
+    def state(self):
+        '''
+        Snapshot of the progress of the crawl, scrapy pickles it to
+        JOBDIR/spider.state when a job is paused (see also
+        extensions.StateSnapshot)
+        '''
+        return {name: getattr(self, name) for name in self.state_attributes}
+
+    @state.setter
+    def state(self, state):
+        '''
+        Set by scrapy when the job is opened, with the state saved by the
+        previous run of the job (empty for a new job)
+        '''
+        if state:
+            for name in self.state_attributes:
+                if name in state:
+                    setattr(self, name, state[name])
+            self.logger.info('Resuming the job from post n = {}'.format(self.seq))
+
+    @staticmethod
+    def page_name(page):
+        '''
+        Strip the facebook domain from full urls
+        '''
+        for domain in ('https://www.facebook.com/','https://mbasic.facebook.com/','https://m.facebook.com/'):
+            if page.find(domain) != -1:
+                return page[page.find(domain)+len(domain):]
+        return page
+
+    def start_requests(self):
+        '''
+        Start from the saved session if there is one, from the login otherwise
+        '''
+        saved = self.session.load(self.email) if self.session else None
+        if saved is None:
+            for request in super().start_requests():
+                yield request
+            return
+        self.logger.info('Found saved session, checking that it is still valid')
+        if self.lang == '_':
+            self.lang = saved['lang']
+        yield scrapy.Request(self.start_urls[0], cookies=saved['cookies'],
+                             callback=self.parse_session, dont_filter=True)
+
+    def parse_session(self, response):
+        '''
+        Go to the given pages if the saved cookies are still logged in,
+        otherwise throw the session away and login again
+        '''
+        if not XPATHS['login.form'](response):
+            self.logger.info('Saved session is valid, login skipped')
+            return self.parse_home(response)
+        self.logger.info('Saved session has expired, logging in again')
+        self.session.clear()
+        return self.parse(response)
+
+    def save_session(self):
+        '''
+        Store the cookies of the logged-in session for the next runs
+        '''
+        jar = crawler_cookiejar(self.crawler) if getattr(self, 'crawler', None) else None
+        if jar is not None:
+            self.session.save(self.email, self.lang, jar_to_list(jar))
+            self.logger.info('Session saved to "{}"'.format(self.session.path))
+
     def parse(self, response):
         '''
         Handle login with provided credentials
         '''
         return FormRequest.from_response(
                 response,
-                formxpath='//form[contains(@action, "login")]',
+                formxpath=XPATHS['login.form'].expr,
                 formdata={'email': self.email,'pass': self.password},
                 callback=self.parse_home
         )
@@ -92,10 +238,10 @@ class FacebookSpider(scrapy.Spider):
         This method has multiple purposes:
         1) Handle failed logins due to facebook 'save-device' redirection
         2) Set language interface, if not already provided
-        3) Navigate to given page 
+        3) Navigate to the given pages, sharing the same session
         '''
         #handle 'save-device' redirection
-        if response.xpath("//div/a[contains(@href,'save-device')]"):
+        if XPATHS['home.save_device'](response):
             self.logger.info('Got stuck in "save-device" checkpoint')
             self.logger.info('I will now try to redirect to the correct page')
             return FormRequest.from_response(
@@ -106,111 +252,276 @@ class FacebookSpider(scrapy.Spider):
             
         #set language interface
         if self.lang == '_':
-            if response.xpath("//input[@placeholder='Search Facebook']"):
-                self.logger.info('Language recognized: lang="en"')
-                self.lang = 'en'
-            elif response.xpath("//input[@placeholder='Buscar en Facebook']"):
-                self.logger.info('Language recognized: lang="es"')
-                self.lang = 'es'
-            elif response.xpath("//input[@placeholder='Rechercher sur Facebook']"):
-                self.logger.info('Language recognized: lang="fr"')
-                self.lang = 'fr'
-            elif response.xpath("//input[@placeholder='Cerca su Facebook']"):
-                self.logger.info('Language recognized: lang="it"')
-                self.lang = 'it'
-            elif response.xpath("//input[@placeholder='Pesquisa no Facebook']"):
-                self.logger.info('Language recognized: lang="pt"')
-                self.lang = 'pt'
+            for placeholder in XPATHS['home.search_placeholder'](response):
+                if placeholder in self.placeholders:
+                    self.lang = self.placeholders[placeholder]
+                    self.logger.info('Language recognized: lang="{}"'.format(self.lang))
+                    break
             else:
                 raise AttributeError('Language not recognized\n'
                                      'Change your interface lang from facebook ' 
                                      'and try again')
+
+        if self.session is not None:
+            self.save_session()
                                                                  
-        #navigate to provided page
-        href = response.urljoin(self.page)
-        self.logger.info('Scraping facebook page {}'.format(href))
-        return scrapy.Request(url=href,callback=self.parse_page,meta={'index':1})
+        #navigate to provided pages, the ones of a resumed job are already queued
+        requests = []
+        for page in self.pages:
+            if page in self.started:
+                self.logger.info('Page {} already started, resuming its crawl'.format(page))
+                continue
+            self.started.add(page)
+            href = self.target_url(response, page)
+            self.logger.info('Scraping facebook page {}'.format(href))
+            #an incremental run sharing the JOBDIR (or the frontier) of the
+            #previous one must download the first page again for the new
+            #posts; the following pages are new urls if there are new posts
+            meta = {'index':1,'target':page}
+            if self.seen is not None:
+                meta['revisit'] = True
+            requests.append(scrapy.Request(url=href,callback=self.parse_page,meta=meta))
+        return requests
+
+    def target_url(self, response, page):
+        '''
+        First url to crawl for a target page
+        '''
+        return response.urljoin(page)
 
     def parse_page(self, response):
         '''
         Parse the given page selecting the posts.
         Then ask recursively for another page.
         '''
+        #year links are looked up only where they are needed: at the end of
+        #a chain and, with parallel years, on the first page of a target
+        if self.parallel_years:
+            target = response.meta.get('target', self.page)
+            years = [year for year in range(self.k, self.year-1, -1)
+                     if year not in self.scheduled_years.setdefault(target, set())]
+            return self.extract(self.listing_records, response, self.parse_listing,
+                                years, 'flag' not in response.meta, False)
+        flag = response.meta.get('flag', self.k)
+        return self.extract(self.listing_records, response, self.parse_listing,
+                            range(flag, self.year-1, -1), False, True)
+
+    @staticmethod
+    def listing_records(response, years=(), always=False, first=False):
+        '''
+        Plain records of a timeline page: its posts, the "more" link and the
+        links to the given years (if there is no "more" link or always, up to
+        the first one found if first). Pure function, it may run in a worker
+        '''
+        records = {'posts': [{'comments': XPATHS['page.post_comments'].extract(post),
+                              'url': XPATHS['page.post_link'].extract(post)}
+                             for post in XPATHS['page.posts'].select(response)],
+                   'more': XPATHS['page.more'].extract(response),
+                   'years': {}}
+        if always or not records['more']:
+            for year in years:
+                records['years'][year] = XPATHS['page.year_link'].extract(response, year=str(year))
+                if first and records['years'][year]:
+                    break
+        return records
+
+    def parse_listing(self, response, records):
+        '''
+        Requests for the posts and the following pages of a timeline page
+        '''
+        #the target page is carried along the whole chain
+        target = response.meta.get('target', self.page)
+        #incremental mode: length of the current run of already known posts
+        known = response.meta.get('known', 0)
+
         #select all posts
-        for post in response.xpath("//div[contains(@data-ft,'top_level_post_id')]"):            
-            new = ItemLoader(item=FbcrawlItem(),selector=post)
-            self.logger.info('Parsing post n = {}'.format(abs(self.count)))
-            new.add_xpath('comments', "./div[2]/div[2]/a[1]/text()")        
-            new.add_xpath('url', ".//a[contains(@href,'footer')]/@href")
+        for values in records['posts']:
+            if self.seen is not None:
+                key = post_key(values['url'][0] if values['url'] else '')
+                if key in self.seen:
+                    #the comments counter is on the listing, the reactions
+                    #would need the post: only the comments are refreshed
+                    comments = self.item_loader({'comments': values['comments']}).get_output_value('comments')
+                    self.seen.touch(key, comments=comments)
+                    known += 1
+                    continue
+                known = 0
+            #targets of other workers may come from a shared frontier
+            self.counts[target] = self.counts.get(target, 0) + 1
+            self.logger.info('Parsing post n = {} of {}'.format(self.counts[target],target))
+            #plain extracted values travel in meta, not a loader: a loader
+            #would keep the whole listing page alive until the post is done
+            values['seq'] = self.seq
 
             #page_url #new.add_value('url',response.url)
             #returns full post-link in a list
-            post = post.xpath(".//a[contains(@href,'footer')]/@href").extract() 
-            temp_post = response.urljoin(post[0])
-            self.count -= 1
-            yield scrapy.Request(temp_post, self.parse_post, priority = self.count, meta={'item':new})       
+            temp_post = response.urljoin(values['url'][0])
+            #round robin between targets by priority, while seq is global:
+            #the ReorderPipeline still writes the posts in discovery order
+            yield scrapy.Request(temp_post, self.parse_post, errback=self.post_failed,
+                                 priority=-self.counts[target],
+                                 meta={'item':values,'seq':self.seq})
+            self.seq += 1
+
+        if self.seen is not None and known >= self.known_run:
+            self.logger.info('Reached {} already known posts of {}, stop paginating'.format(known,target))
+            return
 
         #load following page
         #tries to click on "more", otherwise it looks for the appropriate
         #year for 1-click only and proceeds to click on others
-        new_page = response.xpath("//div[2]/a[contains(@href,'timestart=') and not(contains(text(),'ent')) and not(contains(text(),number()))]/@href").extract()      
-        if not new_page: 
-            if response.meta['flag'] == self.k and self.k >= self.year:                
-                self.logger.info('There are no more, flag set at = {}'.format(self.k))
-                xpath = "//div/a[contains(@href,'time') and contains(text(),'" + str(self.k) + "')]/@href"
-                new_page = response.xpath(xpath).extract()
-                if new_page:
-                    new_page = response.urljoin(new_page[0])
-                    self.k -= 1
-                    self.logger.info('Everything OK, new flag: {}'.format(self.k))                                
-                    yield scrapy.Request(new_page, callback=self.parse_page, meta={'flag':self.k})
-                else:
-                    while not new_page: #sometimes the years are skipped 
-                        self.logger.info('XPATH not found for year {}'.format(self.k-1))
-                        self.k -= 1
-                        self.logger.info('Trying with previous year, flag={}'.format(self.k))
-                        if self.k < self.year:
-                            self.logger.info('The previous year to crawl is less than the parameter year: {} < {}'.format(self.k,self.year))
-                            self.logger.info('This is not handled well, please re-run with -a year="{}" or less'.format(self.k))
-                            break                        
-                        xpath = "//div/a[contains(@href,'time') and contains(text(),'" + str(self.k) + "')]/@href"
-                        new_page = response.xpath(xpath).extract()
-                    self.logger.info('New page found with flag {}'.format(self.k))
-                    new_page = response.urljoin(new_page[0])
-                    self.k -= 1
-                    self.logger.info('Now going with flag {}'.format(self.k))
-                    yield scrapy.Request(new_page, callback=self.parse_page, meta={'flag':self.k}) 
-            else:
-                self.logger.info('Crawling has finished with no errors!')
-        else:
+        #the year to look for travels with the chain in meta['flag']
+        flag = response.meta.get('flag', self.k)
+        new_page = records['more']
+        if new_page:
             new_page = response.urljoin(new_page[0])
             if 'flag' in response.meta:
-                self.logger.info('Page scraped, click on more! flag = {}'.format(response.meta['flag']))
-                yield scrapy.Request(new_page, callback=self.parse_page, meta={'flag':response.meta['flag']})
+                self.logger.info('Page scraped, click on more! flag = {}'.format(flag))
             else:
                 self.logger.info('FLAG DOES NOT ALWAYS REPRESENT ACTUAL YEAR')
-                self.logger.info('First page scraped, click on more! Flag not set, default flag = {}'.format(self.k))
-                yield scrapy.Request(new_page, callback=self.parse_page, meta={'flag':self.k})
-                
+                self.logger.info('First page scraped, click on more! Flag not set, default flag = {}'.format(flag))
+            meta = {'flag':flag,'target':target,'known':known}
+            if 'chain' in response.meta:
+                meta['chain'] = response.meta['chain']
+            yield scrapy.Request(new_page, callback=self.parse_page, meta=meta)
+        elif self.parallel_years:
+            self.logger.info('Timeline chain {} has finished'.format(response.meta.get('chain') or 'recent'))
+
+        if self.parallel_years:
+            #every year of the timeline is a chain of its own, they are
+            #discovered on the first page and on the last page of each chain
+            if not new_page or 'flag' not in response.meta:
+                for request in self.year_chains(response, target, records['years']):
+                    yield request
+        elif not new_page:
+            year = flag
+            self.logger.info('There are no more, flag set at = {}'.format(year))
+            while year >= self.year:
+                new_page = records['years'].get(year)
+                if new_page:
+                    break
+                #sometimes the years are skipped
+                self.logger.info('XPATH not found for year {}, trying with previous year'.format(year))
+                year -= 1
+            if new_page:
+                new_page = response.urljoin(new_page[0])
+                self.logger.info('New page found for year {}, now going with flag {}'.format(year,year-1))
+                yield scrapy.Request(new_page, callback=self.parse_page, meta={'flag':year-1,'target':target,'known':known})
+            else:
+                self.logger.info('Crawling of {} has finished with no errors!'.format(target))
+
+    def year_chains(self, response, target, links):
+        '''
+        Start a concurrent timeline chain for every year link of the target
+        not yet followed, from the current year back to self.year
+        '''
+        for year in range(self.k, self.year-1, -1):
+            if year in self.scheduled_years[target]:
+                continue
+            year_page = links.get(year)
+            if year_page:
+                self.scheduled_years[target].add(year)
+                self.logger.info('Starting timeline chain for year {} of {}'.format(year,target))
+                yield scrapy.Request(response.urljoin(year_page[0]), callback=self.parse_page,
+                                     meta={'flag':year,'chain':year,'target':target})
+
+    def extract(self, records, response, build, *args):
+        '''
+        Hand records(response, *args) to build(response, records): big pages
+        go to the PARSE_POOL workers (the result is a Deferred), the others
+        are extracted here
+        '''
+        if self.pool is None or not self.pool.offloaded(response):
+            return build(response, records(response, *args))
+        self.crawler_stats('parse_pool/offloaded')
+        return self.pool.submit(records, response, *args).addCallback(lambda result: build(response, result))
+
     def parse_post(self,response):
-        new = ItemLoader(item=FbcrawlItem(),response=response,parent=response.meta['item'])
-        new.add_xpath('source', "//td/div/h3/strong/a/text() | //span/strong/a/text() | //div/div/div/a[contains(@href,'post_id')]/strong/text()")
-        new.add_xpath('shared_from','//div[contains(@data-ft,"top_level_post_id") and contains(@data-ft,\'"isShare":1\')]/div/div[3]//strong/a/text()')
-        new.add_xpath('date','//div/div/abbr/text()')
-        new.add_xpath('text','//div[@data-ft]//p//text() | //div[@data-ft]/div[@class]/div[@class]/text()')
-        new.add_xpath('reactions',"//a[contains(@href,'reaction/profile')]/div/div/text()")  
-        
-        reactions = response.xpath("//div[contains(@id,'sentence')]/a[contains(@href,'reaction/profile')]/@href")
-        reactions = response.urljoin(reactions[0].extract())
-        yield scrapy.Request(reactions, callback=self.parse_reactions, meta={'item':new})
+        values = dict(response.meta['item'])
+        for field, xpath in (('source', 'post.source'),
+                             ('shared_from', 'post.shared_from'),
+                             ('date', 'post.date'),
+                             ('text', 'post.text'),
+                             ('reactions', 'post.reactions')):
+            values[field] = XPATHS[xpath].extract(response)
+
+        reactions = XPATHS['post.reactions_link'].extract(response)
+        if not reactions or not self.fetch_reactions(values, response):
+            #emit the post with the total count only
+            self.crawler_stats('reactions/skipped')
+            yield self.emit_item(values)
+            return
+        self.crawler_stats('reactions/fetched')
+        reactions = response.urljoin(reactions[0])
+        yield scrapy.Request(reactions, callback=self.parse_reactions, errback=self.post_failed,
+                             meta={'item':values,'seq':response.meta.get('seq')})
+
+    def fetch_reactions(self, values, response):
+        '''
+        Apply the reactions policy: should the breakdown of this post be fetched?
+        '''
+        if self.reactions_policy == 'all':
+            return True
+        elif self.reactions_policy == 'skip':
+            return False
+        elif self.reactions_policy == 'threshold':
+            #counts.py turns "1,2K" or "Mark and 254 others" into an int
+            total = self.item_loader(values).get_output_value('reactions') or 0
+            return total >= self.reactions_threshold
+        else:
+            #sample: hash of the normalized post link, without the refid/__tn__
+            #parameters that change between runs, so the same posts are picked
+            key = post_key(values['url'][0] if values.get('url') else response.url)
+            return zlib.crc32(key.encode('utf-8')) % 10000 < self.reactions_sample * 10000
+
+    def crawler_stats(self, key, count=1):
+        if getattr(self, 'crawler', None) is not None:
+            self.crawler.stats.inc_value(key, count, spider=self)
         
     def parse_reactions(self,response):
-        new = ItemLoader(item=FbcrawlItem(),response=response, parent=response.meta['item'])
-        new.context['lang'] = self.lang           
-        new.add_xpath('likes',"//a[contains(@href,'reaction_type=1')]/span/text()")
-        new.add_xpath('ahah',"//a[contains(@href,'reaction_type=4')]/span/text()")
-        new.add_xpath('love',"//a[contains(@href,'reaction_type=2')]/span/text()")
-        new.add_xpath('wow',"//a[contains(@href,'reaction_type=3')]/span/text()")
-        new.add_xpath('sigh',"//a[contains(@href,'reaction_type=7')]/span/text()")
-        new.add_xpath('grrr',"//a[contains(@href,'reaction_type=8')]/span/text()")        
-        yield new.load_item()       
\ No newline at end of file
+        values = dict(response.meta['item'])
+        for field in ('likes', 'ahah', 'love', 'wow', 'sigh', 'grrr'):
+            values[field] = XPATHS['reactions.' + field].extract(response)
+        yield self.emit_item(values)
+
+    def post_failed(self, failure):
+        '''
+        Errback of posts and reactions: a post whose reactions page failed is
+        emitted without the breakdown, a lost post is signaled so that the
+        items that follow it are not held back waiting for it
+        '''
+        request = failure.request
+        self.logger.error('Request failed: {} ({})'.format(request.url, failure.getErrorMessage()))
+        if request.callback == self.parse_reactions:
+            yield self.emit_item(request.meta['item'])
+        elif getattr(self, 'crawler', None) is not None:
+            self.crawler.signals.send_catch_log(signal=post_dropped, seq=request.meta.get('seq'), spider=self)
+
+    def item_loader(self, values, item_class=FbcrawlItem):
+        '''
+        Loader filled with the raw values extracted along the callbacks,
+        the processors of the item run only here
+        '''
+        new = ItemLoader(item=item_class())
+        new.context['lang'] = self.lang
+        for field, value in values.items():
+            new.add_value(field, value)
+        return new
+
+    def emit_item(self, values):
+        '''
+        Load the item, recording the post in the incremental index
+        '''
+        item = self.item_loader(values).load_item()
+        if self.seen is not None and item.get('url'):
+            self.seen.add(item['url'], reactions=item.get('reactions'), comments=item.get('comments'))
+        return item
+
+    def closed(self, reason):
+        #publish the per-selector counters in the crawl stats
+        if getattr(self, 'crawler', None) is not None:
+            XPATHS.dump_stats(self.crawler.stats)
+        if self.seen is not None:
+            self.seen.close()
+        if self.pool is not None:
+            self.pool.close()
\ No newline at end of file
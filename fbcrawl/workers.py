@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Extraction off the reactor thread.
+#
+# Parsing a big page and evaluating the XPaths on it runs in the reactor
+# thread and holds every download back until it is over. With PARSE_POOL
+# set, the spiders hand the pages bigger than PARSE_OFFLOAD_BYTES to a pool
+# of threads (lxml releases the GIL while it parses and evaluates) or of
+# processes, where a pure function turns the page into plain records
+# (strings, lists and dicts). The records come back to the reactor thread,
+# where the spider builds requests and items and keeps its state (counters,
+# seq, incremental index) as before.
+#
+# Selector counters (xpath/* stats) are not collected in process pools.
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from twisted.internet import defer, reactor
+from scrapy.http import HtmlResponse
+
+POOLS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+
+def run_records(records, url, body, encoding, args):
+    '''
+    Worker side: rebuild the response and extract its records
+    '''
+    return records(HtmlResponse(url=url, body=body, encoding=encoding), *args)
+
+
+class ExtractionPool(object):
+    '''
+    Pool of workers for the record functions of the spiders
+    '''
+    def __init__(self, kind='thread', workers=None, min_bytes=256*1024):
+        if kind not in POOLS:
+            raise ValueError('PARSE_POOL must be one of {}'.format(', '.join(sorted(POOLS))))
+        self.kind = kind
+        self.executor = POOLS[kind](workers)
+        self.min_bytes = min_bytes
+
+    @classmethod
+    def from_settings(cls, settings):
+        '''
+        The pool configured in the settings, None to extract in the reactor
+        '''
+        kind = settings.get('PARSE_POOL')
+        if not kind:
+            return None
+        return cls(kind, settings.getint('PARSE_WORKERS') or None,
+                   settings.getint('PARSE_OFFLOAD_BYTES', 256*1024))
+
+    def offloaded(self, response):
+        return len(response.body) >= self.min_bytes
+
+    def submit(self, records, response, *args):
+        '''
+        Deferred firing in the reactor thread with records(response, *args)
+        '''
+        dfd = defer.Deferred()
+        future = self.executor.submit(run_records, records, response.url, response.body,
+                                      response.encoding, args)
+
+        def done(future):
+            #runs in a worker thread, the deferred must fire in the reactor
+            error = future.exception()
+            if error is None:
+                reactor.callFromThread(dfd.callback, future.result())
+            else:
+                reactor.callFromThread(dfd.errback, error)
+        future.add_done_callback(done)
+        return dfd
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
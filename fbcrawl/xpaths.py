@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+# Registry of the XPath expressions used by the spiders and their loaders.
+#
+# Every expression is compiled once at import with lxml.etree.XPath and keeps
+# its own counters (calls, matches, evaluation time), so that the expensive
+# selectors can be spotted in the crawl stats. lxml lets only one thread at a
+# time evaluate an XPath object, so the threads of a PARSE_POOL compile their
+# own copy on first use, and count in their own counters that are summed up
+# when the stats are read.
+
+import threading
+from time import perf_counter
+
+from lxml import etree
+from scrapy import Selector
+from scrapy.selector import SelectorList
+from scrapy.loader import ItemLoader
+
+
+class CompiledXPath(object):
+    '''
+    A named, precompiled XPath expression with evaluation counters.
+    Variables ($name) in the expression are passed as keyword arguments.
+    '''
+    def __init__(self, name, expr):
+        self.name = name
+        self.expr = expr
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        #[calls, matches, seconds] of every thread that used the expression
+        self._counters = []
+        #compiled here too, so that a broken expression fails at import
+        self._compiled()
+
+    def _compiled(self):
+        '''
+        The XPath object and the counters of the current thread
+        '''
+        local = self._local
+        try:
+            return local.xpath, local.counters
+        except AttributeError:
+            local.xpath = etree.XPath(self.expr, smart_strings=False)
+            local.counters = [0, 0, 0.0]
+            with self._lock:
+                self._counters.append(local.counters)
+            return local.xpath, local.counters
+
+    @property
+    def calls(self):
+        return sum(c[0] for c in list(self._counters))
+
+    @property
+    def matches(self):
+        return sum(c[1] for c in list(self._counters))
+
+    @property
+    def seconds(self):
+        return sum(c[2] for c in list(self._counters))
+
+    def reset(self):
+        for counters in list(self._counters):
+            counters[:] = [0, 0, 0.0]
+
+    def __call__(self, node, **variables):
+        '''
+        Evaluate on a response, a selector or a lxml node, raw lxml results
+        '''
+        xpath, counters = self._compiled()
+        root = getattr(node, 'selector', node)   #responses
+        root = getattr(root, 'root', root)       #selectors
+        start = perf_counter()
+        result = xpath(root, **variables)
+        counters[2] += perf_counter() - start
+        counters[0] += 1
+        if isinstance(result, list):
+            counters[1] += len(result)
+        else:
+            result = [result]
+        return result
+
+    def select(self, node, **variables):
+        '''
+        Like response.xpath(), returns a SelectorList of the matched nodes
+        '''
+        return SelectorList(Selector(root=r, type='html', _expr=self.expr)
+                            for r in self(node, **variables))
+
+    def extract(self, node, **variables):
+        '''
+        Like response.xpath().extract(), returns a list of strings
+        '''
+        return [etree.tostring(r, method='html', encoding='unicode', with_tail=False)
+                if etree.iselement(r) else str(r)
+                for r in self(node, **variables)]
+
+    def extract_first(self, node, default=None, **variables):
+        result = self.extract(node, **variables)
+        return result[0] if result else default
+
+
+class XPathRegistry(object):
+    '''
+    Name -> CompiledXPath mapping shared by all the spiders
+    '''
+    def __init__(self, exprs=None):
+        self._xpaths = {}
+        for name, expr in (exprs or {}).items():
+            self.register(name, expr)
+
+    def register(self, name, expr):
+        if name in self._xpaths:
+            raise KeyError('XPath "{}" already registered'.format(name))
+        self._xpaths[name] = CompiledXPath(name, expr)
+        return self._xpaths[name]
+
+    def __getitem__(self, name):
+        return self._xpaths[name]
+
+    def __contains__(self, name):
+        return name in self._xpaths
+
+    def stats(self):
+        '''
+        Counters of every selector that has been evaluated at least once
+        '''
+        stats = {}
+        for name, xp in self._xpaths.items():
+            calls = xp.calls
+            if calls:
+                stats[name] = {'calls': calls,
+                               'matches': xp.matches,
+                               'seconds': round(xp.seconds, 6)}
+        return stats
+
+    def dump_stats(self, stats, prefix='xpath'):
+        '''
+        Copy the counters in the crawler stats collector
+        '''
+        for name, counters in self.stats().items():
+            for key, value in counters.items():
+                stats.set_value('{}/{}/{}'.format(prefix, name, key), value)
+
+    def reset(self):
+        for xp in self._xpaths.values():
+            xp.reset()
+
+
+XPATHS = XPathRegistry({
+# =============================================================================
+# login and home
+# =============================================================================
+    'login.form': '//form[contains(@action, "login")]',
+    'home.save_device': "//div/a[contains(@href,'save-device')]",
+    'home.search_placeholder': "//input[@placeholder]/@placeholder",
+# =============================================================================
+# fb spider
+# =============================================================================
+    'page.posts': "//div[contains(@data-ft,'top_level_post_id')]",
+    'page.post_comments': "./div[2]/div[2]/a[1]/text()",
+    'page.post_link': ".//a[contains(@href,'footer')]/@href",
+    'page.more': "//div[2]/a[contains(@href,'timestart=') and not(contains(text(),'ent')) and not(contains(text(),number()))]/@href",
+    'page.year_link': "//div/a[contains(@href,'time') and contains(text(),$year)]/@href",
+    'post.source': "//td/div/h3/strong/a/text() | //span/strong/a/text() | //div/div/div/a[contains(@href,'post_id')]/strong/text()",
+    'post.shared_from': '//div[contains(@data-ft,"top_level_post_id") and contains(@data-ft,\'"isShare":1\')]/div/div[3]//strong/a/text()',
+    'post.date': '//div/div/abbr/text()',
+    'post.text': '//div[@data-ft]//p//text() | //div[@data-ft]/div[@class]/div[@class]/text()',
+    'post.reactions': "//a[contains(@href,'reaction/profile')]/div/div/text()",
+    'post.reactions_link': "//div[contains(@id,'sentence')]/a[contains(@href,'reaction/profile')]/@href",
+    'reactions.likes': "//a[contains(@href,'reaction_type=1')]/span/text()",
+    'reactions.ahah': "//a[contains(@href,'reaction_type=4')]/span/text()",
+    'reactions.love': "//a[contains(@href,'reaction_type=2')]/span/text()",
+    'reactions.wow': "//a[contains(@href,'reaction_type=3')]/span/text()",
+    'reactions.sigh': "//a[contains(@href,'reaction_type=7')]/span/text()",
+    'reactions.grrr': "//a[contains(@href,'reaction_type=8')]/span/text()",
+# =============================================================================
+# comments spider
+# =============================================================================
+    'comments.all': './/div[string-length(@class) = 2 and count(@id)=1 and contains("0123456789", substring(@id,1,1))]',
+    'comments.has_replies': 'boolean(.//div[contains(@id,"comment_replies")])',
+    'comments.reply_link': './/a[contains(@href,"repl")]/@href',
+    'comments.see_next': './/div[contains(@id,"see_next")]',
+    'comments.see_next_link': './/@href',
+    'reply.root': '//div[contains(@id,"root")]/div/div/div[count(@id)!=1 and contains("0123456789", substring(@id,1,1))]',
+    'reply.replies': '//div[contains(@id,"root")]/div/div/div[count(@id)=1 and contains("0123456789", substring(@id,1,1))]',
+    'reply.back': '//div[contains(@id,"comment_replies_more_1")]/a/@href',
+    'comment.id': './@id',
+    'comment.source': './/h3/a/text()',
+    'comment.text': './/div[h3]/div[1]//text()',
+    'comment.root_text': './/div[1]//text()',
+    'comment.date': './/abbr/text()',
+    'comment.reactions': './/a[contains(@href,"reaction/profile")]//text()',
+# =============================================================================
+# events spider
+# =============================================================================
+    'events.posts': "//div[contains(@class,'bx')]",
+    'events.link': ".//a[contains(@aria-label, ' ')]/@href",
+    'events.more': "//div[contains(@id,'more_friends_who_like_this')]/a/@href",
+    'event.id': "//input[contains(@name, 'target')]/@value",
+    'event.name': "//title/text()",
+    'event.date': '//div[contains(@id, "event_summary")]/div/div[1]/@title',
+    'event.location': '//div[contains(@id, "event_summary")]/div/div[2]/@title | '
+                      '//div[contains(@id, "event_summary")]/div/div[2]//dd/div/text()',
+    'event.link': '//link[contains(@rel, "canonical")]/@href',
+    'event.details': './/div[contains(text(), "Details")]/../../../div[last()]',
+    'event.image': './/div[contains(@id, "event_header")]//img/@src',
+})
+
+
+class XPathItemLoader(ItemLoader):
+    '''
+    ItemLoader whose add_xpath() also accepts the name of a registered XPath,
+    plain expressions are still handed over to scrapy
+    '''
+    def add_xpath(self, field_name, xpath, *processors, **kw):
+        if xpath in XPATHS:
+            values = XPATHS[xpath].extract(self.selector)
+            return self.add_value(field_name, values, *processors, **kw)
+        return super().add_xpath(field_name, xpath, *processors, **kw)
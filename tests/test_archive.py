@@ -0,0 +1,140 @@
+import re
+import logging
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.misc import arg_to_iter
+
+from benchmarks.replay import BASE_URL, load_fixture, make_spider
+from fbcrawl import reextract
+from fbcrawl.archive import ArchiveReader, ArchiveWriter
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+
+PAGE = BASE_URL + '/testpage'
+
+
+def page(url, body=b'<html><body></body></html>', meta=None):
+    request = Request(url, meta=meta or {})
+    return HtmlResponse(url, body=body, encoding='utf-8', request=request), request
+
+
+def test_records_read_back_across_segments(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), 'fb', ['testpage'], segment_bytes=1000)
+    bodies = {}
+    for n in range(20):
+        url = '{}/story.php?story_fbid={}&id=1'.format(BASE_URL, n)
+        #incompressible enough for a few records per segment
+        bodies[url] = ''.join(chr(0x4e00 + (n * 7919 + i * 104729) % 20000) for i in range(150)).encode('utf-8')
+        response, request = page(url, bodies[url], {'seq': n, 'item': {'url': [url]}})
+        request.callback = FacebookSpider.parse_post
+        writer.write(response, request, 'en')
+    writer.close()
+    assert len(list(tmp_path.glob('*.pages.gz'))) > 3
+
+    reader = ArchiveReader(str(tmp_path))
+    [(run, spider, pages)] = reader.runs()
+    assert (spider, pages) == ('fb', 20)
+    assert reader.spider(run) == ('fb', ['testpage'])
+    records = reader.records(run, 'parse_post')
+    assert len(records) == 20
+    for n, url in enumerate(bodies):
+        #tracking parameters do not matter
+        record = reader.lookup(run, url + '&refid=17')
+        assert record == records[n]
+        header, body = reader.read(record)
+        assert body == bodies[url]
+        assert header['meta'] == {'seq': n, 'item': {'url': [url]}}
+        assert header['lang'] == 'en'
+        assert reader.response(header, body, Request(url)).text == bodies[url].decode('utf-8')
+    reader.close()
+
+
+def test_crash_leaves_a_readable_archive(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), 'fb', commit_every=2)
+    for n in range(5):
+        response, request = page('{}/story.php?story_fbid={}&id=1'.format(BASE_URL, n))
+        writer.write(response, request, 'en')
+    #killed in the middle of the 6th record: the 5th is not in the index yet
+    writer.file.write(b'\x1f\x8b\x08\x00')
+    writer.file.flush()
+    reader = ArchiveReader(str(tmp_path))
+    [(run, spider, pages)] = reader.runs()
+    assert pages == 4
+    assert reader.lookup(run, BASE_URL + '/story.php?story_fbid=4&id=1') is None
+    for n in range(4):
+        record = reader.lookup(run, '{}/story.php?story_fbid={}&id=1'.format(BASE_URL, n))
+        assert reader.read(record)[0]['status'] == 200
+    reader.close()
+
+    #a system crash may cut the last indexed record short too
+    [segment] = tmp_path.glob('*.pages.gz')
+    data = segment.read_bytes()
+    reader = ArchiveReader(str(tmp_path))
+    last = reader.lookup(run, BASE_URL + '/story.php?story_fbid=3&id=1')
+    offset, length = reader.db.execute('SELECT offset, length FROM pages WHERE id = ?', (last,)).fetchone()
+    segment.write_bytes(data[:offset + length // 2])
+    try:
+        reader.read(last)
+    except IOError as e:
+        assert 'truncated' in str(e)
+    else:
+        assert False, 'no error'
+    reader.close()
+
+
+def live(spider, writer):
+    '''
+    Depth first crawl of the first timeline page on the fixtures, archiving
+    the pages as PageArchive does, as (items, number of pages)
+    '''
+    items = []
+    seen = set()
+
+    def download(request):
+        url = request.url
+        if 'story.php' in url:
+            post = re.search(r'story_fbid=(\d+)', url).group(1).encode()
+            body = load_fixture('fb_post.html').replace(b'ft_ent_identifier=1000000',
+                                                        b'ft_ent_identifier=' + post)
+        elif 'ufi/reaction' in url:
+            body = load_fixture('fb_reactions.html')
+        else:
+            body = load_fixture('fb_page.html')
+        response = HtmlResponse(url, body=body, encoding='utf-8', request=request)
+        writer.write(response, request, 'en')
+        return response
+
+    first = Request(PAGE, callback=spider.parse_page, meta={'index': 1, 'target': 'testpage'})
+    stack = [iter(arg_to_iter(first.callback(download(first))))]
+    while stack:
+        out = next(stack[-1], None)
+        if out is None:
+            stack.pop()
+        elif not isinstance(out, Request):
+            items.append(ItemAdapter(out).asdict())
+        elif out.callback.__name__ != 'parse_page' and out.url not in seen:
+            #the next timeline pages are tasks of their own
+            seen.add(out.url)
+            stack.append(iter(arg_to_iter(out.callback(download(out)))))
+    return items
+
+
+def test_reextraction_matches_the_live_crawl(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCRAPY_SETTINGS_MODULE', 'fbcrawl.settings')
+    writer = ArchiveWriter(str(tmp_path), 'fb', ['testpage'])
+    items = live(make_spider(FacebookSpider), writer)
+    writer.close()
+    assert len(items) == 12
+
+    reader = ArchiveReader(str(tmp_path))
+    [(run, spider, pages)] = reader.runs()
+    [root] = reader.records(run, 'parse_page')
+    reader.close()
+    reextract.init_worker(str(tmp_path), run, spider, {'page': 'testpage'}, logging.WARNING)
+    try:
+        extracted, stats = reextract.extract(root)
+    finally:
+        reextract._reader.close()
+    assert [item for chain, item in extracted] == items
+    assert stats == {'pages': pages, 'missing': 0, 'failed': 0, 'duplicates': 0, 'errors': 0}
@@ -0,0 +1,90 @@
+import pytest
+
+from fbcrawl.counts import parse_count, parse_counts
+
+CASES = [
+    #plain numbers, with the thousands separators of the language
+    ('en', '954', 954),
+    ('en', '19,298,873', 19298873),
+    ('it', '19.298.873', 19298873),
+    ('es', '19.298.873', 19298873),
+    ('fr', '19 298 873', 19298873),
+    ('fr', '19\u202f298\u202f873', 19298873),
+    ('pt', '19.298.873', 19298873),
+    #abbreviated
+    ('en', '1K', 1000),
+    ('en', '1.2K', 1200),
+    ('en', '2.5M', 2500000),
+    ('it', '1,2 mila', 1200),
+    ('it', '3 Mln', 3000000),
+    ('es', '1,2 mil', 1200),
+    ('fr', '1,2 k', 1200),
+    ('pt', '1,2 mil', 1200),
+    ('pt', '2 mi', 2000000),
+    #names and others, the names count too
+    ('en', 'Mark and 254 others', 255),
+    ('en', 'Mark, Bob and 3 others', 5),
+    ('en', 'Mark and 1.2K others', 1201),
+    ('it', 'Pamela, Luigi e altri 4', 6),
+    ('it', 'Pamela, Luigi e altri 1,2 mila', 1202),
+    ('es', 'Ana y 5 personas más', 6),
+    ('fr', 'Marie et 3 autres personnes', 4),
+    ('pt', 'Ana e outras 5 pessoas', 6),
+    #names only
+    ('en', 'Mark and Bob', 2),
+    ('it', 'Pamela, Luigi e Mario', 3),
+    ('es', 'Ana y Luis', 2),
+    ('fr', 'Marie et Paul', 2),
+    ('pt', 'Ana e João', 2),
+    #not a count
+    ('en', '', None),
+    ('en', '12 Comments', None),
+    ('en', 'Like', None),
+    ('en', 'Love', None),
+    ('en', 'Comment', None),
+    ('en', 'Mark Rossi', None),
+    ('it', 'Mi piace', None),
+    ('fr', 'J’aime', None),
+    #decimals without a suffix
+    ('en', '1.5', None),
+    ('it', '1,2', None),
+    ('pt', '2,5', None),
+    #no lang (or an unsupported one): plain integers only
+    (None, '19.298.873', 19298873),
+    (None, '19,298,873', 19298873),
+    (None, 'Mark and Bob', None),
+    ('de', '1,2K', None),
+]
+
+SEARCH_CASES = [
+    ('en', '1,481 Comments', 1481),
+    ('en', 'Comment', None),
+    ('it', '1.481 commenti', 1481),
+    ('fr', '2,5 k commentaires', 2500),
+    ('pt', '12 comentários', 12),
+]
+
+
+@pytest.mark.parametrize('lang,raw,expected', CASES)
+def test_parse_count(lang, raw, expected):
+    assert parse_count(raw, lang) == expected
+
+
+@pytest.mark.parametrize('lang,raw,expected', SEARCH_CASES)
+def test_parse_count_search(lang, raw, expected):
+    assert parse_count(raw, lang, search=True) == expected
+
+
+def test_parse_count_values():
+    assert parse_count(['Mark and 254 others'], 'en') == 255
+    assert parse_count([], 'en') is None
+    assert parse_count(42, 'en') == 42
+    assert parse_count(True, 'en') is None
+    assert parse_count(None, 'en') is None
+
+
+def test_parse_counts():
+    raws = [raw for lang, raw, expected in CASES if lang == 'en']
+    expected = [expected for lang, raw, expected in CASES if lang == 'en']
+    assert parse_counts(raws + raws, 'en') == expected + expected
+    assert parse_counts(['1.2K', None, 7], 'en') == [1200, None, 7]
@@ -0,0 +1,91 @@
+from datetime import date, datetime
+
+import pytest
+
+from fbcrawl.dates import parse_date, parse_dates, crawl_anchor
+
+#Wednesday 29 August 2018, 12:30
+ANCHOR = datetime(2018, 8, 29, 12, 30)
+
+CASES = [
+    #relative
+    ('en', 'Just now', date(2018, 8, 29)),
+    ('en', '50 mins', date(2018, 8, 29)),
+    ('en', '4 hrs', date(2018, 8, 29)),
+    ('en', '13 hrs', date(2018, 8, 28)),
+    ('en', '2 days ago', date(2018, 8, 27)),
+    ('it', 'Adesso', date(2018, 8, 29)),
+    ('it', '9 ore fa', date(2018, 8, 29)),
+    ('it', '50min', date(2018, 8, 29)),
+    ('it', '15 h', date(2018, 8, 28)),
+    ('es', 'Ahora', date(2018, 8, 29)),
+    ('es', 'hace 5 min', date(2018, 8, 29)),
+    ('es', '13 h', date(2018, 8, 28)),
+    ('fr', 'À l’instant', date(2018, 8, 29)),
+    ('fr', 'il y a 3 heures', date(2018, 8, 29)),
+    ('fr', '2 j', date(2018, 8, 27)),
+    ('pt', 'Agora', date(2018, 8, 29)),
+    ('pt', 'há 3 horas', date(2018, 8, 29)),
+    ('pt', '1 d', date(2018, 8, 28)),
+    #today and yesterday
+    ('en', 'Today at 9:15 AM', date(2018, 8, 29)),
+    ('en', 'Yesterday at 8:45 PM', date(2018, 8, 28)),
+    ('it', 'Oggi alle 10:20', date(2018, 8, 29)),
+    ('it', 'Ieri alle 20:45', date(2018, 8, 28)),
+    ('es', 'Ayer a las 20:45', date(2018, 8, 28)),
+    ('fr', 'Hier à 20:45', date(2018, 8, 28)),
+    ('fr', "Aujourd'hui à 9:15", date(2018, 8, 29)),
+    ('pt', 'Ontem às 20:45', date(2018, 8, 28)),
+    #weekdays, the last one up to today
+    ('en', 'Monday at 7:00 PM', date(2018, 8, 27)),
+    ('en', 'Wednesday at 7:00 PM', date(2018, 8, 29)),
+    ('en', 'Thursday at 7:00 PM', date(2018, 8, 23)),
+    ('it', 'Domenica alle ore 19:29', date(2018, 8, 26)),
+    ('it', 'lunedi alle 10:00', date(2018, 8, 27)),
+    ('es', 'martes a las 10:00', date(2018, 8, 28)),
+    ('fr', 'samedi à 10:00', date(2018, 8, 25)),
+    ('pt', 'segunda-feira às 10:00', date(2018, 8, 27)),
+    ('pt', 'sábado às 10:00', date(2018, 8, 25)),
+    #day and month, the year is the last one not in the future
+    ('en', 'August 2 at 10:00 AM', date(2018, 8, 2)),
+    ('en', 'Dec 24 at 10:00 AM', date(2017, 12, 24)),
+    ('it', '2 gennaio alle 10:00', date(2018, 1, 2)),
+    ('it', '30 agosto', date(2017, 8, 30)),
+    ('es', '25 de junio a las 10:00', date(2018, 6, 25)),
+    ('fr', '14 juillet à 10:00', date(2018, 7, 14)),
+    ('pt', '7 de setembro às 10:00', date(2017, 9, 7)),
+    #explicit years
+    ('en', 'Aug 25, 2016 at 7:00 PM', date(2016, 8, 25)),
+    ('en', 'Aug 25 2016', date(2016, 8, 25)),
+    ('it', '21 giu 2017 alle 10:00', date(2017, 6, 21)),
+    ('es', '25 de junio de 2016', date(2016, 6, 25)),
+    ('fr', '3 févr. 2015', date(2015, 2, 3)),
+    ('pt', '7 de setembro de 2014', date(2014, 9, 7)),
+    #not dates
+    ('en', '', None),
+    ('en', 'Like', None),
+    ('en', 'February 30, 2018', None),
+    ('it', '1.481 commenti', None),
+    ('de', 'Gestern um 20:45', None),
+]
+
+
+@pytest.mark.parametrize('lang,raw,expected', CASES)
+def test_parse_date(lang, raw, expected):
+    assert parse_date(raw, lang, ANCHOR) == expected
+
+
+def test_parse_dates():
+    raws = [raw for lang, raw, expected in CASES if lang == 'en']
+    expected = [expected for lang, raw, expected in CASES if lang == 'en']
+    assert parse_dates(raws, 'en', ANCHOR) == expected
+    assert parse_dates(['Yesterday'], 'de', ANCHOR) == [None]
+
+
+def test_relative_dates_follow_the_anchor():
+    assert parse_date('3 hrs', 'en', datetime(2018, 8, 29, 2, 0)) == date(2018, 8, 28)
+    assert parse_date('3 hrs', 'en', datetime(2018, 8, 29, 4, 0)) == date(2018, 8, 29)
+
+
+def test_crawl_anchor_truncated_to_the_minute():
+    assert crawl_anchor(datetime(2018, 8, 29, 12, 30, 45, 123)) == ANCHOR
@@ -0,0 +1,67 @@
+from hashlib import sha1
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from fbcrawl.dupefilters import BloomDupeFilter
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+
+
+def fp(n):
+    return sha1(str(n).encode('ascii')).digest()
+
+
+def dupefilter(jobdir=None, **settings):
+    if jobdir:
+        settings['JOBDIR'] = str(jobdir)
+    return BloomDupeFilter.from_crawler(get_crawler(settings_dict=settings))
+
+
+def test_false_positives_at_capacity():
+    bloom = dupefilter(DUPEFILTER_CAPACITY=20000, DUPEFILTER_ERROR_RATE=1e-3).bloom
+    for n in range(20000):
+        bloom.add(fp(n))
+    assert len(bloom) > 19950
+    assert all(fp(n) in bloom for n in range(20000))
+    false = sum(fp(n) in bloom for n in range(20000, 120000))
+    #100 expected out of 100000
+    assert false <= 200
+
+
+def test_revisit_is_not_filtered():
+    dupes = dupefilter()
+    request = Request('https://mbasic.facebook.com/testpage')
+    assert not dupes.request_seen(request)
+    assert dupes.request_seen(request)
+    revisit = request.replace(meta={'revisit': True})
+    assert not dupes.request_seen(revisit)
+    assert not dupes.request_seen(revisit)
+    assert dupes.request_seen(request)
+
+
+def test_seen_requests_survive_a_reopen(tmp_path):
+    request = Request('https://mbasic.facebook.com/testpage')
+    dupes = dupefilter(tmp_path)
+    assert not dupes.request_seen(request)
+    dupes.close('shutdown')
+    assert (tmp_path / 'requests.bloom').exists()
+    dupes = dupefilter(tmp_path)
+    assert dupes.request_seen(request)
+    assert not dupes.request_seen(Request('https://mbasic.facebook.com/otherpage'))
+    #a filter sized differently starts over
+    dupes = dupefilter(tmp_path, DUPEFILTER_CAPACITY=1000)
+    assert not dupes.request_seen(request)
+
+
+def test_incremental_first_pages_are_revisited(tmp_path):
+    home = Request('https://mbasic.facebook.com/home.php')
+    response = HtmlResponse(home.url, body=b'<html></html>', request=home)
+    spider = FacebookSpider(email='x', password='y', page='testpage', lang='en',
+                            incremental=str(tmp_path / 'seen.db'))
+    [request] = spider.parse_home(response)
+    assert request.meta['revisit']
+    spider.seen.close()
+    spider = FacebookSpider(email='x', password='y', page='testpage', lang='en')
+    [request] = spider.parse_home(response)
+    assert 'revisit' not in request.meta
@@ -0,0 +1,67 @@
+import re
+import pickle
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from benchmarks.replay import BASE_URL, load_fixture, make_spider, replay
+from fbcrawl.spiders.events import EventsSpider
+
+FIRST = BASE_URL + '/testpage?v=events'
+PAST = BASE_URL + '/testpage/events/?is_past=1&serialized_cursor=AbC&has_more=1'
+
+
+def page(url, body, index):
+    return HtmlResponse(url, body=body, encoding='utf-8', request=Request(url, meta={'index': index}))
+
+
+def first_page():
+    return page(FIRST, load_fixture('events_page.html'), 1)
+
+
+def past_page():
+    '''
+    Last page of the list: events 4000005-4000014, the first 5 of them were
+    on the first page too, with other tracking parameters
+    '''
+    body = re.sub(rb'/events/(\d+)\?acontext=(.*?)aref=51',
+                  lambda m: b'/events/%d?acontext=%saref=52' % (int(m.group(1)) + 5, m.group(2)),
+                  load_fixture('events_page.html'))
+    body = re.sub(rb'<div id="m_more_friends_who_like_this">.*?</div>', b'', body)
+    return page(PAST, body, 2)
+
+
+def event_ids(requests):
+    return [EventsSpider.event_id(request.url) for request in requests if request.callback.__name__ == 'parse_post']
+
+
+def test_events_are_requested_once_across_the_pages():
+    spider = make_spider(EventsSpider)
+    items, requests = replay(spider.parse_page, first_page())
+    assert event_ids(requests) == [str(4000000 + n) for n in range(10)]
+    #the past events follow the upcoming ones
+    assert requests[-1].url == PAST and requests[-1].meta['index'] == 2
+    items, requests = replay(spider.parse_page, past_page())
+    assert event_ids(requests) == [str(4000000 + n) for n in range(10, 15)]
+    assert [request.meta['seq'] for request in requests] == list(range(10, 15))
+    assert spider.count == 15
+    assert all(request.callback.__name__ == 'parse_post' for request in requests)
+
+
+def test_past_events_can_be_skipped():
+    spider = make_spider(EventsSpider, past='false')
+    items, requests = replay(spider.parse_page, first_page())
+    assert len(event_ids(requests)) == len(requests) == 10
+
+
+def test_a_resumed_job_keeps_the_events_seen():
+    spider = make_spider(EventsSpider)
+    replay(spider.parse_page, first_page())
+    #pickled to JOBDIR/spider.state and read back by the resumed job
+    state = pickle.loads(pickle.dumps(spider.state))
+    resumed = make_spider(EventsSpider)
+    resumed.state = state
+    items, requests = replay(resumed.parse_page, past_page())
+    assert event_ids(requests) == [str(4000000 + n) for n in range(10, 15)]
+    assert [request.meta['seq'] for request in requests] == list(range(10, 15))
+    assert resumed.count == 15
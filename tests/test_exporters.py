@@ -0,0 +1,40 @@
+import io
+from datetime import date
+
+import pytest
+
+from fbcrawl.items import CommentsItem
+from fbcrawl.exporters import to_int, to_date, to_str, ParquetItemExporter
+
+
+def test_to_str():
+    assert to_str(None) is None
+    assert to_str([]) is None
+    assert to_str(['Anna Rossi']) == 'Anna Rossi'
+    assert to_str(['Anna Rossi', 'Mario Bianchi']) == 'Anna Rossi,Mario Bianchi'
+    assert to_str(12) == '12'
+
+
+def test_to_int_and_to_date():
+    assert to_int(1202) == 1202
+    assert to_int(['19,298']) == 19298
+    assert to_int('Mark and 254 others') is None
+    assert to_date([date(2018, 8, 25)]) == date(2018, 8, 25)
+    assert to_date(['2 hrs']) is None
+
+
+def test_parquet_columns():
+    pq = pytest.importorskip('pyarrow.parquet')
+    f = io.BytesIO()
+    exporter = ParquetItemExporter(f, row_group_size=2,
+                                   fields_to_export=['source', 'reply_to', 'date', 'reactions', 'text'])
+    exporter.start_exporting()
+    for i in range(3):
+        exporter.export_item(CommentsItem(source=['Anna Rossi'], reply_to=['Mario', 'Luigi'],
+                                          date=date(2018, 8, i + 1), reactions=i, text='hello'))
+    exporter.finish_exporting()
+    table = pq.read_table(io.BytesIO(f.getvalue()))
+    assert table.num_rows == 3
+    assert table.column('reply_to').to_pylist() == ['Mario,Luigi'] * 3
+    assert table.column('reactions').to_pylist() == [0, 1, 2]
+    assert table.column('date').to_pylist() == [date(2018, 8, 1), date(2018, 8, 2), date(2018, 8, 3)]
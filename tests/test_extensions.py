@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.test import get_crawler
+from twisted.web.test.requesthelper import DummyRequest
+
+from fbcrawl.extensions import CrawlMetrics, Histogram, MetricsResource
+
+
+def metrics(**settings):
+    project = get_project_settings()
+    project.setdict(settings, priority='cmdline')
+    crawler = get_crawler(settings_dict=project.copy_to_dict())
+    crawler.stats.open_spider(None)
+    return CrawlMetrics.from_crawler(crawler)
+
+
+def test_percentiles():
+    histogram = Histogram()
+    for _ in range(90):
+        histogram.add(0.003, 1, 0, False)
+    for _ in range(9):
+        histogram.add(0.04, 0, 2, False)
+    histogram.add(7.5, 0, 0, True)
+    assert histogram.percentile(50) == 5
+    assert histogram.percentile(90) == 5
+    assert histogram.percentile(99) == 50
+    #past the last bucket, the slowest call
+    assert histogram.percentile(100) == 7500
+    assert Histogram().percentile(50) is None
+    snapshot = histogram.snapshot()
+    assert (snapshot['calls'], snapshot['failed'], snapshot['items'], snapshot['requests']) == (100, 1, 90, 18)
+    assert snapshot['max_ms'] == 7500
+    assert snapshot['buckets']['le_5'] == 90 and snapshot['buckets']['inf'] == 1
+
+
+def test_no_port_is_opened_by_default():
+    ext = metrics()
+    ext.spider_opened(None)
+    assert ext.listener is None
+    assert ext.spider_closed(None, 'finished') is None
+    with pytest.raises(NotConfigured):
+        metrics(METRICS_ENABLED=False)
+
+
+def test_snapshot():
+    ext = metrics()
+    ext.spider_opened(None)
+    ext.started -= 10
+    ext.callback_timed('parse_post', 0.015, 1, 1, False, None)
+    for _ in range(4):
+        ext.item_scraped({}, None)
+    snapshot = ext.snapshot()
+    assert set(snapshot) == {'time', 'elapsed', 'items', 'items_per_sec', 'items_per_sec_recent',
+                             'responses', 'bytes_downloaded', 'rss_bytes', 'queues', 'callbacks'}
+    assert snapshot['items'] == 4
+    assert snapshot['items_per_sec'] == pytest.approx(0.4, rel=0.01)
+    assert snapshot['rss_bytes'] > 0
+    assert snapshot['queues'] == {}
+    assert snapshot['callbacks']['parse_post']['p50_ms'] == 20
+
+
+def test_render_get():
+    ext = metrics()
+    ext.spider_opened(None)
+    ext.callback_timed('parse_page', 0.15, 0, 13, False, None)
+    request = DummyRequest([b''])
+    body = json.loads(MetricsResource(ext).render_GET(request))
+    assert request.responseHeaders.getRawHeaders(b'Content-Type') == [b'application/json']
+    assert body['callbacks']['parse_page']['requests'] == 13
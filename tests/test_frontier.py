@@ -0,0 +1,150 @@
+import threading
+from hashlib import sha1
+from http.server import ThreadingHTTPServer
+
+import pytest
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+
+import fbcrawl.frontier
+from fbcrawl.frontier import FrontierHandler, FrontierScheduler, HTTPFrontierStore, SQLiteFrontierStore
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fbcrawl.frontier, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SQLiteFrontierStore(str(tmp_path / 'frontier.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def http_store(tmp_path):
+    FrontierHandler.store = SQLiteFrontierStore(str(tmp_path / 'frontier.db'))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FrontierHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield HTTPFrontierStore('http://127.0.0.1:{}/'.format(server.server_port))
+    server.shutdown()
+    server.server_close()
+    FrontierHandler.store.close()
+    FrontierHandler.store = None
+
+
+@pytest.fixture(params=['sqlite', 'http'])
+def store(request):
+    return request.getfixturevalue(request.param + '_store')
+
+
+def fp(n):
+    return sha1(str(n).encode('ascii')).hexdigest()
+
+
+def data(entries):
+    return [entry[1] for entry in entries]
+
+
+def test_push_drops_the_fingerprints_seen(store):
+    assert store.push('fb', [(fp(1), 0, 'a'), (fp(2), 0, 'b'), (fp(1), 0, 'a2')]) == [True, True, False]
+    assert store.push('fb', [(fp(2), 0, 'b2'), (None, 0, 'c'), (None, 0, 'c')]) == [False, True, True]
+    #the fingerprints are per spider
+    assert store.push('comments', [(fp(1), 0, 'a')]) == [True]
+    assert store.stats('fb') == {'queued': 4, 'leased': 0, 'seen': 3}
+
+
+def test_lease_order_is_priority_then_newest(store, clock):
+    store.push('fb', [(fp(1), 0, 'low1'), (fp(2), 5, 'high'), (fp(3), 0, 'low2')])
+    assert data(store.lease('fb', 'w1', 2, 60)) == ['high', 'low2']
+    assert data(store.lease('fb', 'w1', 2, 60)) == ['low1']
+    assert store.lease('fb', 'w1', 2, 60) == []
+
+
+def test_lease_is_exclusive_until_it_expires(store, clock):
+    store.push('fb', [(fp(1), 0, 'a')])
+    [(id_, _, recovered)] = store.lease('fb', 'w1', 4, 60)
+    assert not recovered
+    assert store.lease('fb', 'w2', 4, 60) == []
+    assert store.stats('fb')['leased'] == 1
+    clock.now += 61
+    assert [tuple(entry) for entry in store.lease('fb', 'w2', 4, 60)] == [(id_, 'a', True)]
+    #the expired owner can no longer ack it, the new one can
+    store.ack('w1', [id_])
+    assert store.stats('fb') == {'queued': 0, 'leased': 1, 'seen': 1}
+    store.ack('w2', [id_])
+    assert store.stats('fb') == {'queued': 0, 'leased': 0, 'seen': 1}
+
+
+def test_renew_keeps_the_lease(store, clock):
+    store.push('fb', [(fp(1), 0, 'a')])
+    [(id_, _, _)] = store.lease('fb', 'w1', 4, 60)
+    clock.now += 50
+    store.renew('w1', [id_], 60)
+    store.renew('w2', [id_], 1)
+    clock.now += 50
+    assert store.lease('fb', 'w2', 4, 60) == []
+    clock.now += 11
+    assert data(store.lease('fb', 'w2', 4, 60)) == ['a']
+
+
+def test_release_requeues_at_once(store, clock):
+    store.push('fb', [(fp(1), 0, 'a'), (fp(2), 0, 'b'), (fp(3), 0, 'c')])
+    entries = store.lease('fb', 'w1', 3, 60)
+    store.release('w2', [entries[0][0]])
+    assert store.stats('fb')['leased'] == 3
+    store.release('w1', [entries[0][0]])
+    assert [tuple(entry) for entry in store.lease('fb', 'w2', 4, 60)] == [(entries[0][0], 'c', False)]
+    assert store.release_worker('fb', 'w1') == 2
+    assert sorted(data(store.lease('fb', 'w2', 4, 60))) == ['a', 'b']
+
+
+def test_seen_max_forgets_the_oldest_fingerprints(tmp_path):
+    store = SQLiteFrontierStore(str(tmp_path / 'frontier.db'), seen_max=3)
+    store.push('fb', [(fp(n), 0, str(n)) for n in range(5)])
+    assert store.stats('fb')['seen'] == 3
+    assert store.push('fb', [(fp(4), 0, '4'), (fp(0), 0, '0')]) == [False, True]
+    store.close()
+
+
+def scheduler(tmp_path):
+    crawler = get_crawler(settings_dict={'FRONTIER': str(tmp_path / 'frontier.db')})
+    crawler.spider = crawler._create_spider('fb')
+    scheduler = FrontierScheduler.from_crawler(crawler)
+    scheduler.spider = crawler.spider
+    return scheduler
+
+
+class Slot(object):
+    def __init__(self, *requests):
+        self.inprogress = set(requests)
+
+
+class Engine(object):
+    def __init__(self, slot):
+        self.slot = slot
+
+
+def test_requests_over_without_ack_are_acked(tmp_path):
+    sched = scheduler(tmp_path)
+    running = Request('https://mbasic.facebook.com/1', meta={'_frontier': 1})
+    sched.crawler.engine = Engine(Slot(running))
+    #1 in progress, 2 ended in an IgnoreRequest of process_response, 3 is being retried
+    sched.inflight = {1, 2, 3}
+    sched.requeued = {3: 1}
+    sched.reconcile()
+    assert sched.acks == [2]
+    assert sched.inflight == {1, 3}
+    sched.store.close()
@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.bench_parse import SCENARIOS, GOLDEN, load_baselines, scenario_output
+
+golden = load_baselines(GOLDEN)
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS, ids=[scenario[0] for scenario in SCENARIOS])
+def test_golden_output(scenario):
+    name, spidercls, kwargs, callback, fixture, url, build_meta = scenario
+    assert name in golden, 'no golden output, store it with --save-golden'
+    assert scenario_output(spidercls, kwargs, callback, fixture, url, build_meta) == golden[name]
@@ -0,0 +1,23 @@
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+
+from fbcrawl.httpcache import MbasicCacheStorage
+
+URL = 'https://mbasic.facebook.com/story.php?story_fbid=1&id=2&refid=17&__tn__=%2AW'
+
+
+def test_set_cookie_is_not_cached(tmp_path):
+    storage = MbasicCacheStorage(Settings({'HTTPCACHE_DIR': str(tmp_path)}))
+    storage.open_spider(None)
+    response = HtmlResponse(URL, body=b'<html>post</html>', encoding='utf-8',
+                            headers={'Content-Type': 'text/html', 'Set-Cookie': 'xs=secret; path=/'})
+    storage.store_response(None, Request(URL), response)
+    cached = storage.retrieve_response(None, Request(URL.replace('refid=17', 'refid=52')))
+    storage.close_spider(None)
+    assert cached.body == b'<html>post</html>'
+    assert cached.headers.get('Content-Type') == b'text/html'
+    assert 'Set-Cookie' not in cached.headers
+    for path in tmp_path.rglob('*'):
+        if path.is_file():
+            assert b'secret' not in path.read_bytes()
@@ -0,0 +1,78 @@
+from scrapy import Request
+from scrapy.core.downloader import Downloader
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+import fbcrawl.middlewares
+from fbcrawl.middlewares import FbcrawlDownloaderMiddleware
+
+URL = 'https://mbasic.facebook.com/story.php?story_fbid=1&id=2'
+
+BLOCKED = b'''<html><head><title>You\xe2\x80\x99re Temporarily Blocked</title></head>
+<body><div>It looks like you were misusing this feature by going too fast.</div></body></html>'''
+BLOCKED_IT = b'<html><head><title>Sei stato temporaneamente bloccato</title></head><body></body></html>'
+QUOTED = b'''<html><head><title>Test Page</title></head>
+<body><div>I was temporarily blocked for posting too fast, again!</div></body></html>'''
+POST_TITLE = (b'<html><head><title>Test Page - Temporarily blocked from posting? Here is a long '
+              b'story about what happened to our page last week</title></head><body></body></html>')
+
+
+def middleware(**settings):
+    crawler = get_crawler(settings_dict=settings)
+    return FbcrawlDownloaderMiddleware(crawler)
+
+
+def page(body, url=URL, status=200):
+    return HtmlResponse(url, status=status, body=body, encoding='utf-8')
+
+
+def test_page_state():
+    mw = middleware()
+    assert mw.page_state(page(BLOCKED)) == 'blocked'
+    assert mw.page_state(page(BLOCKED_IT)) == 'blocked'
+    assert mw.page_state(page(QUOTED)) == 'ok'
+    assert mw.page_state(page(POST_TITLE)) == 'ok'
+    assert mw.page_state(page(QUOTED, status=429)) == 'throttled'
+    assert mw.page_state(page(QUOTED, url='https://mbasic.facebook.com/checkpoint/?next')) == 'checkpoint'
+
+
+class Engine(object):
+    def __init__(self, crawler):
+        self.downloader = Downloader(crawler)
+
+
+def test_slot_starts_at_the_start_concurrency():
+    mw = middleware(CONCURRENT_REQUESTS_PER_DOMAIN=16, THROTTLE_START_CONCURRENCY=2)
+    mw.crawler.engine = Engine(mw.crawler)
+    request = Request(URL)
+    mw.process_request(request, None)
+    slot = mw.crawler.engine.downloader.slots['mbasic.facebook.com']
+    assert slot.concurrency == 2
+    #a slot recreated after being idle gets the current controller state
+    mw.slots['mbasic.facebook.com'][0] = 5.5
+    del mw.crawler.engine.downloader.slots['mbasic.facebook.com']
+    mw.process_request(request, None)
+    assert mw.crawler.engine.downloader.slots['mbasic.facebook.com'].concurrency == 5
+
+
+def test_a_burst_of_errors_halves_the_slot_once(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fbcrawl.middlewares, 'time', lambda: now[0])
+    mw = middleware(CONCURRENT_REQUESTS_PER_DOMAIN=32, THROTTLE_START_CONCURRENCY=16)
+    mw.crawler.engine = Engine(mw.crawler)
+    mw.crawler.stats.open_spider(None)
+    request = Request(URL)
+    mw.process_request(request, None)
+    request.meta['download_slot'] = 'mbasic.facebook.com'
+    request.meta['download_latency'] = 2.0
+    slot = mw.crawler.engine.downloader.slots['mbasic.facebook.com']
+    #the 16 requests sent together fail together
+    for _ in range(16):
+        mw.process_response(request, page(QUOTED, status=503), None)
+    assert slot.concurrency == 8
+    assert mw.crawler.stats.get_value('throttle/decrease') == 1
+    assert mw.crawler.stats.get_value('throttle/throttled') == 16
+    #the next round trip, sent at the new rate, fails too
+    now[0] += 2.5
+    mw.process_response(request, page(QUOTED, status=503), None)
+    assert slot.concurrency == 4
@@ -0,0 +1,236 @@
+import gzip
+import json
+import time
+import sqlite3
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.loader import ItemLoader
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer, task
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import fbcrawl.pipelines
+
+from fbcrawl.items import CommentsItem, EventItem, FbcrawlItem
+from fbcrawl.pipelines import JsonLinesSinkPipeline, ReorderPipeline, SQLitePipeline
+
+
+def event(url, name):
+    loader = ItemLoader(item=EventItem())
+    loader.add_value('url', url)
+    loader.add_value('eventID', '4000000')
+    loader.add_value('name', name)
+    return loader.load_item()
+
+
+def comment(comment_id, url, order, reactions):
+    loader = ItemLoader(item=CommentsItem())
+    loader.context['lang'] = 'en'
+    loader.add_value('commentID', comment_id)
+    loader.add_value('url', url)
+    loader.add_value('order', order)
+    loader.add_value('reactions', reactions)
+    return loader.load_item()
+
+
+def test_sqlite_upserts_events_on_their_id(tmp_path):
+    path = str(tmp_path / 'fbcrawl.db')
+    pipeline = SQLitePipeline(path, batch_size=1)
+    pipeline.open_spider(None)
+    pipeline.process_item(event('https://mbasic.facebook.com/events/4000000?acontext=51&aref=51', 'old'), None)
+    pipeline.process_item(event('https://mbasic.facebook.com/events/4000000/?acontext=52&aref=52', 'new'), None)
+    pipeline.close_spider(None)
+    rows = sqlite3.connect(path).execute('SELECT url, name FROM events').fetchall()
+    assert rows == [('https://mbasic.facebook.com/events/4000000', 'new')]
+
+
+def test_sqlite_counters_are_integers(tmp_path):
+    path = str(tmp_path / 'fbcrawl.db')
+    pipeline = SQLitePipeline(path)
+    pipeline.open_spider(None)
+    pipeline.process_item(FbcrawlItem(url='/story.php?story_fbid=1&id=2', reactions=1202,
+                                      source=['Test Page']), None)
+    pipeline.close_spider(None)
+    db = sqlite3.connect(path)
+    assert db.execute('SELECT typeof(reactions), typeof(source) FROM posts').fetchone() == ('integer', 'text')
+
+
+def test_sqlite_upserts_comments_on_their_id(tmp_path):
+    path = str(tmp_path / 'fbcrawl.db')
+    replies = 'https://mbasic.facebook.com/comment/replies/?ctoken=1000000_2100009'
+    pipeline = SQLitePipeline(path, batch_size=1)
+    pipeline.open_spider(None)
+    pipeline.process_item(comment('2100009', replies + '&count=3&refid=52&__tn__=R', '0000.0009.0000.0000', '4'), None)
+    pipeline.process_item(comment('2100010', replies + '&count=3&refid=52&__tn__=R', '0000.0010.0000.0000', '1'), None)
+    #next crawl: a new comment before them shifts their order, other tracking parameters
+    pipeline.process_item(comment('2100008', replies + '&count=4&refid=18', '0000.0009.0000.0000', '2'), None)
+    pipeline.process_item(comment('2100009', replies + '&count=4&refid=18', '0000.0010.0000.0000', '7'), None)
+    pipeline.close_spider(None)
+    rows = sqlite3.connect(path).execute('SELECT commentID, "order", reactions, url FROM comments '
+                                         'ORDER BY commentID').fetchall()
+    assert [row[:3] for row in rows] == [('2100008', '0000.0009.0000.0000', 2),
+                                         ('2100009', '0000.0010.0000.0000', 7),
+                                         ('2100010', '0000.0010.0000.0000', 1)]
+    assert rows[1][3] == 'https://mbasic.facebook.com/comment/replies/?count=4&ctoken=1000000_2100009'
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def strftime(self, format):
+        return time.strftime(format, time.gmtime(self.now))
+
+
+def sink(directory, **kwargs):
+    pipeline = JsonLinesSinkPipeline(str(directory), **kwargs)
+    pipeline.open_spider(Spider('fb'))
+    return pipeline
+
+
+def segments(directory):
+    '''
+    Items of the segments listed in the manifest, per segment
+    '''
+    with open(str(directory / 'manifest.jsonl')) as f:
+        entries = [json.loads(line) for line in f]
+    result = []
+    for entry in entries:
+        with open(str(directory / entry['file']), 'rb') as f:
+            if entry['compression'] == 'zstd':
+                data = zstandard.ZstdDecompressor().stream_reader(f).read()
+            else:
+                data = gzip.decompress(f.read())
+        assert len(data) == entry['uncompressed']
+        items = [json.loads(line)['seq'] for line in data.decode('utf-8').splitlines()]
+        assert len(items) == entry['items']
+        result.append(items)
+    return result
+
+
+@pytest.mark.skipif(zstandard is None, reason='zstandard is not installed')
+def test_sink_rotates_on_size(tmp_path):
+    pipeline = sink(tmp_path, compression='zstd', rotate_bytes=200)
+    for seq in range(10):
+        pipeline.process_item({'url': '/story.php?story_fbid={}&id=2'.format(seq), 'seq': seq}, None)
+    #50 bytes a line; the open segment is not in the manifest yet
+    assert sum(segments(tmp_path), []) == [0, 1, 2, 3, 4, 5, 6, 7]
+    assert list(tmp_path.glob('*.part'))
+    pipeline.close_spider(None)
+    assert segments(tmp_path) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert not list(tmp_path.glob('*.part'))
+    assert all(path.name.endswith('.jsonl.zst') for path in tmp_path.glob('fb-*'))
+
+
+def test_sink_rotates_on_time(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fbcrawl.pipelines, 'time', clock)
+    pipeline = sink(tmp_path, compression='gzip', rotate_seconds=60)
+    for seq in range(5):
+        pipeline.process_item({'url': '/story.php?story_fbid={}&id=2'.format(seq), 'seq': seq}, None)
+        clock.now += 25
+    pipeline.close_spider(None)
+    assert segments(tmp_path) == [[0, 1, 2, 3], [4]]
+    assert all(path.name.endswith('.jsonl.gz') for path in tmp_path.glob('fb-*'))
+
+
+def test_sink_falls_back_to_gzip(tmp_path, monkeypatch):
+    monkeypatch.setattr(fbcrawl.pipelines, 'zstandard', None)
+    assert sink(tmp_path).compression == 'gzip'
+    with pytest.raises(NotConfigured):
+        sink(tmp_path, compression='zstd')
+    with pytest.raises(NotConfigured):
+        sink(tmp_path, compression='bz2')
+
+
+@pytest.fixture
+def reorder(monkeypatch):
+    '''
+    ReorderPipeline on a fake reactor and clock, released with
+    reorder.reactor.advance(0)
+    '''
+    clock = Clock()
+    fake_reactor = task.Clock()
+    monkeypatch.setattr(fbcrawl.pipelines, 'time', clock)
+    monkeypatch.setattr(fbcrawl.pipelines, 'reactor', fake_reactor)
+    pipeline = ReorderPipeline.from_crawler(get_crawler(settings_dict={'REORDER_MAX_PENDING': 3,
+                                                                       'REORDER_TIMEOUT': 60}))
+    pipeline.clock = clock
+    pipeline.reactor = fake_reactor
+    pipeline.out = []
+    return pipeline
+
+
+def push(pipeline, seq):
+    item = FbcrawlItem(url='/story.php?story_fbid={}&id=2'.format(seq), seq=seq)
+    result = pipeline.process_item(item, None)
+    if isinstance(result, defer.Deferred):
+        result.addCallback(lambda item: pipeline.out.append(item['seq']))
+    else:
+        pipeline.out.append(item['seq'])
+
+
+def test_reorder_releases_in_discovery_order(reorder):
+    for seq in (2, 0, 3, 1):
+        push(reorder, seq)
+    #not inside process_item, on the next reactor turn
+    assert reorder.out == []
+    reorder.reactor.advance(0)
+    assert reorder.out == [0, 1, 2, 3]
+    assert not reorder.waiting
+
+
+def test_reorder_skips_a_gap_after_the_timeout(reorder):
+    push(reorder, 1)
+    push(reorder, 2)
+    reorder.reactor.advance(0)
+    reorder.check()
+    assert reorder.out == []
+    reorder.clock.now += 61
+    reorder.check()
+    assert reorder.out == [1, 2]
+    assert reorder.crawler.stats.get_value('reorder/skipped') == 1
+    #the missing post shows up after all
+    push(reorder, 0)
+    assert reorder.out == [1, 2, 0]
+    assert reorder.crawler.stats.get_value('reorder/late') == 1
+
+
+def test_reorder_skips_a_dropped_request(reorder):
+    push(reorder, 1)
+    reorder.request_dropped(Request('https://mbasic.facebook.com/story.php', meta={'seq': 0}), None)
+    reorder.reactor.advance(0)
+    assert reorder.out == [1]
+    assert reorder.crawler.stats.get_value('reorder/skipped') is None
+
+
+def test_reorder_bounds_the_waiting_items(reorder):
+    for seq in (1, 2, 3):
+        push(reorder, seq)
+    reorder.reactor.advance(0)
+    assert reorder.out == []
+    #one more than REORDER_MAX_PENDING: the gap before them is given up
+    push(reorder, 4)
+    reorder.reactor.advance(0)
+    assert reorder.out == [1, 2, 3, 4]
+    assert reorder.crawler.stats.get_value('reorder/skipped') == 1
+
+
+def test_reorder_resumes_from_the_saved_seq(reorder):
+    reorder.spider_opened(Spider('fb', seq=10))
+    push(reorder, 11)
+    push(reorder, 10)
+    #queued by the previous run, already past
+    push(reorder, 4)
+    reorder.reactor.advance(0)
+    assert reorder.out == [4, 10, 11]
+    assert reorder.crawler.stats.get_value('reorder/late') == 1
@@ -0,0 +1,146 @@
+import os
+import re
+import sys
+import sqlite3
+import threading
+import subprocess
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+#3 timeline pages of 12 posts
+POSTS = 36
+
+CRAWL = '''
+import sys
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+
+class Spider(FacebookSpider):
+    name = 'fb'
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.start_urls = [sys.argv[1]]
+    def parse(self, response):
+        #no login on the fixture server
+        return self.parse_home(response)
+
+settings = get_project_settings()
+settings.setdict({'LOG_LEVEL': 'WARNING', 'TELNETCONSOLE_ENABLED': False,
+                  'SQLITE_BATCH_SIZE': 1, 'STATE_SNAPSHOT_INTERVAL': 0.2,
+                  'FRONTIER_FLUSH_INTERVAL': 0.1}, priority='cmdline')
+for arg in sys.argv[2:]:
+    name, value = arg.split('=', 1)
+    settings.set(name, value, priority='cmdline')
+process = CrawlerProcess(settings)
+process.crawl(Spider, email='x', password='y', page='testpage', lang='en')
+process.start()
+'''
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+class Site(BaseHTTPRequestHandler):
+    '''
+    Timeline of 3 pages, the last one is served once gate is set
+    '''
+    gate = None
+    waiting = 0
+
+    def do_GET(self):
+        path = self.path
+        if path.startswith('/story.php'):
+            post = re.search(r'story_fbid=(\d+)', path).group(1).encode()
+            body = fixture('fb_post.html').replace(b'ft_ent_identifier=1000000', b'ft_ent_identifier=' + post)
+        elif path.startswith('/ufi/reaction'):
+            body = fixture('fb_reactions.html')
+        else:
+            match = re.search(r'page=(\d+)', path)
+            page = int(match.group(1)) if match else 1
+            if page == 3:
+                Site.waiting += 1
+                self.gate.wait(60)
+            if page > 3:
+                body = b'<html><body></body></html>'
+            else:
+                body = fixture('fb_page.html').replace(b'page=2', b'page=%d' % (page + 1))
+                body = re.sub(rb'story_fbid=(\d+)', lambda m: b'story_fbid=%d' % (int(m.group(1)) + page * 1000),
+                              body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    Site.gate = threading.Event()
+    Site.waiting = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Site)
+    server.daemon_threads = True
+    #the pages in progress when the crawl is killed
+    server.handle_error = lambda request, address: None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/'.format(server.server_port)
+    Site.gate.set()
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(tmp_path, url, *settings):
+    script = tmp_path / 'crawl.py'
+    script.write_text(CRAWL)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.Popen([sys.executable, '-W', 'ignore', str(script), url,
+                             'JOBDIR=' + str(tmp_path / 'job'), 'SQLITE_PATH=' + str(tmp_path / 'fb.db')]
+                            + list(settings), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def posts(tmp_path):
+    try:
+        db = sqlite3.connect(str(tmp_path / 'fb.db'))
+        try:
+            return db.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return 0
+
+
+def wait(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.1)
+
+
+@pytest.mark.parametrize('frontier', [True, False], ids=['frontier', 'queues'])
+def test_crashed_job_resumes_the_lost_requests(tmp_path, site, frontier):
+    option = 'FRONTIER_JOBDIR={}'.format(frontier)
+    state = tmp_path / 'job' / 'spider.state'
+    first = crawl(tmp_path, site, option)
+    try:
+        #the first 2 pages are done, the last one is in progress
+        wait(lambda: Site.waiting and posts(tmp_path) == 2 * POSTS // 3 and (state.exists() or not frontier))
+        #the progress is saved mid-run only with requests that survive the crash
+        assert state.exists() == frontier
+    finally:
+        first.kill()
+        first.wait()
+    Site.gate.set()
+    second = crawl(tmp_path, site, option)
+    assert second.wait(120) == 0
+    assert posts(tmp_path) == POSTS
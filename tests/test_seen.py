@@ -0,0 +1,70 @@
+import sqlite3
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+import fbcrawl.seen
+from benchmarks.replay import BASE_URL, load_fixture, make_spider, replay
+from fbcrawl.seen import SeenIndex
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+
+PAGE = BASE_URL + '/testpage'
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+def timeline(spider, body):
+    request = Request(PAGE, meta={'flag': spider.k})
+    return replay(spider.parse_page, HtmlResponse(PAGE, body=body, encoding='utf-8', request=request))[1]
+
+
+def test_index_survives_a_reopen(tmp_path):
+    path = str(tmp_path / 'seen.db')
+    index = SeenIndex(path, commit_every=2)
+    index.add('/story.php?story_fbid=1&id=2', reactions=['19,298'], comments='1481')
+    index.add('/story.php?story_fbid=1&id=2', reactions=20000, comments=None)
+    index.touch('/story.php?story_fbid=3&id=2', comments=4)
+    index.close()
+    index = SeenIndex(path)
+    assert len(index) == 1 and '/story.php?story_fbid=1&id=2' in index
+    index.close()
+
+
+def test_second_run_skips_the_known_posts(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fbcrawl.seen, 'time', clock)
+    path = str(tmp_path / 'seen.db')
+    spider = make_spider(FacebookSpider, incremental=path)
+    requests = timeline(spider, load_fixture('fb_page.html'))
+    posts = [request for request in requests if request.callback == spider.parse_post]
+    assert len(posts) == 12
+    for request in posts:
+        spider.emit_item(request.meta['item'])
+    spider.closed('finished')
+
+    #a day later: 2 new posts on top, one more comment on a known one
+    clock.now += 86400
+    body = load_fixture('fb_page.html').replace(b'story_fbid=1000000', b'story_fbid=1000900') \
+                                       .replace(b'story_fbid=1000017', b'story_fbid=1000917') \
+                                       .replace(b'>2 Comments<', b'>3 Comments<')
+    spider = make_spider(FacebookSpider, incremental=path)
+    assert len(spider.seen) == 12
+    requests = timeline(spider, body)
+    #10 known posts in a row: no next page
+    assert [request.url.split('&')[0] for request in requests] == [
+        BASE_URL + '/story.php?story_fbid=1000900', BASE_URL + '/story.php?story_fbid=1000917']
+    spider.closed('finished')
+
+    db = sqlite3.connect(path)
+    rows = dict(((key, (first, last, comments)) for key, first, last, comments in
+                 db.execute('SELECT key, first_seen, last_seen, comments FROM posts')))
+    db.close()
+    assert len(rows) == 12
+    assert rows['/story.php?story_fbid=1000051&id=123456'] == (1000000.0, 1086400.0, '3')
+    assert rows['/story.php?story_fbid=1000034&id=123456'] == (1000000.0, 1086400.0, '2940')
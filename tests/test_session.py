@@ -0,0 +1,91 @@
+import os
+import stat
+
+from scrapy import FormRequest
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+import fbcrawl.session
+from benchmarks.replay import make_spider
+from fbcrawl.session import SessionStore
+from fbcrawl.spiders.fbcrawl import FacebookSpider
+
+HOME = 'https://mbasic.facebook.com/'
+COOKIES = [{'name': 'c_user', 'value': '42', 'domain': '.facebook.com', 'path': '/',
+            'secure': True, 'expires': None}]
+LOGIN = b'<html><body><form method="post" action="/login/device-based/regular/login/">' \
+        b'<input name="email"/><input name="pass" type="password"/></form></body></html>'
+LOGGED_IN = b'<html><body><input placeholder="Search Facebook"/></body></html>'
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+def test_session_is_saved_for_the_owner_only(tmp_path):
+    store = SessionStore(str(tmp_path / 'session.json'))
+    store.save('bench@example.com', 'it', COOKIES)
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+    assert not os.path.exists(store.path + '.tmp')
+    session = store.load('bench@example.com')
+    assert (session['lang'], session['cookies']) == ('it', COOKIES)
+    #the session of another account is not used
+    assert store.load('other@example.com') is None
+    store.clear()
+    assert store.load('bench@example.com') is None
+
+
+def test_session_expires(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fbcrawl.session, 'time', clock)
+    store = SessionStore(str(tmp_path / 'session.json'), max_age=3600)
+    store.save('bench@example.com', 'en', COOKIES)
+    clock.now += 3600
+    assert store.load('bench@example.com') is not None
+    clock.now += 1
+    assert store.load('bench@example.com') is None
+    #a damaged file is a missing session
+    with open(store.path, 'w') as f:
+        f.write('{"email": "bench@')
+    assert store.load('bench@example.com') is None
+
+
+def response(body, request):
+    return HtmlResponse(request.url, body=body, encoding='utf-8', request=request)
+
+
+def test_saved_session_skips_the_login(tmp_path):
+    path = str(tmp_path / 'session.json')
+    SessionStore(path).save('bench@example.com', 'it', COOKIES)
+    spider = make_spider(FacebookSpider, session=path)
+    #no -a lang: the one of the session
+    spider.lang = '_'
+    [request] = spider.start_requests()
+    assert request.callback == spider.parse_session and request.cookies == COOKIES
+    assert spider.lang == 'it'
+    [page] = spider.parse_session(response(LOGGED_IN, request))
+    assert page.url == HOME + 'testpage' and page.callback == spider.parse_page
+
+
+def test_expired_session_logs_in_again(tmp_path):
+    path = str(tmp_path / 'session.json')
+    SessionStore(path).save('bench@example.com', 'en', COOKIES)
+    spider = make_spider(FacebookSpider, session=path)
+    [request] = spider.start_requests()
+    login = spider.parse_session(response(LOGIN, request))
+    assert isinstance(login, FormRequest) and login.callback == spider.parse_home
+    assert not os.path.exists(path)
+    #no saved session: straight to the login page
+    [request] = make_spider(FacebookSpider, session=path).start_requests()
+    assert request.url == HOME.rstrip('/') and request.callback is None
+
+
+def test_resumed_job_keeps_its_session(tmp_path):
+    crawler = get_crawler(settings_dict={'JOBDIR': str(tmp_path)})
+    spider = FacebookSpider.from_crawler(crawler, email='bench@example.com', password='bench',
+                                         page='testpage', lang='en')
+    assert spider.session.path == str(tmp_path / 'session.json')
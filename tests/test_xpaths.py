@@ -0,0 +1,38 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lxml import etree
+
+from fbcrawl.xpaths import XPathRegistry
+
+DOC = etree.HTML('<html><body>' + '<div><a href="/p">post</a></div>' * 10 + '</body></html>')
+
+
+def test_counters_and_reset():
+    registry = XPathRegistry({'links': '//a/@href', 'has_links': 'boolean(//a)'})
+    assert registry['links'](DOC) == ['/p'] * 10
+    assert registry['has_links'](DOC) == [True]
+    stats = registry.stats()
+    assert stats['links']['calls'] == 1 and stats['links']['matches'] == 10
+    assert stats['has_links']['calls'] == 1
+    registry.reset()
+    assert registry.stats() == {}
+
+
+def test_threads_use_their_own_xpath_and_count_exactly():
+    registry = XPathRegistry({'links': '//a/@href'})
+    xp = registry['links']
+    compiled = set()
+    barrier = threading.Barrier(8)
+
+    def work(_):
+        barrier.wait()
+        for _ in range(500):
+            xp(DOC)
+        return id(xp._compiled()[0])
+
+    with ThreadPoolExecutor(8) as pool:
+        compiled.update(pool.map(work, range(8)))
+    assert len(compiled) == 8
+    assert xp.calls == 8 * 500
+    assert xp.matches == 8 * 500 * 10